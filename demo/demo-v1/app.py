@@ -1,19 +1,17 @@
 import streamlit as st
 import streamlit.components.v1
-from langchain_aws import ChatBedrock
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
-import boto3
+from langchain_core.messages import HumanMessage, AIMessage
 import uuid
 import os
 import time
 from datetime import datetime
 import json
 import logging
-from typing import Literal
+from typing import Literal, get_args
 from pydantic import BaseModel, Field
 
 # Local imports
-from utils import cognito_auth, data_export, s3_storage
+from utils import bedrock_pool, cognito_auth, context_window, data_export, llm_admission, llm_metrics, prompt_cache, response_stream, s3_storage, storage_metrics
 
 # Constants
 ICON_PATH = os.path.join(os.path.dirname(__file__), "figs", "icon.jpg")
@@ -112,6 +110,31 @@ def extract_emotion_from_response(ai_response):
 
     return 'default', ai_response
 
+
+def restore_stored_messages(stored_messages):
+    """Convert stored conversation messages back into session form.
+
+    Returns:
+        tuple[list, list]: (LangChain messages, message_log entries for export)
+    """
+    messages = []
+    for msg in stored_messages:
+        role = msg.get("role")
+        content = msg.get("content", "")
+        if role == "user":
+            messages.append(HumanMessage(content=content, id=msg.get("message_id")))
+        elif role == "assistant":
+            stored_emotion = msg.get("metadata", {}).get("emotion", "default")
+            messages.append(
+                AIMessage(
+                    content=content,
+                    additional_kwargs={"emotion": stored_emotion},
+                    id=msg.get("message_id"),
+                )
+            )
+    # Rebuild message_log for export compatibility
+    return messages, data_export.build_message_log(stored_messages)
+
 # Cache for secrets to avoid repeated access
 _secrets_cache = None
 
@@ -131,11 +154,18 @@ def initialize_session_state():
         "show_export_consent": False,
         "consent_signed": False,
         "data_privacy_acknowledged": False,
-        "chat_model": None,
-        "chat_model_config": None,
         "default_system_prompt": None,
         "current_conversation_id": None,
+        # Resumed conversations load only their latest messages; this points
+        # at the older ones, and context_start at where the LLM context begins
+        "earlier_messages_cursor": None,
+        "context_start": 0,
+        # Rolling summary of the messages left out of the LLM context, and
+        # the (conversation_id, Future) of a summary being generated
+        "context_summary": None,
+        "summary_future": None,
         "conversation_history": [],
+        "conversation_history_cursor": None,
         "s3_user_info_loaded": False
     }
     for key, default_value in defaults.items():
@@ -145,6 +175,9 @@ def initialize_session_state():
     # Initialize Auth State
     cognito_auth.init_auth_state()
 
+# Storage and Bedrock time spent by this rerun (shown in the admin debug panel)
+rerun_metrics = storage_metrics.start_rerun()
+
 # Initialize session state
 initialize_session_state()
 
@@ -280,6 +313,35 @@ st.divider()
 # Get secrets
 secrets = get_secrets()
 
+# Process-wide admission control for model calls (concurrency cap, per-user
+# rate limits and a fair queue)
+admission = llm_admission.get_controller(secrets)
+
+
+def llm_stats():
+    """Model admission queue stats (exported as archpal_llm_admission_* gauges)"""
+    return {"admission": admission.stats()}
+
+
+def admission_status(position):
+    """Placeholder text while a reply waits in the admission queue (0 once admitted)"""
+    if position == 0:
+        return "_ArchPal is thinking..._"
+    if position == 1:
+        return "_ArchPal is busy helping other students. You're next in line..._"
+    return f"_ArchPal is busy helping other students. You're #{position} in line..._"
+
+
+# Export process-wide metrics (once per process) if configured
+storage_metrics.start_exporter(
+    textfile=secrets.get("metrics_textfile"),
+    port=secrets.get("metrics_port"),
+    interval=float(secrets.get("metrics_interval_seconds", storage_metrics.DEFAULT_EXPORT_INTERVAL)),
+    extra_stats=s3_storage.get_storage_stats,
+    host=secrets.get("metrics_host", storage_metrics.DEFAULT_EXPORT_HOST),
+    llm_stats=llm_stats
+)
+
 # Use default system prompt
 system_prompt = default_system_prompt_full
 
@@ -318,7 +380,16 @@ with st.sidebar:
     if st.session_state.get("authenticated"):
         auth_email = st.session_state.get("auth_user", {}).get("email", "User")
         st.write(f"Logged in as: **{auth_email}**")
+        # Turns the background writer could not save yet (it keeps retrying)
+        unsaved_turns = s3_storage.get_unsaved_turns(cognito_user_id) if cognito_user_id else 0
+        if unsaved_turns:
+            st.warning(
+                f"{unsaved_turns} of your recent message{'s' if unsaved_turns != 1 else ''} "
+                "could not be saved yet. ArchPal keeps retrying; please keep this tab open for now."
+            )
         if st.button("Logout", type="primary", use_container_width=True):
+            # Make sure queued conversation writes reach S3 before leaving
+            s3_storage.flush_pending_writes()
             cognito_auth.logout()
 
     st.divider()
@@ -336,10 +407,18 @@ with st.sidebar:
         else:
             # Show loading spinner during export
             with st.spinner("📤 Generating your PDF..."):
+                message_log = st.session_state["message_log"]
+                # A resumed conversation may only be partly loaded; export all of it
+                if st.session_state.get("earlier_messages_cursor") and cognito_user_id:
+                    conversation_data = s3_storage.get_conversation(
+                        cognito_user_id, st.session_state["current_conversation_id"]
+                    )
+                    if conversation_data:
+                        _, message_log = restore_stored_messages(conversation_data.get("messages", []))
                 # Use the utility function for export
                 export_success = data_export.handle_export(
                     st.session_state["student_info"],
-                    st.session_state["message_log"]
+                    message_log
                 )
                 
             # Show result message and download options
@@ -352,20 +431,73 @@ with st.sidebar:
 
     st.divider()
 
+    def refresh_conversation_history():
+        history, cursor = s3_storage.get_conversation_history_page(cognito_user_id, limit=5)
+        st.session_state["conversation_history"] = history
+        st.session_state["conversation_history_cursor"] = cursor
+
+    def format_conversation_date(conv_date):
+        # Format date for display (UTC)
+        try:
+            if conv_date:
+                date_obj = datetime.fromisoformat(conv_date.replace("Z", "+00:00"))
+                return date_obj.strftime("%b %d, %Y %I:%M %p") + " UTC"
+            return "Unknown date"
+        except (ValueError, TypeError):
+            return conv_date[:10] if conv_date else "Unknown"
+
+    def open_conversation(conv_id):
+        # Load the latest messages; earlier ones are fetched on demand
+        conversation_data = s3_storage.get_conversation_tail(cognito_user_id, conv_id)
+        if conversation_data:
+            messages, message_log = restore_stored_messages(conversation_data.get("messages", []))
+            st.session_state["messages"] = messages
+            st.session_state["message_log"] = message_log
+            st.session_state["current_conversation_id"] = conv_id
+            st.session_state["earlier_messages_cursor"] = conversation_data.get("earlier_cursor")
+            st.session_state["context_start"] = 0
+            st.session_state["context_summary"] = conversation_data.get("context_summary")
+            st.session_state["summary_future"] = None
+            st.rerun()
+
     # Load conversation history from S3
     if cognito_user_id and not st.session_state.get("conversation_history"):
-        st.session_state["conversation_history"] = s3_storage.get_conversation_history(cognito_user_id, limit=5)
+        refresh_conversation_history()
     
     # New Conversation button
     if st.button("➕ New Conversation", use_container_width=True, type="primary"):
         st.session_state["messages"] = []
         st.session_state["message_log"] = []
         st.session_state["current_conversation_id"] = None
+        st.session_state["earlier_messages_cursor"] = None
+        st.session_state["context_start"] = 0
+        st.session_state["context_summary"] = None
+        st.session_state["summary_future"] = None
         # Refresh conversation history from S3
         if cognito_user_id:
-            st.session_state["conversation_history"] = s3_storage.get_conversation_history(cognito_user_id, limit=5)
+            refresh_conversation_history()
         st.rerun()
 
+    # Search all conversations, not just the ones listed below
+    if cognito_user_id:
+        search_query = st.text_input(
+            "Search conversations",
+            key="conversation_search",
+            placeholder="🔍 Search your conversations",
+            label_visibility="collapsed",
+        )
+        if search_query.strip():
+            results, complete = s3_storage.search_conversations(cognito_user_id, search_query)
+            for result in results:
+                conv_id = result["conversation_id"]
+                button_label = f"{result['title'] or 'Untitled Conversation'}\n{format_conversation_date(result['last_updated'])}"
+                if st.button(button_label, key=f"search_{conv_id}", use_container_width=True):
+                    open_conversation(conv_id)
+            if not results:
+                st.caption("No matching conversations.")
+            if not complete:
+                st.caption("Older conversations are still being indexed; search again in a moment.")
+
     # Display conversation history
     st.markdown("### 💬 Conversation History")
     conversation_history = st.session_state.get("conversation_history", [])
@@ -375,57 +507,14 @@ with st.sidebar:
             conv_id = conv.get("conversation_id")
             conv_title = conv.get("title", "Untitled Conversation")
             conv_date = conv.get("last_updated", conv.get("created_at", ""))
-            # Format date for display (UTC)
-            try:
-                if conv_date:
-                    date_obj = datetime.fromisoformat(conv_date.replace("Z", "+00:00"))
-                    formatted_date = date_obj.strftime("%b %d, %Y %I:%M %p") + " UTC"
-                else:
-                    formatted_date = "Unknown date"
-            except (ValueError, TypeError):
-                formatted_date = conv_date[:10] if conv_date else "Unknown"
+            formatted_date = format_conversation_date(conv_date)
 
             is_active = st.session_state.get("current_conversation_id") == conv_id
             
             # Load button
             button_label = f"{conv_title}\n{formatted_date}"
             if st.button(button_label, key=f"conv_{conv_id}", use_container_width=True, type="primary" if is_active else "secondary"):
-                # Load conversation
-                conversation_data = s3_storage.get_conversation(cognito_user_id, conv_id)
-                if conversation_data:
-                    # Restore messages
-                    st.session_state["messages"] = []
-                    st.session_state["message_log"] = []
-                    st.session_state["current_conversation_id"] = conv_id
-                    
-                    # Convert stored messages to LangChain format
-                    for msg in conversation_data.get("messages", []):
-                        role = msg.get("role")
-                        content = msg.get("content", "")
-                        if role == "user":
-                            st.session_state["messages"].append(HumanMessage(content=content))
-                            # Rebuild message_log for export compatibility
-                            if len(st.session_state["messages"]) > 0:
-                                # Find corresponding AI message
-                                msg_idx = msg.get("metadata", {}).get("message_index", 0)
-                                if msg_idx + 1 < len(conversation_data.get("messages", [])):
-                                    ai_msg = conversation_data["messages"][msg_idx + 1]
-                                    st.session_state["message_log"].append({
-                                        "userMessage": content,
-                                        "userMessageTime": msg.get("timestamp", ""),
-                                        "AIMessage": ai_msg.get("content", ""),
-                                        "AIMessageTime": ai_msg.get("timestamp", "")
-                                    })
-                        elif role == "assistant":
-                            stored_emotion = msg.get("metadata", {}).get("emotion", "default")
-                            st.session_state["messages"].append(
-                                AIMessage(
-                                    content=content,
-                                    additional_kwargs={"emotion": stored_emotion},
-                                )
-                            )
-                    
-                    st.rerun()
+                open_conversation(conv_id)
 
             # Rename control for the active conversation
             if is_active:
@@ -438,11 +527,41 @@ with st.sidebar:
                 )
                 if new_title != conv_title:
                     if s3_storage.update_conversation_title(cognito_user_id, conv_id, new_title):
-                        st.session_state["conversation_history"] = s3_storage.get_conversation_history(cognito_user_id, limit=5)
+                        refresh_conversation_history()
                         st.rerun()
+
+        # Older conversations are fetched a page at a time
+        if st.session_state.get("conversation_history_cursor"):
+            if st.button("Load more", use_container_width=True):
+                more, cursor = s3_storage.get_conversation_history_page(
+                    cognito_user_id, limit=5, cursor=st.session_state["conversation_history_cursor"]
+                )
+                shown = {conv.get("conversation_id") for conv in conversation_history}
+                st.session_state["conversation_history"] = conversation_history + [
+                    conv for conv in more if conv.get("conversation_id") not in shown
+                ]
+                st.session_state["conversation_history_cursor"] = cursor
+                st.rerun()
     else:
         st.info("No previous conversations. Start chatting to create your first conversation!")
 
+# Earlier messages of a resumed conversation
+if st.session_state.get("earlier_messages_cursor") and cognito_user_id:
+    if st.button("Load earlier messages"):
+        earlier = s3_storage.get_conversation_tail(
+            cognito_user_id,
+            st.session_state["current_conversation_id"],
+            before=st.session_state["earlier_messages_cursor"]
+        )
+        if earlier:
+            messages, message_log = restore_stored_messages(earlier.get("messages", []))
+            st.session_state["messages"] = messages + st.session_state["messages"]
+            st.session_state["message_log"] = message_log + st.session_state["message_log"]
+            # Earlier messages are shown, but the LLM context stays on the tail
+            st.session_state["context_start"] += len(messages)
+            st.session_state["earlier_messages_cursor"] = earlier.get("earlier_cursor")
+        st.rerun()
+
 # Display chat messages
 if "messages" in st.session_state:
     for message in st.session_state.messages:
@@ -483,78 +602,115 @@ if prompt := st.chat_input():
 
     # Add user message to session state with timestamp
     user_timestamp = datetime.now()
-    user_message = HumanMessage(content=prompt)
+    user_message = HumanMessage(content=prompt, id=str(uuid.uuid4()))
     st.session_state.messages.append(user_message)
 
     st.chat_message("user").write(prompt)
 
-    # Get or create cached Claude chat model via AWS Bedrock
-    secrets = get_secrets()
-    
-    # Create Bedrock client with AWS credentials
-    bedrock_client = boto3.client(
-        service_name='bedrock-runtime',
-        region_name=secrets.get('aws_region', 'us-east-1'),
-        aws_access_key_id=secrets.get('aws_access_key_id'),
-        aws_secret_access_key=secrets.get('aws_secret_access_key')
+    # Shared Claude chat model via AWS Bedrock (one client and model per process and config)
+    chat = bedrock_pool.get_chat_model(secrets)
+
+    # Stream the reply into the chat as it is generated if anthropic_streaming is
+    # enabled; by default the whole structured response is awaited
+    streaming = str(secrets.get("anthropic_streaming", False)).lower() in ("true", "1", "yes")
+    turn_system_prompt = system_prompt
+    if streaming:
+        # The emotion arrives as a leading tag instead of a structured field
+        turn_system_prompt += "\n\n" + response_stream.emotion_tag_instructions(get_args(VALID_EMOTIONS))
+
+    # Pick up a summary generated in the background since the last turn
+    pending_summary = st.session_state.get("summary_future")
+    if pending_summary and pending_summary[1].done():
+        st.session_state["summary_future"] = None
+        # A job that raised produced no summary, like one that returned None
+        new_summary = None if pending_summary[1].exception() else pending_summary[1].result()
+        if pending_summary[0] == st.session_state.get("current_conversation_id") and new_summary:
+            st.session_state["context_summary"] = new_summary
+
+    # Prepare messages for LangChain: system prompt and summary, then the
+    # recent messages that fit in the context budget, with prompt cache
+    # breakpoints on the system prompt and the newest message
+    context_summary = st.session_state.get("context_summary")
+    context_plan = context_window.plan_context(
+        st.session_state.messages,
+        context_window.estimate_tokens(turn_system_prompt),
+        summary=context_summary,
+        budget=int(secrets.get("context_budget_tokens", context_window.DEFAULT_CONTEXT_BUDGET_TOKENS)),
+        start=st.session_state["context_start"]
     )
-    
-    model_config = {
-        "model_id": secrets.get("anthropic_model"),
-        "region_name": secrets.get('aws_region', 'us-east-1'),
-        "temperature": secrets.get("anthropic_temperature"),
-        "max_tokens": secrets.get("anthropic_max_tokens")
-    }
-    
-    # Check if model needs to be recreated (config changed or doesn't exist)
-    cached_config = st.session_state["chat_model_config"]
-    config_changed = (
-        cached_config is None or
-        cached_config.get("model_id") != model_config["model_id"] or
-        cached_config.get("region_name") != model_config["region_name"] or
-        cached_config.get("temperature") != model_config["temperature"] or
-        cached_config.get("max_tokens") != model_config["max_tokens"]
+    langchain_messages = prompt_cache.build_messages(
+        turn_system_prompt,
+        st.session_state.messages[context_plan.start:],
+        summary_text=context_window.summary_text(context_summary),
+        enabled=str(secrets.get("anthropic_prompt_caching", True)).lower() in ("true", "1", "yes")
     )
-    
-    if st.session_state["chat_model"] is None or config_changed:
-        st.session_state["chat_model"] = ChatBedrock(
-            client=bedrock_client,
-            model_id=model_config["model_id"],
-            model_kwargs={
-                "temperature": model_config["temperature"],
-                "max_tokens": model_config["max_tokens"]
-            }
-        )
-        st.session_state["chat_model_config"] = model_config.copy()
-    
-    chat = st.session_state["chat_model"]
 
-    # Prepare messages for LangChain (system prompt + conversation history)
-    langchain_messages = [SystemMessage(content=system_prompt)]
-    langchain_messages.extend(st.session_state.messages)
-
-    # Get response from Claude using structured output
-    structured_chat = chat.with_structured_output(ArchPalResponse)
+    # Rate limits apply per student
+    admission_user = cognito_user_id or str(id(st.session_state))
 
     try:
-        with st.spinner("ArchPal is thinking..."):
+        # Model calls go through the admission queue, which shows the queue
+        # position while waiting and retries calls Bedrock throttles
+        if streaming:
+            with st.chat_message("assistant", avatar=ICON_PATH):
+                col1, col2 = st.columns([4, 1])
+                text_placeholder = col1.empty()
+                emotion_placeholder = col2.empty()
+                text_placeholder.markdown(admission_status(0))
+
+                def stream_reply():
+                    reply = response_stream.ReplyStream(chat, langchain_messages, get_args(VALID_EMOTIONS))
+                    emotion_shown = False
+                    for _ in reply:
+                        # Show the avatar as soon as the emotion tag has been read
+                        if not emotion_shown and reply.emotion is not None:
+                            emotion_img_bytes = load_emotion_image(reply.emotion)
+                            if emotion_img_bytes:
+                                emotion_placeholder.image(emotion_img_bytes, width=EMOTION_DISPLAY_WIDTH)
+                            emotion_shown = True
+                        text_placeholder.markdown(reply.text + "▌")
+                    text_placeholder.markdown(reply.text)
+                    if not emotion_shown:
+                        emotion_img_bytes = load_emotion_image(reply.emotion)
+                        if emotion_img_bytes:
+                            emotion_placeholder.image(emotion_img_bytes, width=EMOTION_DISPLAY_WIDTH)
+                    return reply
+
+                reply = admission.call(
+                    admission_user, stream_reply,
+                    on_wait=lambda position: text_placeholder.markdown(admission_status(position))
+                )
+            emotion = reply.emotion
+            clean_text = reply.text
+            parse_outcome = reply.parser.outcome
+        else:
+            # Get response from Claude using structured output. A reply that does
+            # not validate is parsed as far as possible instead of asking again.
+            structured_chat = bedrock_pool.get_structured_chat(secrets, ArchPalResponse)
+
+            def invoke_structured():
+                with llm_metrics.measure("invoke_structured"):
+                    structured_result = structured_chat.invoke(langchain_messages)
+                    prompt_cache.record_usage(prompt_cache.usage_from(structured_result["raw"]))
+                    parsed = response_stream.parse_reply(structured_result, get_args(VALID_EMOTIONS))
+                    llm_metrics.record_response(parsed[2])
+                return parsed
+
+            status_placeholder = st.empty()
+            status_placeholder.markdown(admission_status(0))
             try:
-                structured_response = structured_chat.invoke(langchain_messages)
-                emotion = structured_response.emotion
-                clean_text = structured_response.response_text
-            except Exception as structured_error:
-                logger.warning(
-                    "Structured output failed, falling back to unstructured: %s",
-                    structured_error,
+                emotion, clean_text, parse_outcome = admission.call(
+                    admission_user, invoke_structured,
+                    on_wait=lambda position: status_placeholder.markdown(admission_status(position))
                 )
-                raw_response = chat.invoke(langchain_messages)
-                emotion = "default"
-                clean_text = raw_response.content
+            finally:
+                status_placeholder.empty()
 
         # Store clean text with emotion in additional_kwargs for display
         ai_message = AIMessage(
             content=clean_text,
             additional_kwargs={"emotion": emotion},
+            id=str(uuid.uuid4()),
         )
         st.session_state.messages.append(ai_message)
 
@@ -563,72 +719,105 @@ if prompt := st.chat_input():
         st.session_state.message_log.append({
             "userMessage": prompt,
             "userMessageTime": user_timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            "AIMessage": clean_text,
+            # A stand-in for an empty reply is not exported as the tutor's words
+            "AIMessage": "" if response_stream.is_empty_reply(clean_text, parse_outcome) else clean_text,
             "AIMessageTime": ai_timestamp.strftime("%Y-%m-%d %H:%M:%S")
         })
 
-        # Step 2.5: Save to S3
+        # Step 2.5: Queue the turn for S3 (written in the background)
         if cognito_user_id:
             # Get or create conversation ID
             conversation_id = st.session_state.get("current_conversation_id")
-            if not conversation_id:
+            is_new_conversation = not conversation_id
+            if is_new_conversation:
                 conversation_id = str(uuid.uuid4())
                 st.session_state["current_conversation_id"] = conversation_id
-                
-                # Default title: UTC timestamp
-                conv_title = datetime.utcnow().strftime("%b %d, %Y %I:%M %p") + " UTC"
-                
-                # Add to conversation history
-                s3_storage.add_conversation_to_history(cognito_user_id, conversation_id, title=conv_title)
-                # Refresh conversation history
-                st.session_state["conversation_history"] = s3_storage.get_conversation_history(cognito_user_id, limit=5)
-            
-            # Append user message
-            s3_storage.append_message_to_conversation(
-                cognito_user_id,
-                conversation_id,
-                "user",
-                prompt,
-                metadata={"course_number": course_number}
-            )
-            
-            # Append AI message with clean text and emotion metadata
-            s3_storage.append_message_to_conversation(
+
+            updated_history = s3_storage.enqueue_turn(
                 cognito_user_id,
                 conversation_id,
-                "assistant",
-                clean_text,
+                user_msg={
+                    "content": prompt,
+                    "metadata": {"course_number": course_number},
+                    "message_id": user_message.id,
+                },
+                ai_msg={
+                    "content": clean_text,
+                    "message_id": ai_message.id,
+                    "metadata": {
+                        "model": secrets.get("anthropic_model", "unknown"),
+                        "course_number": course_number,
+                        "emotion": emotion,
+                        "parse": parse_outcome,
+                    },
+                },
+                # Student info is recorded with the first turn only
                 metadata={
-                    "model": secrets.get("anthropic_model", "unknown"),
-                    "course_number": course_number,
-                    "emotion": emotion,
-                }
-            )
-            
-            # Refresh conversation history to update last_updated time in sidebar
-            st.session_state["conversation_history"] = s3_storage.get_conversation_history(cognito_user_id, limit=5)
-            
-            # Update conversation metadata with student info
-            conversation_data = s3_storage.get_conversation(cognito_user_id, conversation_id)
-            if conversation_data and "metadata" not in conversation_data:
-                conversation_data["metadata"] = {
                     "unique_identifier": unique_id,
                     "college_year": college_year,
                     "major": major,
                     "course_number": course_number
-                }
-                s3_storage.save_conversation(cognito_user_id, conversation_id, conversation_data)
-
-        # Display AI response with emotion graphic
-        with st.chat_message("assistant", avatar=ICON_PATH):
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.write(clean_text)
-            with col2:
-                emotion_img_bytes = load_emotion_image(emotion)
-                if emotion_img_bytes:
-                    st.image(emotion_img_bytes, width=EMOTION_DISPLAY_WIDTH)
+                } if is_new_conversation else None,
+                # Default title: UTC timestamp
+                title=datetime.utcnow().strftime("%b %d, %Y %I:%M %p") + " UTC",
+                history=st.session_state.get("conversation_history"),
+                # Keep any older entries loaded with "Load more"
+                limit=max(5, len(st.session_state.get("conversation_history") or []) + 1),
+            )
+            # The queued turn is applied to the sidebar index locally, so no re-fetch is needed
+            if updated_history is not None:
+                st.session_state["conversation_history"] = updated_history
+
+        # Step 2.6: Fold older messages into the rolling summary in the background
+        if context_plan.summarize_through is not None:
+            conversation_id = st.session_state.get("current_conversation_id")
+            after_id = (context_summary or {}).get("through")
+            if after_id in {message.id for message in st.session_state.messages} or (
+                after_id is None and not st.session_state.get("earlier_messages_cursor")
+            ):
+                session_records = context_window.to_records(st.session_state.messages)
+
+                def load_records():
+                    return session_records
+            else:
+                # The summary ends before the loaded messages; read the stored conversation
+                def load_records(uid=cognito_user_id, cid=conversation_id):
+                    return (s3_storage.get_conversation(uid, cid) or {}).get("messages", [])
+
+            def persist_summary(summary, uid=cognito_user_id, cid=conversation_id):
+                if uid and cid:
+                    s3_storage.save_context_summary(uid, cid, summary)
+
+            future = context_window.submit_summary(
+                conversation_id or str(id(st.session_state)),
+                context_window.update_summary,
+                chat,
+                context_summary,
+                st.session_state.messages[context_plan.summarize_through].id,
+                load_records,
+                persist_summary,
+                admission
+            )
+            if future is not None:
+                st.session_state["summary_future"] = (conversation_id, future)
+
+        # Display AI response with emotion graphic (a streamed reply is already shown)
+        if not streaming:
+            with st.chat_message("assistant", avatar=ICON_PATH):
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.write(clean_text)
+                with col2:
+                    emotion_img_bytes = load_emotion_image(emotion)
+                    if emotion_img_bytes:
+                        st.image(emotion_img_bytes, width=EMOTION_DISPLAY_WIDTH)
 
+    except llm_admission.AdmissionRejected as e:
+        # Not answered (rate limited or too busy): drop the prompt from the
+        # conversation so the student can send it again
+        st.session_state.messages.remove(user_message)
+        st.warning(str(e))
+        st.stop()
     except Exception as e:
         st.error(f"Error: {str(e)}")
         st.stop()
@@ -669,4 +858,34 @@ if st.session_state.get("show_export_results", False):
     with st.expander("📄 Preview Conversation", expanded=True):
         st.markdown(markdown_content)
     
-    st.caption("💡 **Tip:** Click 'Download PDF' to save the file.")
\ No newline at end of file
+    st.caption("💡 **Tip:** Click 'Download PDF' to save the file.")
+
+# Admin-only debug panel: where this rerun's time went, and process-wide metrics
+if st.session_state.get("auth_user", {}).get("email") in secrets.get("admin_emails", []):
+    with st.sidebar:
+        st.divider()
+        with st.expander("🛠️ Storage Metrics"):
+            component_seconds = rerun_metrics.component_seconds
+            st.caption(
+                f"This rerun: storage {component_seconds.get('storage', 0.0):.3f}s, "
+                f"Bedrock {component_seconds.get('bedrock', 0.0):.3f}s "
+                f"of {rerun_metrics.elapsed:.3f}s"
+            )
+            st.dataframe(rerun_metrics.rows(), use_container_width=True)
+            st.markdown("**Since process start**")
+            st.dataframe(
+                [
+                    dict(component=component, operation=operation, **values)
+                    for (component, operation), values in storage_metrics.REGISTRY.snapshot().items()
+                ],
+                use_container_width=True
+            )
+            st.json(s3_storage.get_storage_stats(), expanded=False)
+            st.json(llm_stats(), expanded=False)
+            st.download_button(
+                "Download Prometheus metrics",
+                data=storage_metrics.render_prometheus(s3_storage.get_storage_stats, llm_stats),
+                file_name="archpal_metrics.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Storage Backend Benchmark for ArchPal
+
+Drives the real storage code paths (commit_turn, get_conversation,
+get_conversation_history) from concurrent simulated sessions against the
+in-memory, SQLite and local-filesystem backends, without an S3 bucket.
+
+Each session commits a number of chat turns to its own conversation and
+re-reads the conversation and sidebar history after every turn, like the app
+does on a rerun. Reported latencies are per operation across all sessions.
+
+Usage:
+    python benchmarks/storage_backend_benchmark.py [--backends memory sqlite local]
+        [--sessions 8] [--turns 20] [--users 4]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import s3_storage  # noqa: E402
+from utils.storage_backends import LocalFileBackend, MemoryBackend, SQLiteBackend  # noqa: E402
+
+
+def _timed(samples: list, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+def run_session(session: int, users: int, turns: int) -> dict:
+    user_id = f"bench-user-{session % users}"
+    conversation_id = f"bench-conversation-{session}"
+    samples = {"commit_turn": [], "get_conversation": [], "get_conversation_history": []}
+    for turn in range(turns):
+        _timed(
+            samples["commit_turn"], s3_storage.commit_turn, user_id, conversation_id,
+            {"content": f"Question {turn} from session {session}"},
+            {"content": "A coaching reply " * 40, "metadata": {"emotion": "smile"}},
+            title=f"Session {session}"
+        )
+        _timed(samples["get_conversation"], s3_storage.get_conversation, user_id, conversation_id)
+        _timed(samples["get_conversation_history"], s3_storage.get_conversation_history, user_id)
+    return samples
+
+
+def _percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["memory", "sqlite", "local"],
+                        choices=["memory", "sqlite", "local"])
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=20, help="Chat turns per session")
+    parser.add_argument("--users", type=int, default=4, help="Distinct users the sessions belong to")
+    args = parser.parse_args()
+
+    header = f"{'backend':>8} | {'operation':>24} | {'ops':>6} | {'mean ms':>8} | {'p50 ms':>8} | {'p95 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name in args.backends:
+        workdir = tempfile.mkdtemp(prefix="archpal-bench-")
+        try:
+            if name == "memory":
+                backend = MemoryBackend()
+            elif name == "sqlite":
+                backend = SQLiteBackend(os.path.join(workdir, "archpal.sqlite3"))
+            else:
+                backend = LocalFileBackend(os.path.join(workdir, "storage"))
+            s3_storage.configure_storage(backend)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+                results = list(pool.map(
+                    lambda session: run_session(session, args.users, args.turns), range(args.sessions)
+                ))
+            elapsed = time.perf_counter() - started
+
+            for operation in results[0]:
+                values = [v for result in results for v in result[operation]]
+                print(
+                    f"{name:>8} | {operation:>24} | {len(values):>6} | "
+                    f"{statistics.mean(values) * 1000:>8.3f} | {_percentile(values, 50) * 1000:>8.3f} | "
+                    f"{_percentile(values, 95) * 1000:>8.3f}"
+                )
+            stats = s3_storage.get_storage_stats()
+            print(
+                f"{name:>8} | {'total':>24} | {stats['requests']:>6} backend requests in {elapsed:.2f}s, "
+                f"{stats['write_conflicts']} write conflicts"
+            )
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Wire Format Benchmark for ArchPal Storage
+
+Compares the legacy storage format (pretty-printed JSON) with the compact
+format (minified JSON + gzip) on synthetic but realistic conversations:
+short student questions, pasted essay drafts, multi-paragraph coaching
+replies and the per-message metadata the app stores.
+
+For each conversation size it reports the stored object size and the time to
+encode and decode the full conversation object, plus the size of a single
+turn segment (what each chat turn actually uploads).
+
+Usage:
+    python benchmarks/wire_format_benchmark.py [--turns 10 50 200] [--repeat 20] [--gzip-level 6]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import storage_format  # noqa: E402
+
+WORDS = (
+    "the of and to in is that for it as with was on be by this are or his from at which "
+    "but have an they not had you were their one all we can her has there been if more when "
+    "will would who so no argument thesis paragraph evidence claim source analysis draft "
+    "revision structure introduction conclusion reader audience topic sentence transition "
+    "research citation quote paraphrase summary outline brainstorm idea support reasoning "
+    "counterargument rhetorical context purpose voice tone clarity concise specific example "
+    "architecture design history campus community student professor assignment rubric "
+    "feedback deadline semester course writing coach plan goal strategy reflect explain"
+).split()
+
+EMOTIONS = ["default", "smile", "point", "hello", "success", "dance", "sad"]
+
+
+def _prose(rng: random.Random, words: int) -> str:
+    sentences = []
+    remaining = words
+    while remaining > 0:
+        length = min(remaining, rng.randint(8, 24))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        remaining -= length
+    paragraphs = [" ".join(sentences[i:i + 5]) for i in range(0, len(sentences), 5)]
+    return "\n\n".join(paragraphs)
+
+
+def build_conversation(turns: int, seed: int = 0) -> dict:
+    """Build a conversation object shaped like the ones ArchPal stores"""
+    rng = random.Random(seed)
+    start = datetime(2025, 10, 1, 14, 0, 0)
+    messages = []
+    for turn in range(turns):
+        # Every few turns a student pastes a full draft for feedback
+        user_words = rng.randint(600, 1800) if rng.random() < 0.15 else rng.randint(10, 80)
+        timestamp = start + timedelta(minutes=3 * turn)
+        messages.append({
+            "message_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "role": "user",
+            "content": _prose(rng, user_words),
+            "timestamp": timestamp.isoformat() + "Z",
+            "metadata": {"course_number": "ENGL 1102", "message_index": 2 * turn}
+        })
+        messages.append({
+            "message_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "role": "assistant",
+            "content": _prose(rng, rng.randint(120, 450)),
+            "timestamp": (timestamp + timedelta(seconds=12)).isoformat() + "Z",
+            "metadata": {
+                "model": "anthropic.claude-3-5-sonnet-20240620-v1:0",
+                "course_number": "ENGL 1102",
+                "emotion": rng.choice(EMOTIONS),
+                "message_index": 2 * turn + 1
+            }
+        })
+    return {
+        "conversation_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "created_at": start.isoformat() + "Z",
+        "last_updated": messages[-1]["timestamp"],
+        "metadata": {
+            "unique_identifier": str(uuid.UUID(int=rng.getrandbits(128))),
+            "college_year": "First Year",
+            "major": "Architecture",
+            "course_number": "ENGL 1102"
+        },
+        "messages": messages
+    }
+
+
+def measure(data: dict, format_version: int, gzip_level: int, repeat: int) -> dict:
+    """Stored size plus best-of-N encode and decode times in milliseconds"""
+    body, put_args = storage_format.encode_json(data, format_version, gzip_level)
+
+    encode_times = []
+    decode_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        storage_format.encode_json(data, format_version, gzip_level)
+        encode_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        storage_format.decode_json(body, put_args["Metadata"])
+        decode_times.append(time.perf_counter() - started)
+
+    return {
+        "bytes": len(body),
+        "encode_ms": min(encode_times) * 1000,
+        "decode_ms": min(decode_times) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 10, 50, 200],
+                        help="Conversation lengths (user/assistant pairs) to benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions (best is reported)")
+    parser.add_argument("--gzip-level", type=int, default=storage_format.DEFAULT_GZIP_LEVEL)
+    args = parser.parse_args()
+
+    header = f"{'turns':>6} | {'format':>6} | {'bytes':>10} | {'ratio':>6} | {'encode ms':>9} | {'decode ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for turns in args.turns:
+        conversation = build_conversation(turns, seed=turns)
+        legacy = measure(conversation, storage_format.LEGACY_FORMAT, args.gzip_level, args.repeat)
+        for format_version in storage_format.SUPPORTED_FORMATS:
+            result = legacy if format_version == storage_format.LEGACY_FORMAT else measure(
+                conversation, format_version, args.gzip_level, args.repeat
+            )
+            print(
+                f"{turns:>6} | {format_version:>6} | {result['bytes']:>10,} | "
+                f"{result['bytes'] / legacy['bytes']:>6.2f} | "
+                f"{result['encode_ms']:>9.3f} | {result['decode_ms']:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
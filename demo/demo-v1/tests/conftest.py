@@ -0,0 +1,25 @@
+"""Shared fixtures for the ArchPal test suite (run with ``python -m pytest`` from demo/demo-v1)"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import s3_storage  # noqa: E402
+from utils.storage_backends import MemoryBackend  # noqa: E402
+
+
+@pytest.fixture
+def backend():
+    return MemoryBackend()
+
+
+@pytest.fixture
+def storage(backend):
+    """Process-wide storage runtime on an in-memory backend"""
+    runtime = s3_storage.configure_storage(backend)
+    yield runtime
+    if runtime.write_queue is not None:
+        runtime.write_queue.flush(5)
@@ -0,0 +1,43 @@
+from utils import s3_storage
+
+
+def test_commit_turn_stores_pair_and_history_entry(storage, backend):
+    history = s3_storage.commit_turn(
+        "u1", "c1",
+        {"content": "How do I start?", "message_id": "m1"},
+        {"content": "With a thesis.", "metadata": {"emotion": "smile"}, "message_id": "m2"},
+        metadata={"course_number": "ARCH 101"},
+        title="First draft"
+    )
+    assert [(conv["conversation_id"], conv["message_count"], conv["title"]) for conv in history] == [
+        ("c1", 2, "First draft")
+    ]
+
+    conversation = s3_storage.get_conversation("u1", "c1")
+    assert [(m["message_id"], m["role"], m["content"]) for m in conversation["messages"]] == [
+        ("m1", "user", "How do I start?"),
+        ("m2", "assistant", "With a thesis."),
+    ]
+    assert conversation["messages"][1]["metadata"]["emotion"] == "smile"
+    assert conversation["metadata"]["course_number"] == "ARCH 101"
+    # One segment per turn
+    assert len(backend.list_keys(s3_storage._segment_prefix("u1", "c1"))) == 1
+
+
+def test_later_turns_update_the_existing_entry(storage):
+    s3_storage.commit_turn("u1", "c1", {"content": "a"}, {"content": "b"}, title="Keep me")
+    history = s3_storage.commit_turn("u1", "c1", {"content": "c"}, {"content": "d"}, title="Ignored")
+    assert len(history) == 1
+    assert history[0]["message_count"] == 4
+    assert history[0]["title"] == "Keep me"
+
+
+def test_history_is_newest_first_and_limited(storage):
+    for index in range(4):
+        history = s3_storage.commit_turn("u1", f"c{index}", {"content": "q"}, {"content": "a"}, limit=3)
+    assert [conv["conversation_id"] for conv in history] == ["c3", "c2", "c1"]
+
+
+def test_commit_turn_without_storage_returns_none(monkeypatch):
+    monkeypatch.setattr(s3_storage, "get_storage_runtime", lambda: None)
+    assert s3_storage.commit_turn("u1", "c1", {"content": "q"}, {"content": "a"}) is None
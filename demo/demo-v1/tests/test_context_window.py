@@ -0,0 +1,100 @@
+import threading
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils import context_window
+from utils.context_window import messages_between, plan_context, to_records, update_summary
+
+# 99 tokens of text + 4 of overhead per message
+TEXT = "x" * 396
+
+
+def conversation(count, text=TEXT):
+    return [
+        (HumanMessage if index % 2 == 0 else AIMessage)(content=text, id=f"m{index}")
+        for index in range(count)
+    ]
+
+
+def test_short_conversation_is_sent_whole():
+    plan = plan_context(conversation(3), system_tokens=100, budget=1000)
+    assert plan == (0, None, 100 + 3 * 103, 0)
+
+
+def test_summary_is_requested_before_the_budget_is_reached():
+    plan = plan_context(conversation(8), system_tokens=0, budget=1000)
+    assert plan.start == 0
+    assert plan.dropped == 0
+    # The recent half of the budget starts at a user message
+    assert plan.summarize_through == 3
+
+
+def test_over_budget_drops_the_oldest_turns():
+    messages = conversation(11)
+    plan = plan_context(messages, system_tokens=0, budget=1000)
+    assert plan.tokens <= 1000
+    assert plan.start == plan.dropped > 0
+    assert isinstance(messages[plan.start], HumanMessage)
+    assert plan.summarize_through is not None
+
+
+def test_summary_replaces_the_messages_it_covers():
+    messages = conversation(8)
+    summary = {"text": "Student asked about x.", "through": "m3"}
+    plan = plan_context(messages, system_tokens=0, summary=summary, budget=1000)
+    assert plan.start == 4
+    assert plan.summarize_through is None
+    assert plan.tokens == context_window.estimate_tokens(context_window.summary_text(summary)) + 4 * 103
+
+
+def test_latest_prompt_is_always_sent():
+    messages = conversation(2) + [HumanMessage(content="y" * 8000, id="m2")]
+    plan = plan_context(messages, system_tokens=0, budget=1000)
+    assert plan.start == 2
+
+
+def test_messages_between():
+    records = to_records(conversation(4))
+    assert [r["message_id"] for r in messages_between(records, None, "m1")] == ["m0", "m1"]
+    assert [r["message_id"] for r in messages_between(records, "m1", "m3")] == ["m2", "m3"]
+    assert messages_between(records, "gone", "m3") == []
+    assert records[0]["role"] == "user" and records[1]["role"] == "assistant"
+
+
+class SummaryChat:
+    def __init__(self):
+        self.prompts = []
+
+    def invoke(self, prompt):
+        self.prompts.append(prompt)
+        return AIMessage(content=" The student drafted a thesis. ")
+
+
+def test_update_summary_folds_new_messages_and_persists():
+    records = to_records(conversation(6))
+    persisted = []
+    previous = {"text": "Earlier.", "through": "m1", "message_count": 2}
+    summary = update_summary(SummaryChat(), previous, "m3", lambda: records, persisted.append)
+    assert summary["text"] == "The student drafted a thesis."
+    assert summary["through"] == "m3"
+    assert summary["message_count"] == 4
+    assert persisted == [summary]
+
+
+def test_update_summary_without_the_messages_does_nothing():
+    chat = SummaryChat()
+    assert update_summary(chat, None, "missing", lambda: to_records(conversation(2))) is None
+    assert chat.prompts == []
+
+
+def test_one_summary_job_per_conversation():
+    release = threading.Event()
+    first = context_window.submit_summary("c1", release.wait, 5)
+    assert first is not None
+    assert context_window.submit_summary("c1", release.wait, 5) is None
+    finished = threading.Event()
+    first.add_done_callback(lambda _: finished.set())
+    release.set()
+    assert finished.wait(5)
+    # The key is free again once the job finished
+    assert context_window.submit_summary("c1", lambda: "done").result(5) == "done"
@@ -0,0 +1,87 @@
+import csv
+import os
+
+import pytest
+
+from utils import conversation_archive, s3_storage, storage_format
+from utils.research_export import ResearchExporter
+
+
+def keys(backend, prefix):
+    return sorted(backend.list_keys(prefix))
+
+
+def contents(conversation):
+    return [message["content"] for message in conversation["messages"]]
+
+
+@pytest.fixture
+def idle(storage):
+    s3_storage.commit_turn("u1", "c1", {"content": "Old question"}, {"content": "Old answer"})
+    s3_storage.commit_turn("u1", "c2", {"content": "Other"}, {"content": "Reply"})
+
+
+def test_records_round_trip_through_a_bundle():
+    conversation = {"conversation_id": "c1", "messages": [{"role": "user", "content": "Hi"}]}
+    first = conversation_archive.encode_record(conversation, storage_format.COMPACT_FORMAT, 6)
+    second = conversation_archive.encode_record({"conversation_id": "c2"}, storage_format.LEGACY_FORMAT, 0)
+    bundle = first + second
+    entry = {"offset": 0, "length": len(first), "format": storage_format.COMPACT_FORMAT}
+    assert conversation_archive.read_record(bundle, entry) == conversation
+    entry = {"offset": len(first), "length": len(second), "format": storage_format.LEGACY_FORMAT}
+    assert conversation_archive.read_record(bundle, entry) == {"conversation_id": "c2"}
+    assert conversation_archive.read_record(bundle[:-1], entry) is None
+
+
+def test_archiving_packs_conversations_into_one_bundle(idle, backend):
+    assert s3_storage.archive_conversations("u1", older_than_days=0) == 2
+
+    assert keys(backend, "users/u1/conversations/") == []
+    archived = keys(backend, "users/u1/archive/")
+    assert len(archived) == 2
+    assert archived[-1] == "users/u1/archive/index.json"
+    assert contents(s3_storage.get_conversation("u1", "c1")) == ["Old question", "Old answer"]
+    assert [entry["conversation_id"] for entry in s3_storage.get_conversation_history("u1")] == ["c2", "c1"]
+
+
+def test_recent_conversations_are_left_alone(idle, backend):
+    assert s3_storage.archive_conversations("u1", older_than_days=1) == 0
+    assert keys(backend, "users/u1/archive/") == []
+
+
+def test_resumed_conversation_continues_after_its_record(idle, backend, monkeypatch):
+    s3_storage.archive_conversations("u1", older_than_days=0)
+    s3_storage.commit_turn("u1", "c1", {"content": "New question"}, {"content": "New answer"})
+    assert contents(s3_storage.get_conversation("u1", "c1")) == [
+        "Old question", "Old answer", "New question", "New answer"
+    ]
+
+    # Archiving it again leaves the first bundle with only c2 referenced
+    monkeypatch.setattr(conversation_archive, "ORPHAN_GRACE_SECONDS", 0)
+    assert s3_storage.archive_conversations("u1", older_than_days=0) == 1
+    assert contents(s3_storage.get_conversation("u1", "c1"))[-1] == "New answer"
+    assert contents(s3_storage.get_conversation("u1", "c2")) == ["Other", "Reply"]
+    assert len(keys(backend, "users/u1/archive/")) == 3
+
+
+def test_unreferenced_bundles_are_deleted(idle, backend, monkeypatch):
+    s3_storage.archive_conversations("u1", older_than_days=0)
+    first_bundle = keys(backend, "users/u1/archive/")[0]
+    for conversation_id in ("c1", "c2"):
+        s3_storage.commit_turn("u1", conversation_id, {"content": "More"}, {"content": "Sure"})
+
+    monkeypatch.setattr(conversation_archive, "ORPHAN_GRACE_SECONDS", 0)
+    assert s3_storage.archive_conversations("u1", older_than_days=0) == 2
+    assert first_bundle not in keys(backend, "users/u1/archive/")
+    assert len(contents(s3_storage.get_conversation("u1", "c2"))) == 4
+
+
+def test_exports_read_archived_conversations(idle, backend, tmp_path):
+    s3_storage.save_user_info("u1", {"first_name": "Ada", "last_name": "L", "unique_identifier": "id-1"})
+    s3_storage.archive_conversations("u1", older_than_days=0)
+    s3_storage.commit_turn("u1", "c1", {"content": "New question"}, {"content": "New answer"})
+
+    stats = ResearchExporter(backend, str(tmp_path), workers=2, progress_interval=0).run()
+    assert stats.rows == 3
+    with open(os.path.join(tmp_path, "conversations.csv"), newline="", encoding="utf-8") as f:
+        assert sum(row[3] == "New question" for row in csv.reader(f)) == 1
@@ -0,0 +1,68 @@
+import threading
+
+from utils import s3_storage
+from utils.storage_backends import MemoryBackend
+
+
+class InterleavingBackend(MemoryBackend):
+    """Lets another session update the history index just before the next conditional write of it"""
+
+    def __init__(self):
+        super().__init__()
+        self.interleave = None
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        if key.endswith("/conversations.json") and (if_match or if_none_match) and self.interleave:
+            interleave, self.interleave = self.interleave, None
+            interleave()
+        return super().put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+
+
+def history_ids(user_id):
+    return sorted(conv["conversation_id"] for conv in s3_storage.get_conversation_history(user_id, limit=100))
+
+
+def test_conflicting_write_is_merged_not_lost(monkeypatch):
+    monkeypatch.setattr(s3_storage, "CONDITIONAL_WRITE_BACKOFF_SECONDS", 0)
+    backend = InterleavingBackend()
+    runtime = s3_storage.configure_storage(backend)
+    s3_storage.commit_turn("u1", "c1", {"content": "q"}, {"content": "a"})
+
+    backend.interleave = lambda: s3_storage.add_conversation_to_history("u1", "c2", title="Other session")
+    s3_storage.commit_turn("u1", "c1", {"content": "q2"}, {"content": "a2"})
+
+    history = {conv["conversation_id"]: conv for conv in s3_storage.get_conversation_history("u1", limit=10)}
+    assert set(history) == {"c1", "c2"}
+    assert history["c1"]["message_count"] == 4
+    assert runtime.stats()["write_conflicts"] >= 1
+
+
+def test_concurrent_sessions_keep_every_entry(storage, monkeypatch):
+    monkeypatch.setattr(s3_storage, "CONDITIONAL_WRITE_MAX_ATTEMPTS", 50)
+    barrier = threading.Barrier(8)
+
+    def session(index):
+        barrier.wait()
+        for turn in range(3):
+            s3_storage.commit_turn("u1", f"c{index}", {"content": f"q{turn}"}, {"content": f"a{turn}"})
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    history = s3_storage.get_conversation_history("u1", limit=100)
+    assert sorted(conv["conversation_id"] for conv in history) == sorted(f"c{index}" for index in range(8))
+    assert all(conv["message_count"] == 6 for conv in history)
+
+
+def test_create_only_write_loses_to_an_existing_index(monkeypatch):
+    monkeypatch.setattr(s3_storage, "CONDITIONAL_WRITE_BACKOFF_SECONDS", 0)
+    backend = InterleavingBackend()
+    s3_storage.configure_storage(backend)
+
+    # The first session finds no index, another creates it meanwhile
+    backend.interleave = lambda: s3_storage.add_conversation_to_history("u1", "c2")
+    assert s3_storage.add_conversation_to_history("u1", "c1")
+    assert history_ids("u1") == ["c1", "c2"]
@@ -0,0 +1,45 @@
+import pytest
+
+from utils import s3_storage
+
+
+@pytest.fixture
+def small_head(monkeypatch):
+    monkeypatch.setattr(s3_storage, "HISTORY_HEAD_SIZE", 3)
+    monkeypatch.setattr(s3_storage, "HISTORY_HEAD_MAX", 5)
+
+
+def all_pages(user_id, limit):
+    conversations, cursor = s3_storage.get_conversation_history_page(user_id, limit)
+    pages = [conversations]
+    while cursor:
+        conversations, cursor = s3_storage.get_conversation_history_page(user_id, limit, cursor)
+        pages.append(conversations)
+    return pages
+
+
+def test_old_entries_spill_into_pages_and_stay_reachable(storage, backend, small_head):
+    for index in range(12):
+        s3_storage.add_conversation_to_history("u1", f"c{index:02d}")
+
+    assert backend.list_keys("users/u1/history/")
+
+    walked = [conv["conversation_id"] for page in all_pages("u1", 4) for conv in page]
+    assert walked == [f"c{index:02d}" for index in range(11, -1, -1)]
+
+
+def test_updating_a_paged_conversation_moves_it_back_to_the_head(storage, small_head):
+    for index in range(12):
+        s3_storage.add_conversation_to_history("u1", f"c{index:02d}")
+
+    s3_storage.update_conversation_title("u1", "c00", "Revived")
+    walked = [conv for page in all_pages("u1", 5) for conv in page]
+    ids = [conv["conversation_id"] for conv in walked]
+    assert ids[0] == "c00"
+    assert walked[0]["title"] == "Revived"
+    assert sorted(ids) == [f"c{index:02d}" for index in range(12)]
+
+
+def test_unknown_cursor_returns_nothing(storage):
+    s3_storage.add_conversation_to_history("u1", "c1")
+    assert s3_storage.get_conversation_history_page("u1", 5, "missing-page:0") == ([], None)
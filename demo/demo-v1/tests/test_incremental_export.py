@@ -0,0 +1,85 @@
+import csv
+import os
+
+import pytest
+
+from utils import s3_storage
+from utils.export_manifest import ExportManifest
+from utils.research_export import ResearchExporter
+
+
+def exchanges(output_dir):
+    with open(os.path.join(output_dir, "conversations.csv"), newline="", encoding="utf-8") as f:
+        return [(row[0], row[3], row[5]) for row in list(csv.reader(f))[1:]]
+
+
+@pytest.fixture
+def students(storage):
+    for user_id in ("u1", "u2"):
+        s3_storage.save_user_info(user_id, {
+            "first_name": "Student", "last_name": user_id, "unique_identifier": f"id-{user_id}",
+            "college_year": "Senior", "major": "Architecture"
+        })
+    s3_storage.commit_turn("u1", "c1", {"content": "First"}, {"content": "Reply 1"})
+    s3_storage.commit_turn("u2", "c2", {"content": "Other"}, {"content": "Reply 2"})
+
+
+def export(backend, output_dir):
+    return ResearchExporter(backend, str(output_dir), workers=2, progress_interval=0).run(incremental=True)
+
+
+def test_incremental_run_appends_only_new_exchanges(students, backend, tmp_path):
+    first = export(backend, tmp_path)
+    assert first.rows == 2
+    assert ExportManifest.load(str(tmp_path)).watermark is not None
+
+    s3_storage.commit_turn("u1", "c1", {"content": "Second"}, {"content": "Reply 3"})
+    second = export(backend, tmp_path)
+
+    # Only the changed conversation is fetched again
+    assert second.conversations == 1
+    assert second.rows == 1
+    assert exchanges(tmp_path) == [
+        ("id-u1", "First", "Reply 1"), ("id-u2", "Other", "Reply 2"), ("id-u1", "Second", "Reply 3")
+    ]
+    with open(os.path.join(tmp_path, "identifiers.csv"), newline="", encoding="utf-8") as f:
+        assert len(list(csv.reader(f))) == 1 + 2
+
+
+def test_unchanged_store_exports_nothing(students, backend, tmp_path):
+    export(backend, tmp_path)
+    again = export(backend, tmp_path)
+    assert again.conversations == 0
+    assert again.rows == 0
+    assert len(exchanges(tmp_path)) == 2
+
+
+def test_trailing_user_message_waits_for_its_reply(students, backend, tmp_path):
+    s3_storage.append_message_to_conversation("u2", "c2", "user", "Pending")
+    export(backend, tmp_path)
+    assert ("id-u2", "Pending", "") not in exchanges(tmp_path)
+    assert len(exchanges(tmp_path)) == 2
+
+    s3_storage.append_message_to_conversation("u2", "c2", "assistant", "Answer")
+    export(backend, tmp_path)
+    assert exchanges(tmp_path)[-1] == ("id-u2", "Pending", "Answer")
+    assert len(exchanges(tmp_path)) == 3
+
+
+def test_full_run_rewrites_the_csvs(students, backend, tmp_path):
+    export(backend, tmp_path)
+    ResearchExporter(backend, str(tmp_path), workers=2, progress_interval=0).run()
+    assert len(exchanges(tmp_path)) == 2
+
+
+def test_conversation_changed_without_new_exchanges_is_not_counted(students, backend, tmp_path):
+    export(backend, tmp_path)
+    # Changed, but its only new message still waits for a reply
+    s3_storage.append_message_to_conversation("u2", "c2", "user", "Pending")
+
+    stats = export(backend, tmp_path)
+    assert stats.rows == 0
+    assert stats.conversations == 0
+    assert stats.without_new_rows == 1
+    # Fetched once; the recorded fingerprint skips them afterwards
+    assert export(backend, tmp_path).without_new_rows == 0
@@ -0,0 +1,171 @@
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from utils import context_window, llm_admission
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_admission, "THROTTLE_BASE_DELAY", 0.01)
+    monkeypatch.setattr(llm_admission, "WAIT_POLL_SECONDS", 0.01)
+
+
+def bedrock_error(code, status):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "InvokeModel")
+
+
+def throttling_error():
+    return bedrock_error("ThrottlingException", 429)
+
+
+def test_is_throttling():
+    assert llm_admission.is_throttling(throttling_error())
+    assert llm_admission.is_throttling(bedrock_error("ServiceQuotaExceededException", 400))
+    assert llm_admission.is_throttling(bedrock_error("SomethingNew", 429))
+    # LangChain wraps Bedrock errors in a ValueError carrying the code
+    assert llm_admission.is_throttling(ValueError("An error occurred (ThrottlingException) when calling"))
+    assert not llm_admission.is_throttling(ValueError("Invalid model input"))
+
+
+@pytest.mark.parametrize("exc", [
+    bedrock_error("ServiceUnavailableException", 503),
+    bedrock_error("ModelNotReadyException", 428),
+    bedrock_error("ValidationException", 400),
+    ValueError("An error occurred (ServiceUnavailableException) when calling"),
+    # Only LangChain's ValueError wrapper is read by its message
+    RuntimeError("Rate exceeded"),
+    KeyError("ThrottlingException"),
+])
+def test_other_errors_are_not_throttling(exc):
+    assert not llm_admission.is_throttling(exc)
+
+
+def test_unavailable_model_does_not_shrink_the_limit():
+    controller = llm_admission.AdmissionController(max_concurrent=4, user_rate_per_minute=0)
+
+    def unavailable():
+        raise bedrock_error("ServiceUnavailableException", 503)
+
+    with pytest.raises(ClientError):
+        controller.call("u1", unavailable)
+    stats = controller.stats()
+    assert stats["concurrency_limit"] == 4
+    assert stats["throttled"] == 0
+    assert stats["paused_seconds"] == 0
+
+
+def test_concurrency_cap_and_fifo_order():
+    controller = llm_admission.AdmissionController(max_concurrent=2, user_rate_per_minute=0)
+    lock = threading.Lock()
+    running, peak, order = [0], [0], []
+    positions = {}
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            order.append(i)
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+
+    threads = []
+    for i in range(6):
+        thread = threading.Thread(target=controller.call, args=(f"user-{i}", work, i), kwargs={
+            "on_wait": lambda position, i=i: positions.setdefault(i, []).append(position)
+        })
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert order == list(range(6))
+    # Waiting callers see their place in line count down, then 0 once admitted
+    assert positions[5][-1] == 0
+    assert positions[5][:-1] == sorted(positions[5][:-1], reverse=True)
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_rate_limit_is_per_user():
+    controller = llm_admission.AdmissionController(user_rate_per_minute=60, user_burst=2)
+    controller.call("a", lambda: None)
+    controller.call("a", lambda: None)
+    with pytest.raises(llm_admission.RateLimited) as rejected:
+        controller.call("a", lambda: None)
+    assert 0 < rejected.value.retry_after <= 1
+    controller.call("b", lambda: None)
+    # Background work (no user) is never rate limited
+    for _ in range(5):
+        controller.call(None, lambda: None)
+    assert controller.stats()["rate_limited"] == 1
+
+
+def test_queue_timeout():
+    controller = llm_admission.AdmissionController(max_concurrent=1, user_rate_per_minute=0, queue_timeout=0.05)
+    release = threading.Event()
+    holder = threading.Thread(target=controller.call, args=("a", release.wait))
+    holder.start()
+    time.sleep(0.02)
+    try:
+        with pytest.raises(llm_admission.QueueTimeout):
+            controller.call("b", lambda: None)
+    finally:
+        release.set()
+        holder.join()
+    assert controller.stats()["queue_timeouts"] == 1
+
+
+def test_throttled_call_is_retried_and_limit_halved():
+    controller = llm_admission.AdmissionController(max_concurrent=8)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise throttling_error()
+        return "reply"
+
+    assert controller.call("a", flaky) == "reply"
+    assert len(attempts) == 2
+    stats = controller.stats()
+    assert stats["throttled"] == 1
+    assert stats["concurrency_limit"] < 8
+
+
+def test_persistent_throttling_raises_overloaded():
+    controller = llm_admission.AdmissionController()
+
+    def always():
+        raise throttling_error()
+
+    with pytest.raises(llm_admission.Overloaded):
+        controller.call("a", always)
+    stats = controller.stats()
+    assert stats["throttled"] == llm_admission.THROTTLE_MAX_ATTEMPTS
+    assert stats["overloaded"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_other_errors_pass_through():
+    controller = llm_admission.AdmissionController()
+    with pytest.raises(ZeroDivisionError):
+        controller.call("a", lambda: 1 / 0)
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_throttled_summary_backs_off_and_returns_none():
+    controller = llm_admission.AdmissionController()
+
+    class ThrottledChat:
+        def invoke(self, messages):
+            raise ValueError("Error raised by bedrock service: An error occurred (ThrottlingException)")
+
+    records = [{"message_id": "m1", "role": "user", "content": "hello"}]
+    summary = context_window.update_summary(ThrottledChat(), None, "m1", lambda: records, admission=controller)
+    assert summary is None
+    assert controller.stats()["throttled"] == llm_admission.THROTTLE_MAX_ATTEMPTS
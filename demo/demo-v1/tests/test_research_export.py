@@ -0,0 +1,63 @@
+import csv
+import os
+
+import pytest
+
+from utils import s3_storage
+from utils.research_export import ResearchExporter
+from utils.response_stream import EMPTY_REPLY_TEXT
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+@pytest.fixture
+def students(storage):
+    for user_id, first_name, unique_id in (("u1", "Ada", "id-ada"), ("u2", "Grace", "id-grace")):
+        s3_storage.save_user_info(user_id, {
+            "first_name": first_name, "last_name": "Student", "unique_identifier": unique_id,
+            "college_year": "Junior", "major": "Architecture"
+        })
+    s3_storage.commit_turn("u1", "c1", {"content": "I'm Ada, help me"}, {"content": "Sure, Ada."})
+    s3_storage.commit_turn("u1", "c1", {"content": "Thesis?"}, {"content": "State your claim."})
+    s3_storage.commit_turn("u2", "c2", {"content": "Hello"}, {"content": "Hi Grace"})
+
+
+def test_export_writes_every_exchange_and_student_once(students, backend, tmp_path):
+    stats = ResearchExporter(backend, str(tmp_path), workers=4, progress_interval=0).run()
+
+    rows = read_csv(os.path.join(tmp_path, "conversations.csv"))
+    assert len(rows) == 1 + 3
+    assert stats.rows == 3
+    assert stats.conversations == 2
+    assert stats.failed == 0
+    # Names are anonymized and exchanges keep their order
+    ada_rows = [row for row in rows[1:] if row[0] == "id-ada"]
+    assert [row[3] for row in ada_rows] == ["I'm [NAME], help me", "Thesis?"]
+    assert ada_rows[0][5] == "Sure, [NAME]."
+
+    identifiers = read_csv(os.path.join(tmp_path, "identifiers.csv"))
+    assert sorted(identifiers[1:]) == [["Ada", "Student", "id-ada"], ["Grace", "Student", "id-grace"]]
+
+
+def test_export_reads_compacted_and_header_conversations(students, backend, tmp_path):
+    s3_storage.compact_conversation("u1", "c1")
+    conversation = s3_storage.get_conversation("u2", "c2")
+    s3_storage.save_conversation("u2", "c2", conversation)
+
+    stats = ResearchExporter(backend, str(tmp_path), workers=2, progress_interval=0).run()
+    assert stats.rows == 3
+
+
+def test_stand_in_for_an_empty_reply_is_not_exported(students, backend, tmp_path):
+    s3_storage.commit_turn(
+        "u2", "c2", {"content": "Still there?"},
+        {"content": EMPTY_REPLY_TEXT, "metadata": {"parse": "fallback"}}
+    )
+    ResearchExporter(backend, str(tmp_path), workers=2, progress_interval=0).run()
+
+    rows = read_csv(os.path.join(tmp_path, "conversations.csv"))
+    row = next(row for row in rows if row[3] == "Still there?")
+    assert row[5] == ""
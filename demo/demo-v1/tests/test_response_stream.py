@@ -0,0 +1,92 @@
+from utils import response_stream
+from utils.response_stream import EmotionTagParser
+
+EMOTIONS = ("default", "smile", "sad")
+
+
+def feed_all(parser, chunks):
+    return [parser.feed(chunk) for chunk in chunks] + [parser.finish()]
+
+
+def test_tag_split_across_chunks():
+    parser = EmotionTagParser(EMOTIONS)
+    shown = feed_all(parser, ["<emo", "tion>smile</emo", "tion>", " Great", " question"])
+    assert "".join(shown) == "Great question"
+    assert parser.emotion == "smile"
+    assert parser.outcome == "structured"
+
+
+def test_whitespace_after_tag_is_dropped_until_text_starts():
+    parser = EmotionTagParser(EMOTIONS)
+    assert feed_all(parser, ["<emotion>sad</emotion>", " ", "\n Sorry", " to hear"]) == ["", "", "Sorry", " to hear", ""]
+
+
+def test_unknown_emotion_uses_default():
+    parser = EmotionTagParser(EMOTIONS)
+    assert "".join(feed_all(parser, ["<emotion>gleeful</emotion>Hi"])) == "Hi"
+    assert parser.emotion == "default"
+    assert parser.outcome == "recovered"
+
+
+def test_reply_without_tag_is_shown_whole():
+    parser = EmotionTagParser(EMOTIONS)
+    assert "".join(feed_all(parser, ["Hello", " there"])) == "Hello there"
+    assert parser.emotion == "default"
+    assert parser.outcome == "fallback"
+
+
+def test_chunk_text_reads_content_blocks():
+    class Chunk:
+        content = [{"type": "text_delta", "text": "a"}, {"type": "tool_use", "input": {}}, "b"]
+
+    assert response_stream.chunk_text(Chunk()) == "ab"
+
+
+def reply(content="", tool_args=None):
+    from langchain_core.messages import AIMessage
+
+    tool_calls = [{"name": "ArchPalResponse", "args": tool_args, "id": "call-1"}] if tool_args is not None else []
+    return AIMessage(content=content, tool_calls=tool_calls)
+
+
+def parse(raw, parsed=None):
+    return response_stream.parse_reply({"raw": raw, "parsed": parsed, "parsing_error": None}, EMOTIONS)
+
+
+def test_parse_reply_structured():
+    from types import SimpleNamespace
+
+    parsed = SimpleNamespace(emotion="smile", response_text="Nice thesis.")
+    assert parse(reply(), parsed) == ("smile", "Nice thesis.", "structured")
+
+
+def test_parse_reply_from_tool_arguments_with_invalid_emotion():
+    assert parse(reply(tool_args={"emotion": "gleeful", "response_text": "Try again."})) == (
+        "default", "Try again.", "recovered"
+    )
+
+
+def test_parse_reply_from_truncated_json_in_text():
+    text = 'Here you go: {"emotion": "sad", "response_text": "Your intro is a bit long\\u00'
+    assert parse(reply(text)) == ("sad", "Your intro is a bit long", "recovered")
+
+
+def test_parse_reply_from_emotion_tag():
+    assert parse(reply("<emotion>smile</emotion> Good start!")) == ("smile", "Good start!", "recovered")
+
+
+def test_parse_reply_plain_text():
+    assert parse(reply("  Just text.  ")) == ("default", "Just text.", "fallback")
+
+
+def test_parse_reply_tool_call_with_only_emotion_uses_message_text():
+    assert parse(reply("Let's outline it.", {"emotion": "smile"})) == ("smile", "Let's outline it.", "recovered")
+
+
+def test_parse_reply_without_any_text_is_never_empty():
+    assert parse(reply(tool_args={"emotion": "sad"})) == ("sad", response_stream.EMPTY_REPLY_TEXT, "fallback")
+    assert parse(reply("<emotion>smile</emotion>")) == ("smile", response_stream.EMPTY_REPLY_TEXT, "fallback")
+    assert response_stream.is_empty_reply(*parse(reply(tool_args={"emotion": "sad"}))[1:])
+    # Only the stand-in counts, not a plain-text reply or a model quoting it
+    assert not response_stream.is_empty_reply("Plain reply", "fallback")
+    assert not response_stream.is_empty_reply(response_stream.EMPTY_REPLY_TEXT, "recovered")
@@ -0,0 +1,95 @@
+from utils import s3_storage
+from utils.search_index import apply_delta, build_delta, new_index, remove_document, search, tokenize
+
+
+def message(content, timestamp="2026-01-01T00:00:00"):
+    return {"role": "user", "content": content, "timestamp": timestamp}
+
+
+def index_of(*conversations):
+    index = new_index()
+    for conversation_id, title, text in conversations:
+        apply_delta(index, build_delta(conversation_id, ["s1", "s1"], [message(text)], title=title))
+    return index
+
+
+def ids(results):
+    return [result["conversation_id"] for result in results]
+
+
+def test_tokenize_drops_stopwords_and_short_tokens():
+    assert tokenize("The Thesis of my_essay, a draft!") == ["thesis", "essay", "draft"]
+    assert tokenize(None) == []
+
+
+def test_bm25_ranks_the_more_relevant_conversation_first():
+    index = index_of(
+        ("c1", "", "thesis thesis thesis statement"),
+        ("c2", "", "one thesis among many other words about citations and sources"),
+        ("c3", "", "nothing relevant here"),
+    )
+    assert ids(search(index, "thesis")) == ["c1", "c2"]
+    assert search(index, "unknownword") == []
+    assert search(index, "the and") == []
+
+
+def test_title_match_is_boosted():
+    index = index_of(("c1", "Citations help", "sources"), ("c2", "", "citations sources"))
+    assert ids(search(index, "citations"))[0] == "c1"
+
+
+def test_last_word_matches_as_a_prefix():
+    index = index_of(("c1", "", "architecture studio"), ("c2", "", "archive"))
+    assert set(ids(search(index, "arch"))) == {"c1", "c2"}
+    assert ids(search(index, "studio archit")) == ["c1"]
+    # Too short to expand
+    assert search(index, "ar") == []
+
+
+def test_deltas_are_applied_once():
+    index = new_index()
+    delta = build_delta("c1", ["s2", "s2"], [message("brick facade")])
+    assert apply_delta(index, delta)
+    assert not apply_delta(index, delta)
+    assert index["postings"]["brick"] == {"c1": 1}
+
+    # A rebuild covering s2 replaces the document; the late delta is ignored
+    rebuild = build_delta("c1", ["", "s3"], [message("brick facade"), message("brick")], replace=True)
+    apply_delta(index, rebuild)
+    assert not apply_delta(index, delta)
+    assert index["postings"]["brick"] == {"c1": 2}
+
+
+def test_rename_replaces_the_title_but_turns_do_not():
+    index = new_index()
+    apply_delta(index, build_delta("c1", ["s1", "s1"], [message("hello")], title="First title"))
+    apply_delta(index, build_delta("c1", ["s2", "s2"], [message("again")], title="Stale title"))
+    assert index["docs"]["c1"]["title"] == "First title"
+    apply_delta(index, build_delta("c1", title="Renamed"))
+    assert index["docs"]["c1"]["title"] == "Renamed"
+
+
+def test_remove_document_drops_its_postings():
+    index = index_of(("c1", "", "shared unique"), ("c2", "", "shared"))
+    remove_document(index, "c1")
+    assert "unique" not in index["postings"]
+    assert index["postings"]["shared"] == {"c2": 1}
+
+
+def test_storage_search_sees_new_turns_and_renames(storage):
+    s3_storage.commit_turn("u1", "c1", {"content": "How do I cite sources?"}, {"content": "Use APA."}, title="Citing")
+    s3_storage.commit_turn("u1", "c2", {"content": "Studio critique tips"}, {"content": "Be concise."})
+
+    # Found through the turns' deltas before the first full build
+    results, complete = s3_storage.search_conversations("u1", "apa")
+    assert ids(results) == ["c1"]
+    assert not complete
+
+    assert s3_storage.rebuild_search_index("u1")
+    s3_storage.commit_turn("u1", "c1", {"content": "And MLA?"}, {"content": "Also fine."})
+    s3_storage.update_conversation_title("u1", "c2", "Critique prep")
+    results, complete = s3_storage.search_conversations("u1", "prep")
+    assert ids(results) == ["c2"]
+    assert complete
+    results, _ = s3_storage.search_conversations("u1", "mla apa")
+    assert ids(results) == ["c1"]
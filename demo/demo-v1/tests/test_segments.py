@@ -0,0 +1,78 @@
+from utils import s3_storage
+
+
+def segment_keys(backend, user_id, conversation_id):
+    return backend.list_keys(s3_storage._segment_prefix(user_id, conversation_id))
+
+
+def message(role, content, message_id):
+    return s3_storage.build_message(role, content, message_id=message_id)
+
+
+def test_appends_are_stored_as_segments_and_stitched_in_order(storage, backend):
+    for index in range(3):
+        assert s3_storage.append_message_to_conversation("u1", "c1", "user", f"message {index}")
+
+    assert len(segment_keys(backend, "u1", "c1")) == 3
+    # Appending never writes the conversation header
+    assert backend.get(s3_storage._conversation_key("u1", "c1")) is None
+    conversation = s3_storage.get_conversation("u1", "c1")
+    assert [m["content"] for m in conversation["messages"]] == ["message 0", "message 1", "message 2"]
+    assert [m["metadata"]["message_index"] for m in conversation["messages"]] == [0, 1, 2]
+
+
+def test_stitch_skips_segments_folded_into_the_header():
+    header = {"conversation_id": "c1", "messages": [message("user", "old", "m1")], "segments_through": "b"}
+    segments = [
+        {"segment_id": "a", "messages": [message("user", "folded", "m0")]},
+        {"segment_id": "b", "messages": [message("assistant", "folded too", "m0b")]},
+        {"segment_id": "c", "messages": [message("user", "new", "m2")]},
+    ]
+    conversation = s3_storage.stitch_conversation(header, segments)
+    assert [m["content"] for m in conversation["messages"]] == ["old", "new"]
+    assert conversation["segments_through"] == "c"
+
+
+def test_merged_segment_supersedes_lingering_sources():
+    # Compaction wrote the merged segment "c" (covering "a".."c") but stopped
+    # before deleting its sources
+    segments = [
+        {"segment_id": "a", "messages": [message("user", "one", "m1")]},
+        {"segment_id": "b", "messages": [message("assistant", "two", "m2")]},
+        {"segment_id": "c", "merged_from": "a", "messages": [
+            message("user", "one", "m1"), message("assistant", "two", "m2"), message("user", "three", "m3")
+        ]},
+        {"segment_id": "d", "messages": [message("assistant", "four", "m4")]},
+    ]
+    conversation = s3_storage.stitch_conversation(None, segments)
+    assert [m["content"] for m in conversation["messages"]] == ["one", "two", "three", "four"]
+
+
+def test_stitch_without_header_or_segments_is_none():
+    assert s3_storage.stitch_conversation(None, []) is None
+
+
+def test_compaction_merges_segments_without_losing_messages(storage, backend):
+    for index in range(6):
+        s3_storage.append_message_to_conversation("u1", "c1", "user", f"message {index}")
+    before = s3_storage.get_conversation("u1", "c1")["messages"]
+
+    assert s3_storage.compact_conversation("u1", "c1")
+    assert len(segment_keys(backend, "u1", "c1")) == 1
+    after = s3_storage.get_conversation("u1", "c1")["messages"]
+    assert [m["message_id"] for m in after] == [m["message_id"] for m in before]
+
+    # New turns after compaction are appended as usual
+    s3_storage.append_message_to_conversation("u1", "c1", "user", "message 6")
+    assert s3_storage.get_conversation("u1", "c1")["messages"][-1]["content"] == "message 6"
+
+
+def test_saved_header_is_not_double_counted_with_its_segments(storage):
+    s3_storage.append_message_to_conversation("u1", "c1", "user", "hello")
+    conversation = s3_storage.get_conversation("u1", "c1")
+    conversation["title"] = "Renamed"
+    assert s3_storage.save_conversation("u1", "c1", conversation)
+    s3_storage.append_message_to_conversation("u1", "c1", "assistant", "hi")
+
+    messages = s3_storage.get_conversation("u1", "c1")["messages"]
+    assert [m["content"] for m in messages] == ["hello", "hi"]
@@ -0,0 +1,60 @@
+import builtins
+
+import pytest
+
+from utils.storage_backends import LocalFileBackend, MemoryBackend, NotModified, PreconditionFailed, SQLiteBackend
+
+
+@pytest.fixture(params=["memory", "sqlite", "local"])
+def any_backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "objects.sqlite3"))
+    return LocalFileBackend(str(tmp_path / "objects"))
+
+
+def test_put_get_and_list(any_backend):
+    etag = any_backend.put("users/u1/info.json", b"{}")
+    any_backend.put("users/u1/conversations/c1.json", b"[1]")
+    any_backend.put("users/u2/info.json", b"{}")
+
+    stored = any_backend.get("users/u1/info.json")
+    assert stored.body == b"{}"
+    assert stored.etag == etag
+    assert any_backend.get("users/u1/missing.json") is None
+    assert any_backend.list_keys("users/u1/") == ["users/u1/conversations/c1.json", "users/u1/info.json"]
+    listed = {info.key: info for info in any_backend.iter_objects("users/u1/")}
+    assert listed["users/u1/info.json"].etag == etag
+    assert listed["users/u1/conversations/c1.json"].size == 3
+
+
+def test_conditional_requests(any_backend):
+    etag = any_backend.put("k.json", b"a", if_none_match="*")
+    with pytest.raises(PreconditionFailed):
+        any_backend.put("k.json", b"b", if_none_match="*")
+    with pytest.raises(NotModified):
+        any_backend.get("k.json", if_none_match=etag)
+
+    new_etag = any_backend.put("k.json", b"b", if_match=etag)
+    assert new_etag != etag
+    with pytest.raises(PreconditionFailed):
+        any_backend.put("k.json", b"c", if_match=etag)
+    assert any_backend.get("k.json").body == b"b"
+
+
+def test_delete_ignores_missing_keys(any_backend):
+    any_backend.put("a.json", b"1")
+    any_backend.delete(["a.json", "b.json"])
+    assert any_backend.list_keys("") == []
+
+
+def test_local_listing_does_not_read_files(tmp_path, monkeypatch):
+    backend = LocalFileBackend(str(tmp_path))
+    backend.put("users/u1/a.json", b"1")
+
+    def no_open(*args, **kwargs):
+        raise AssertionError("listing opened a file")
+
+    monkeypatch.setattr(builtins, "open", no_open)
+    assert [info.key for info in backend.iter_objects("users/")] == ["users/u1/a.json"]
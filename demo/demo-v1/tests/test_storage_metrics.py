@@ -0,0 +1,63 @@
+from utils import llm_metrics, storage_metrics
+
+
+def test_stats_are_rendered_under_their_own_namespace():
+    text = storage_metrics.render_prometheus(
+        lambda: {"write_queue": {"depth": 2}},
+        lambda: {"admission": {"in_flight": 3, "paused": False}}
+    )
+    assert "archpal_storage_write_queue_depth 2" in text
+    assert "archpal_llm_admission_in_flight 3" in text
+    assert "archpal_llm_admission_paused 0" in text
+    assert "archpal_storage_admission" not in text
+
+
+def test_failing_stats_do_not_break_rendering():
+    def broken():
+        raise RuntimeError("unavailable")
+
+    text = storage_metrics.render_prometheus(llm_stats=broken)
+    assert "archpal_operation_duration_seconds" in text
+    assert "archpal_llm_admission" not in text
+
+
+def test_metrics_port_binds_to_localhost_by_default(monkeypatch):
+    bound = []
+
+    class RecordingServer:
+        def __init__(self, address, handler):
+            bound.append(address)
+
+        def serve_forever(self):
+            pass
+
+    monkeypatch.setattr(storage_metrics, "ThreadingHTTPServer", RecordingServer)
+    monkeypatch.setattr(storage_metrics, "_exporter_started", False)
+    storage_metrics.start_exporter(port=9477)
+    assert bound == [("127.0.0.1", 9477)]
+
+
+def test_measure_records_calls_and_errors():
+    registry = storage_metrics.REGISTRY
+    before = registry.snapshot().get(("bedrock", "test_measure"), {})
+    try:
+        with storage_metrics.measure("test_measure", component="bedrock"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    after = registry.snapshot()[("bedrock", "test_measure")]
+    assert after["calls"] == before.get("calls", 0) + 1
+    assert after["errors"] == before.get("errors", 0) + 1
+
+
+def test_llm_metrics_share_the_registry_and_exposition():
+    with llm_metrics.measure("test_tokens"):
+        llm_metrics.record_tokens(input_tokens=10, output_tokens=5, cache_read_tokens=100)
+        llm_metrics.record_response("recovered")
+    counts = storage_metrics.REGISTRY.snapshot()[("bedrock", "test_tokens")]
+    assert counts["cache_hits"] >= 1
+
+    text = storage_metrics.render_prometheus()
+    assert 'archpal_llm_tokens_total{component="bedrock",operation="test_tokens",kind="input"}' in text
+    assert 'archpal_llm_prompt_cache_total{component="bedrock",operation="test_tokens",result="hit"}' in text
+    assert 'archpal_llm_responses_total{component="bedrock",operation="test_tokens",parse="recovered"}' in text
@@ -0,0 +1,201 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from utils.storage_backends import MemoryBackend, PreconditionFailed
+from utils.storage_resilience import (
+    CircuitBreaker, CircuitOpen, DeadlineExceeded, ResilientBackend, RetryBudget, is_retryable
+)
+
+
+def client_error(code, status=400):
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "GetObject")
+
+
+class FlakyBackend(MemoryBackend):
+    """MemoryBackend whose next GETs raise the queued errors or sleep"""
+
+    def __init__(self):
+        super().__init__()
+        self.errors = []
+        self.delay = 0.0
+        self.gets = 0
+
+    def get(self, key, if_none_match=None):
+        self.gets += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.delay:
+            time.sleep(self.delay)
+        return super().get(key, if_none_match=if_none_match)
+
+
+def resilient(inner, **config):
+    config.setdefault("retry_base_delay", 0.0)
+    return ResilientBackend(inner, config)
+
+
+@pytest.mark.parametrize("exc, retryable", [
+    (client_error("SlowDown", 503), True),
+    (client_error("InternalError", 500), True),
+    (client_error("TooManyRequests", 429), True),
+    (client_error("AccessDenied", 403), False),
+    (client_error("NoSuchBucket", 404), False),
+    (DeadlineExceeded(), True),
+    (ConnectionResetError(), True),
+    (PreconditionFailed(), False),
+    (CircuitOpen(), False),
+    (ValueError("bad JSON"), False),
+])
+def test_is_retryable(exc, retryable):
+    assert is_retryable(exc) is retryable
+
+
+def test_retry_budget_is_spent_by_retries_and_refilled_by_successes():
+    budget = RetryBudget(10)
+    assert budget.acquire(6)
+    assert not budget.acquire(6)
+    budget.refill(20)
+    assert budget.tokens == 10
+
+
+def test_circuit_breaker_opens_and_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+    time.sleep(0.06)
+    breaker.allow()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+
+
+def test_transient_errors_are_retried():
+    inner = FlakyBackend()
+    inner.put("k", b"v")
+    inner.errors = [client_error("SlowDown", 503), ConnectionResetError()]
+    backend = resilient(inner)
+
+    assert backend.get("k").body == b"v"
+    assert inner.gets == 3
+    assert backend.stats()["retries"] == 2
+    assert backend.stats()["circuit_state"] == "closed"
+
+
+def test_permanent_errors_are_not_retried():
+    inner = FlakyBackend()
+    inner.errors = [client_error("AccessDenied", 403)]
+    backend = resilient(inner)
+
+    with pytest.raises(ClientError):
+        backend.get("k")
+    assert inner.gets == 1
+    assert backend.stats()["failures"] == 1
+
+
+def test_retries_stop_when_the_budget_runs_out():
+    inner = FlakyBackend()
+    inner.errors = [ConnectionResetError()] * 10
+    backend = resilient(inner, retry_budget=5, retry_max_attempts=10)
+
+    with pytest.raises(ConnectionResetError):
+        backend.get("k")
+    # One retry costs the whole budget
+    assert inner.gets == 2
+    assert backend.stats()["retry_budget_exhausted"] == 1
+
+
+def test_slow_call_fails_with_deadline_exceeded():
+    inner = FlakyBackend()
+    inner.delay = 0.2
+    backend = resilient(inner, deadlines={"get": 0.05}, retry_max_attempts=1)
+
+    with pytest.raises(DeadlineExceeded):
+        backend.get("k")
+    assert backend.stats()["deadline_exceeded"] == 1
+
+
+def test_open_circuit_short_circuits_calls():
+    inner = FlakyBackend()
+    inner.errors = [ConnectionResetError()] * 2
+    backend = resilient(inner, retry_max_attempts=1, circuit_failure_threshold=2, circuit_reset_seconds=60)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionResetError):
+            backend.get("k")
+    with pytest.raises(CircuitOpen):
+        backend.get("k")
+    assert inner.gets == 2
+    assert backend.stats()["short_circuited"] == 1
+    assert backend.stats()["circuit_state"] == "open"
+
+
+def test_failed_condition_does_not_count_against_the_store():
+    backend = resilient(MemoryBackend(), circuit_failure_threshold=1)
+    backend.put("k", b"v")
+    for _ in range(3):
+        with pytest.raises(PreconditionFailed):
+            backend.put("k", b"w", if_none_match="*")
+    assert backend.stats()["circuit_state"] == "closed"
+    assert backend.stats()["retries"] == 0
+
+
+def half_open(backend):
+    backend.breaker.record_failure()
+    assert backend.breaker.state == "open"
+    time.sleep(0.02)
+
+
+def test_listing_settles_the_half_open_probe():
+    inner = MemoryBackend()
+    inner.put("users/u1/info.json", b"v")
+    backend = resilient(inner, circuit_failure_threshold=1, circuit_reset_seconds=0.01)
+    half_open(backend)
+
+    assert [info.key for info in backend.iter_objects("users/")] == ["users/u1/info.json"]
+    assert backend.stats()["circuit_state"] == "closed"
+    assert backend.get("users/u1/info.json").body == b"v"
+
+
+def test_abandoned_listing_settles_the_half_open_probe():
+    inner = MemoryBackend()
+    for key in ("a", "b"):
+        inner.put(key, b"v")
+    backend = resilient(inner, circuit_failure_threshold=1, circuit_reset_seconds=0.01)
+    half_open(backend)
+
+    listing = backend.iter_objects("")
+    next(listing)
+    listing.close()
+    assert backend.get("a").body == b"v"
+
+
+def test_failed_listing_reopens_the_circuit():
+    class Unlistable(MemoryBackend):
+        def iter_objects(self, prefix):
+            raise ConnectionResetError()
+            yield
+
+    backend = resilient(Unlistable(), circuit_failure_threshold=1, circuit_reset_seconds=0.01)
+    half_open(backend)
+    with pytest.raises(ConnectionResetError):
+        list(backend.iter_objects(""))
+    assert backend.stats()["circuit_state"] == "open"
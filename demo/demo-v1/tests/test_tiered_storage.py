@@ -0,0 +1,106 @@
+import pytest
+
+from utils import s3_storage
+from utils.storage_backends import MemoryBackend
+from utils.tiered_storage import TieredBackend, conversation_unit
+
+UNIT = "users/u1/conversations/c1"
+
+
+@pytest.fixture
+def cold():
+    return MemoryBackend()
+
+
+@pytest.fixture
+def tiered(cold, tmp_path):
+    return TieredBackend(cold, str(tmp_path / "hot.sqlite3"), sync_interval=0.01)
+
+
+def test_conversation_unit():
+    assert conversation_unit(UNIT + ".json") == UNIT
+    assert conversation_unit(UNIT + "/segments/0001.json") == UNIT
+    assert conversation_unit("users/u1/info.json") is None
+    assert conversation_unit("users/u1/conversations.json") is None
+
+
+def test_conversation_writes_go_hot_and_sync_to_cold(tiered, cold):
+    tiered.put(UNIT + ".json", b"header")
+    assert tiered.is_hot(UNIT)
+    assert tiered.get(UNIT + ".json").body == b"header"
+    assert tiered.stats()["hot_reads"] == 1
+
+    assert tiered.flush(timeout=5)
+    assert cold.get(UNIT + ".json").body == b"header"
+    assert tiered.stats()["sync_queue_depth"] == 0
+
+
+def test_shared_keys_always_go_cold(tiered, cold):
+    tiered.put("users/u1/info.json", b"info")
+    assert cold.get("users/u1/info.json").body == b"info"
+    assert tiered.stats()["hot_conversations"] == 0
+
+
+def test_promote_copies_the_whole_conversation(tiered, cold):
+    cold.put(UNIT + ".json", b"header")
+    cold.put(UNIT + "/segments/a.json", b"segment")
+    assert not tiered.is_hot(UNIT)
+
+    assert tiered.promote(UNIT)
+    assert not tiered.promote(UNIT)
+    cold.delete([UNIT + "/segments/a.json"])
+    assert [info.key for info in tiered.iter_objects(UNIT + "/segments/")] == [UNIT + "/segments/a.json"]
+    assert tiered.get(UNIT + "/segments/a.json").body == b"segment"
+    assert tiered.stats()["promotions"] == 1
+
+
+def test_listings_merge_hot_and_cold_conversations(tiered, cold):
+    cold.put("users/u1/conversations/c0.json", b"cold")
+    tiered.put(UNIT + ".json", b"hot")
+    keys = [info.key for info in tiered.iter_objects("users/u1/conversations/")]
+    assert keys == ["users/u1/conversations/c0.json", UNIT + ".json"]
+
+
+def test_deletes_of_hot_objects_are_synced(tiered, cold):
+    tiered.put(UNIT + "/segments/a.json", b"segment")
+    tiered.delete([UNIT + "/segments/a.json"])
+    assert tiered.flush(timeout=5)
+    assert cold.get(UNIT + "/segments/a.json") is None
+
+
+def test_idle_conversations_are_demoted_once_synced(cold, tmp_path):
+    tiered = TieredBackend(cold, str(tmp_path / "hot.sqlite3"), idle_seconds=0, sync_interval=0.01)
+    tiered.put(UNIT + ".json", b"header")
+    assert tiered.flush(timeout=5)
+
+    tiered._demote_idle()
+    assert not tiered.is_hot(UNIT)
+    assert tiered.stats()["demotions"] == 1
+    assert tiered.get(UNIT + ".json").body == b"header"
+    assert tiered.stats()["cold_reads"] == 1
+
+
+def test_unsynced_writes_survive_a_restart(tmp_path):
+    class Unreachable(MemoryBackend):
+        def put(self, *args, **kwargs):
+            raise ConnectionError("offline")
+
+    path = str(tmp_path / "hot.sqlite3")
+    TieredBackend(Unreachable(), path, sync_interval=0.01).put(UNIT + ".json", b"header")
+
+    cold = MemoryBackend()
+    restarted = TieredBackend(cold, path, sync_interval=0.01)
+    assert restarted.is_hot(UNIT)
+    assert restarted.flush(timeout=5)
+    assert cold.get(UNIT + ".json").body == b"header"
+
+
+def test_storage_layer_runs_on_the_hot_tier(tiered, cold):
+    s3_storage.configure_storage(tiered)
+    s3_storage.commit_turn("u1", "c1", {"content": "Hi"}, {"content": "Hello"})
+    messages = s3_storage.get_conversation("u1", "c1")["messages"]
+    assert [m["content"] for m in messages] == ["Hi", "Hello"]
+
+    assert tiered.flush(timeout=5)
+    assert [info.key for info in cold.iter_objects(UNIT + "/segments/")]
+    assert cold.get("users/u1/conversations.json") is not None
@@ -0,0 +1,91 @@
+from utils import s3_storage
+from utils.storage_backends import MemoryBackend
+
+
+class FailingIndexBackend(MemoryBackend):
+    """Fails the first write of the history index"""
+
+    def __init__(self):
+        super().__init__()
+        self.index_failures = 1
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        if key.endswith("/conversations.json") and self.index_failures:
+            self.index_failures -= 1
+            raise RuntimeError("index write failed")
+        return super().put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+
+
+def test_retried_turn_is_stored_once(monkeypatch):
+    monkeypatch.setattr(s3_storage.time, "sleep", lambda seconds: None)
+    backend = FailingIndexBackend()
+    s3_storage.configure_storage(backend)
+
+    s3_storage.enqueue_turn("user-1", "conv-1", {"content": "hello"}, {"content": "hi"}, title="Greeting")
+    assert s3_storage.get_storage_runtime().write_queue.flush(5)
+
+    conversation = s3_storage.get_conversation("user-1", "conv-1")
+    assert [m["content"] for m in conversation["messages"]] == ["hello", "hi"]
+    assert len(backend.list_keys("users/user-1/conversations/conv-1/segments/")) == 1
+    assert len(backend.list_keys("users/user-1/search_index/")) == 1
+    history = s3_storage.get_conversation_history("user-1")
+    assert history[0]["message_count"] == 2
+
+
+def test_failed_segment_write_leaves_index_untouched(storage, backend, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("segment write failed")
+
+    monkeypatch.setattr(s3_storage, "_write_segment", fail)
+    assert s3_storage.commit_turn("user-1", "conv-1", {"content": "hello"}, {"content": "hi"}) is None
+    assert backend.get("users/user-1/conversations.json") is None
+
+
+def test_stitch_drops_repeated_messages():
+    message = s3_storage.build_message("user", "hello", message_id="m1")
+    reply = s3_storage.build_message("assistant", "hi", message_id="m2")
+    segments = [
+        {"segment_id": "a", "messages": [dict(message), dict(reply)]},
+        {"segment_id": "b", "messages": [dict(message), dict(reply)]},
+    ]
+    conversation = s3_storage.stitch_conversation(None, segments)
+    assert [m["message_id"] for m in conversation["messages"]] == ["m1", "m2"]
+
+
+class UnavailableBackend(MemoryBackend):
+    """Fails every write while down"""
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        if self.down:
+            raise ConnectionError("store unavailable")
+        return super().put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+
+
+def test_turns_that_keep_failing_are_held_and_retried(monkeypatch):
+    monkeypatch.setattr(s3_storage.time, "sleep", lambda seconds: None)
+    backend = UnavailableBackend()
+    # Without the circuit breaker, so the recovered store is used at once
+    s3_storage.configure_storage(backend, {"s3_circuit_failure_threshold": 0})
+
+    s3_storage.enqueue_turn("user-1", "conv-1", {"content": "first"}, {"content": "reply 1"}, title="Draft")
+    assert not s3_storage.flush_pending_writes(5)
+    assert s3_storage.get_unsaved_turns("user-1") == 1
+    assert s3_storage.get_unsaved_turns("user-2") == 0
+    assert s3_storage.get_write_queue_stats()["held"] == 1
+    # Still visible to this process while held
+    assert [m["content"] for m in s3_storage.get_conversation("user-1", "conv-1")["messages"]] == ["first", "reply 1"]
+
+    s3_storage.enqueue_turn("user-1", "conv-1", {"content": "second"}, {"content": "reply 2"})
+    assert not s3_storage.flush_pending_writes(5)
+    assert s3_storage.get_unsaved_turns("user-1") == 2
+
+    backend.down = False
+    assert s3_storage.flush_pending_writes(5)
+    assert s3_storage.get_unsaved_turns("user-1") == 0
+    conversation = s3_storage.get_conversation("user-1", "conv-1")
+    assert [m["content"] for m in conversation["messages"]] == ["first", "reply 1", "second", "reply 2"]
+    assert s3_storage.get_conversation_history("user-1")[0]["message_count"] == 4
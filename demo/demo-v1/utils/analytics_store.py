@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Columnar Analytics Store for ArchPal
+
+Converts the stored conversation JSON into a Parquet dataset with one row
+per message and typed columns, partitioned by course and day:
+
+    {output_dir}/
+    └── course_number={course}/
+        └── date={YYYY-MM-DD}/
+            └── {run_id}-{n}.parquet
+
+Columns (see SCHEMA): conversation_id, unique_identifier, message_id,
+message_index, role, content (names anonymized), timestamp (UTC), emotion,
+model, college_year, major, plus the course_number and date partition
+columns.
+
+Because the data is columnar and partitioned, a course-level query reads
+only that course's directories and only the columns it asks for; see
+read_messages(). A build replaces the dataset; an incremental build
+(--incremental) only adds files with the messages stored since the last
+build, using the same manifest as the research export (see
+export_manifest). Files from a build that did not finish are removed by the
+next one. Conversations are read
+with the same parallel, bounded ConversationStream as the research CSV
+export, and rows are written in record batches, so memory stays flat.
+
+Requires pyarrow (installed with Streamlit).
+
+Usage (from demo/demo-v1):
+    python -m utils.analytics_store --output-dir analytics/
+        [--secrets .streamlit/secrets.toml] [--workers 16] [--batch-rows 50000] [--incremental]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from utils.export_manifest import ExportManifest
+from utils.research_export import (
+    DEFAULT_PROGRESS_INTERVAL,
+    DEFAULT_WORKERS,
+    ExportStats,
+    IncrementalConversationStream,
+    add_storage_arguments,
+    backend_from_args
+)
+from utils.storage_backends import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_ROWS = 50_000
+
+PARTITION_COLUMNS = ["course_number", "date"]
+
+SCHEMA = pa.schema([
+    ("conversation_id", pa.string()),
+    ("unique_identifier", pa.string()),
+    ("message_id", pa.string()),
+    ("message_index", pa.int32()),
+    ("role", pa.string()),
+    ("content", pa.string()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("emotion", pa.string()),
+    ("model", pa.string()),
+    ("college_year", pa.string()),
+    ("major", pa.string()),
+    ("course_number", pa.string()),
+    ("date", pa.date32())
+])
+
+UNKNOWN_COURSE = "unknown"
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    # Stored timestamps are UTC; naive ones predate the "Z" suffix
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def message_rows(user_info: Optional[Dict], conversation: Dict, anonymize: bool = True, start: int = 0) -> List[Dict]:
+    """Flatten a stitched conversation into analytics rows (one per message from start on)"""
+    user_info = user_info or {}
+    metadata = conversation.get("metadata") or {}
+    first_name = user_info.get("first_name", "")
+    conversation_course = metadata.get("course_number") or user_info.get("course_number") or UNKNOWN_COURSE
+    conversation_time = _parse_timestamp(conversation.get("created_at"))
+
+    rows = []
+    messages = conversation.get("messages", [])
+    for index, message in enumerate(messages[start:], start):
+        message_metadata = message.get("metadata") or {}
+        content = message.get("content", "")
+        if anonymize and first_name:
+            content = content.replace(first_name, "[NAME]")
+        timestamp = _parse_timestamp(message.get("timestamp")) or conversation_time
+        rows.append({
+            "conversation_id": conversation.get("conversation_id"),
+            "unique_identifier": metadata.get("unique_identifier") or user_info.get("unique_identifier"),
+            "message_id": message.get("message_id"),
+            "message_index": index,
+            "role": message.get("role"),
+            "content": content,
+            "timestamp": timestamp,
+            "emotion": message_metadata.get("emotion"),
+            "model": message_metadata.get("model"),
+            "college_year": metadata.get("college_year") or user_info.get("college_year"),
+            "major": metadata.get("major") or user_info.get("major"),
+            "course_number": message_metadata.get("course_number") or conversation_course,
+            "date": timestamp.date() if timestamp else None
+        })
+    return rows
+
+
+def record_batches(results: Iterator[tuple], stats: ExportStats, manifest: ExportManifest,
+                   anonymize: bool = True, batch_rows: int = DEFAULT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """
+    Turn (job, user_info, conversation, start) results into record batches
+    of about batch_rows rows, recording exported messages in the manifest
+    """
+    pending = []
+    for job, user_info, conversation, start in results:
+        if conversation is None:
+            continue
+        pending.extend(message_rows(user_info, conversation, anonymize, start))
+        manifest.record(job, conversation.get("messages", []), len(conversation.get("messages", [])))
+        stats.conversations += 1
+        if len(pending) >= batch_rows:
+            stats.rows += len(pending)
+            yield pa.RecordBatch.from_pylist(pending, schema=SCHEMA)
+            pending = []
+    if pending:
+        stats.rows += len(pending)
+        yield pa.RecordBatch.from_pylist(pending, schema=SCHEMA)
+
+
+def _partitioning() -> ds.Partitioning:
+    return ds.partitioning(pa.schema([SCHEMA.field(name) for name in PARTITION_COLUMNS]), flavor="hive")
+
+
+def new_run_id() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+
+def _discard_unfinished_runs(output_dir: str, manifest: ExportManifest) -> None:
+    """Delete data files written by runs the manifest does not know about"""
+    finished = {run["run_id"] for run in manifest.runs}
+    for directory, _, filenames in os.walk(output_dir):
+        for filename in filenames:
+            if filename.endswith(".parquet") and filename.rsplit("-", 1)[0] not in finished:
+                logger.warning("Removing %s from an unfinished build", filename)
+                os.remove(os.path.join(directory, filename))
+
+
+def write_batches(batches: Iterator[pa.RecordBatch], output_dir: str, run_id: Optional[str] = None) -> str:
+    """
+    Write record batches into the partitioned dataset
+
+    Files are named after run_id, so each run adds new files next to the
+    existing ones instead of replacing them.
+
+    Returns:
+        The run_id used
+    """
+    run_id = run_id or new_run_id()
+    ds.write_dataset(
+        batches,
+        output_dir,
+        schema=SCHEMA,
+        format="parquet",
+        partitioning=_partitioning(),
+        basename_template=f"{run_id}-{{i}}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        max_rows_per_group=DEFAULT_BATCH_ROWS
+    )
+    return run_id
+
+
+def build_analytics_store(
+    backend: StorageBackend,
+    output_dir: str,
+    prefix: str = "users/",
+    workers: int = DEFAULT_WORKERS,
+    max_in_flight: Optional[int] = None,
+    anonymize: bool = True,
+    batch_rows: int = DEFAULT_BATCH_ROWS,
+    progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+    incremental: bool = False
+) -> ExportStats:
+    """
+    Rebuild the Parquet dataset from every conversation under prefix
+
+    With incremental=True and a previous build in output_dir, only the
+    messages stored since that build are added.
+    """
+    manifest = ExportManifest.load(output_dir)
+    if incremental and manifest.runs:
+        _discard_unfinished_runs(output_dir, manifest)
+    else:
+        if os.path.isdir(output_dir):
+            shutil.rmtree(output_dir)
+        manifest = ExportManifest(manifest.path)
+    stats = ExportStats()
+    stream = IncrementalConversationStream(
+        backend, prefix, workers, max_in_flight, progress_interval, stats, manifest=manifest
+    )
+    run_id = new_run_id()
+    write_batches(record_batches(iter(stream), stats, manifest, anonymize, batch_rows), output_dir, run_id)
+    manifest.finish_run({"run_id": run_id}, stream.watermark)
+    logger.info("Analytics store finished: %s (%d unchanged conversations skipped)", stats.summary(), stream.skipped)
+    return stats
+
+
+def open_dataset(path: str) -> ds.Dataset:
+    """Open the analytics dataset with its partitioning"""
+    return ds.dataset(
+        path,
+        format="parquet",
+        partitioning=_partitioning()
+    )
+
+
+def read_messages(
+    path: str,
+    course_number: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    start_date=None,
+    end_date=None
+) -> pa.Table:
+    """
+    Read messages, pruning partitions and columns
+
+    Args:
+        path: Dataset directory
+        course_number: Only this course
+        columns: Columns to read (default: all)
+        start_date / end_date: Inclusive datetime.date bounds on the message date
+
+    Example:
+        read_messages("analytics/", "ENGL 1102", ["role", "emotion", "timestamp"]).to_pandas()
+    """
+    expression = None
+    for condition in (
+        ds.field("course_number") == course_number if course_number else None,
+        ds.field("date") >= start_date if start_date else None,
+        ds.field("date") <= end_date if end_date else None
+    ):
+        if condition is not None:
+            expression = condition if expression is None else expression & condition
+    return open_dataset(path).to_table(columns=columns, filter=expression)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", required=True, help="Dataset directory")
+    add_storage_arguments(parser)
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS, help="Rows per record batch")
+    parser.add_argument("--no-anonymize", action="store_true", help="Keep first names in message text")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only add messages stored since the last build")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    stats = build_analytics_store(
+        backend_from_args(args),
+        args.output_dir,
+        prefix=args.prefix,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        anonymize=not args.no_anonymize,
+        batch_rows=args.batch_rows,
+        progress_interval=args.progress_interval,
+        incremental=args.incremental
+    )
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Shared Bedrock Chat Models for ArchPal
+
+Building a bedrock-runtime client resolves credentials and endpoints, and a
+new client opens new TLS connections on its first request. Doing that, and
+wrapping the model with with_structured_output(), on every chat turn puts it
+on the critical path of every message.
+
+This module keeps them per process instead, shared by every session and
+turn:
+
+- one boto3 bedrock-runtime client (thread-safe, with a connection pool
+  sized for concurrent sessions) per region and credentials
+- one ChatBedrock per model config (model ID, region, temperature, max
+  tokens) on top of it
+- one structured-output runnable per chat model and response schema
+  (with include_raw, so the raw response and its token usage are kept)
+
+Entries are built once, under a lock, the first time a config is asked
+for; a changed config (e.g. a new anthropic_model in secrets) simply gets
+entries of its own.
+
+This module has no Streamlit dependency; pass st.secrets or a plain dict.
+"""
+
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from langchain_aws import ChatBedrock
+
+# Concurrent requests per client (one pooled connection each)
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_CONNECT_TIMEOUT = 5
+# Long replies can take a while to stream
+DEFAULT_READ_TIMEOUT = 120
+
+
+def build_model_config(settings) -> Dict:
+    """
+    Build the Bedrock chat model configuration from a secrets-like mapping
+
+    Missing keys take their defaults.
+    """
+    return {
+        "model_id": settings.get("anthropic_model"),
+        "region_name": settings.get("aws_region", "us-east-1"),
+        "temperature": settings.get("anthropic_temperature"),
+        "max_tokens": settings.get("anthropic_max_tokens"),
+        "access_key_id": settings.get("aws_access_key_id") or None,
+        "secret_access_key": settings.get("aws_secret_access_key") or None,
+        "max_pool_connections": int(settings.get("bedrock_max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS)),
+        "connect_timeout": float(settings.get("bedrock_connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        "read_timeout": float(settings.get("bedrock_read_timeout", DEFAULT_READ_TIMEOUT))
+    }
+
+
+def _client_key(config: Dict) -> Tuple:
+    return (
+        config["region_name"], config["access_key_id"], config["secret_access_key"],
+        config["max_pool_connections"], config["connect_timeout"], config["read_timeout"]
+    )
+
+
+def _model_key(config: Dict) -> Tuple:
+    return _client_key(config) + (config["model_id"], config["temperature"], config["max_tokens"])
+
+
+class ChatModelPool:
+    """Process-wide, thread-safe cache of Bedrock clients and chat models"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple, object] = {}
+        self._models: Dict[Tuple, ChatBedrock] = {}
+        self._structured: Dict[Tuple, object] = {}
+
+    def _client(self, config: Dict):
+        # Called with the lock held
+        key = _client_key(config)
+        client = self._clients.get(key)
+        if client is None:
+            # If access keys are not provided, boto3 will use IAM role (for EC2/ECS/Lambda)
+            client = self._clients[key] = boto3.client(
+                service_name="bedrock-runtime",
+                region_name=config["region_name"],
+                aws_access_key_id=config["access_key_id"],
+                aws_secret_access_key=config["secret_access_key"],
+                config=Config(
+                    max_pool_connections=config["max_pool_connections"],
+                    connect_timeout=config["connect_timeout"],
+                    read_timeout=config["read_timeout"],
+                    tcp_keepalive=True,
+                    # llm_admission retries and backs off throttled calls itself
+                    retries={"mode": "standard", "total_max_attempts": 1}
+                )
+            )
+        return client
+
+    def get_chat(self, config: Dict) -> ChatBedrock:
+        """Chat model for a config from build_model_config"""
+        key = _model_key(config)
+        chat = self._models.get(key)
+        if chat is not None:
+            return chat
+        with self._lock:
+            chat = self._models.get(key)
+            if chat is None:
+                chat = self._models[key] = ChatBedrock(
+                    client=self._client(config),
+                    model_id=config["model_id"],
+                    model_kwargs={
+                        "temperature": config["temperature"],
+                        "max_tokens": config["max_tokens"]
+                    }
+                )
+        return chat
+
+    def get_structured(self, config: Dict, schema: Hashable):
+        """chat.with_structured_output(schema, include_raw=True) for a config from build_model_config"""
+        key = _model_key(config) + (schema,)
+        runnable = self._structured.get(key)
+        if runnable is not None:
+            return runnable
+        chat = self.get_chat(config)
+        with self._lock:
+            runnable = self._structured.get(key)
+            if runnable is None:
+                runnable = self._structured[key] = chat.with_structured_output(schema, include_raw=True)
+        return runnable
+
+
+# Process-wide pool, shared by all sessions
+_pool: Optional[ChatModelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ChatModelPool:
+    """Get or create the process-wide chat model pool"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ChatModelPool()
+    return _pool
+
+
+def get_chat_model(settings) -> ChatBedrock:
+    """Shared chat model for the model settings in a secrets-like mapping"""
+    return get_pool().get_chat(build_model_config(settings))
+
+
+def get_structured_chat(settings, schema: Hashable):
+    """
+    Shared structured-output runnable for the model settings and schema
+
+    Its invoke() returns {"raw": AIMessage, "parsed": schema instance or
+    None, "parsing_error": exception or None}.
+    """
+    return get_pool().get_structured(build_model_config(settings), schema)
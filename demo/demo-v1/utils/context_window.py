@@ -0,0 +1,296 @@
+"""
+Context Window Management for ArchPal
+
+Sending the whole conversation with every turn makes input tokens, cost and
+latency grow with the conversation, and a long drafting session eventually
+exceeds the model's context. plan_context keeps each request within a token
+budget: the system prompt, a rolling summary of the older part of the
+conversation, and as many recent messages as fit.
+
+    [system prompt + summary of messages 1..k] + messages k+1..n
+
+The summary is produced off the critical path. Once a request uses
+SUMMARY_TRIGGER_RATIO of the budget, plan_context names the messages to fold
+into the summary (leaving the recent messages within RECENT_RATIO of the
+budget) and update_summary runs on a background worker (submit_summary).
+The turn itself is sent with the current summary, dropping its oldest turns
+only if it would otherwise exceed the budget; the new summary is used from
+the next turn on. s3_storage.save_context_summary stores it in the
+conversation header, so resuming the conversation picks it up.
+
+A summary is a dict:
+    {"text": str, "through": message_id of the last message it covers,
+     "message_count": int, "updated_at": str}
+
+Token counts are estimated from character counts (CHARS_PER_TOKEN), which is
+close enough for budgeting without a tokenizer round trip.
+"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from utils import llm_metrics, prompt_cache
+from utils.response_stream import chunk_text
+
+logger = logging.getLogger(__name__)
+
+# Estimated input tokens per request: system prompt, summary and recent messages
+DEFAULT_CONTEXT_BUDGET_TOKENS = 16000
+# Start summarizing once a request uses this share of the budget...
+SUMMARY_TRIGGER_RATIO = 0.75
+# ...folding in everything but the recent messages that fit in this share
+RECENT_RATIO = 0.5
+# Length the summary is asked to stay within
+SUMMARY_MAX_WORDS = 400
+
+CHARS_PER_TOKEN = 4
+# Role and formatting tokens added to every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_WORKERS = 2
+
+SUMMARY_HEADING = "Summary of the earlier part of this conversation:"
+
+SUMMARY_INSTRUCTIONS = f"""You keep a running summary of a tutoring conversation between a student and ArchPal, an AI writing coach.
+You are given the current summary (if any) and the messages that followed it. Return an updated summary that replaces the current one.
+Keep what ArchPal needs to continue coaching: the assignment and the student's goals, the state of their draft (thesis, structure, key arguments), feedback and suggestions already given, decisions made, and open questions.
+Write plain text in the third person, at most {SUMMARY_MAX_WORDS} words. Return only the summary."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a text"""
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def message_tokens(message) -> int:
+    """Approximate tokens a LangChain message adds to a request"""
+    return MESSAGE_OVERHEAD_TOKENS + estimate_tokens(chunk_text(message))
+
+
+def _is_user(message) -> bool:
+    return getattr(message, "type", None) == "human"
+
+
+def summary_text(summary: Optional[Dict]) -> str:
+    """Rolling summary section for the system prompt ("" without a summary)"""
+    if not summary or not summary.get("text"):
+        return ""
+    return f"{SUMMARY_HEADING}\n{summary['text']}"
+
+
+class ContextPlan(NamedTuple):
+    """What to send for one turn"""
+    # Index of the first message to send
+    start: int
+    # Index of the last message to fold into the summary, or None
+    summarize_through: Optional[int]
+    # Estimated input tokens of the request
+    tokens: int
+    # Messages neither sent nor summarized yet (only when over budget)
+    dropped: int
+
+
+def _summary_end(messages: List, summary: Optional[Dict], start: int) -> int:
+    """Index of the first message after the summary's last covered message"""
+    through = (summary or {}).get("through")
+    if through:
+        for index in range(len(messages) - 1, start - 1, -1):
+            if getattr(messages[index], "id", None) == through:
+                return index + 1
+    return start
+
+
+def _cut_to_fit(messages: List, sizes: List[int], base: int, allowance: float) -> int:
+    """First index at or after base, at a user message, whose suffix fits the allowance"""
+    # Never cut past the latest user message
+    last = len(messages) - 1
+    while last > base and not _is_user(messages[last]):
+        last -= 1
+    remaining = sum(sizes[base:])
+    for index in range(base, last):
+        if remaining <= allowance and (index == base or _is_user(messages[index])):
+            return index
+        remaining -= sizes[index]
+    return max(base, last)
+
+
+def plan_context(
+    messages: List,
+    system_tokens: int,
+    summary: Optional[Dict] = None,
+    budget: int = DEFAULT_CONTEXT_BUDGET_TOKENS,
+    start: int = 0
+) -> ContextPlan:
+    """
+    Choose the messages to send with the system prompt and summary
+
+    Args:
+        messages: Session messages, oldest first, ending with the new prompt
+        system_tokens: Estimated tokens of the system prompt
+        summary: Rolling summary of the conversation, if any
+        budget: Input token budget per request
+        start: Index of the first message that may be sent at all
+
+    Returns:
+        ContextPlan
+    """
+    base = _summary_end(messages, summary, start)
+    fixed = system_tokens + estimate_tokens(summary_text(summary))
+    sizes = [message_tokens(message) for message in messages]
+    total = fixed + sum(sizes[base:])
+
+    summarize_through = None
+    if total > budget * SUMMARY_TRIGGER_RATIO:
+        cut = _cut_to_fit(messages, sizes, base, min(budget * RECENT_RATIO, budget - fixed))
+        if cut > base:
+            summarize_through = cut - 1
+
+    first = base
+    if total > budget:
+        first = _cut_to_fit(messages, sizes, base, budget - fixed)
+        total = fixed + sum(sizes[first:])
+        logger.warning(
+            "Context over budget (%d tokens): dropping %d messages until the summary catches up",
+            budget, first - base
+        )
+    return ContextPlan(first, summarize_through, total, first - base)
+
+
+def to_records(messages: List) -> List[Dict]:
+    """Session messages as stored-style message records"""
+    return [
+        {
+            "message_id": getattr(message, "id", None),
+            "role": "user" if _is_user(message) else "assistant",
+            "content": chunk_text(message)
+        }
+        for message in messages
+    ]
+
+
+def messages_between(records: List[Dict], after_id: Optional[str], through_id: str) -> List[Dict]:
+    """
+    Message records after after_id (from the start if None) up to and
+    including through_id; empty if either is not among the records
+    """
+    ids = [record.get("message_id") for record in records]
+    if through_id not in ids or (after_id is not None and after_id not in ids):
+        return []
+    first = ids.index(after_id) + 1 if after_id is not None else 0
+    return records[first:ids.index(through_id) + 1]
+
+
+def summarize_messages(chat, previous: Optional[Dict], records: List[Dict]) -> Dict:
+    """
+    Fold message records into the previous summary with one model call
+
+    Args:
+        chat: LangChain chat model
+        previous: Current summary, or None
+        records: Message records that follow it, oldest first
+
+    Returns:
+        The new summary
+    """
+    transcript = "\n\n".join(
+        f"{'Student' if record['role'] == 'user' else 'ArchPal'}: {record['content']}"
+        for record in records
+    )
+    prompt = [
+        SystemMessage(content=SUMMARY_INSTRUCTIONS),
+        HumanMessage(content=(
+            f"Current summary:\n{previous['text'] if previous else '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        ))
+    ]
+    with llm_metrics.measure("summarize"):
+        response = chat.invoke(prompt)
+        prompt_cache.record_usage(prompt_cache.usage_from(response))
+    return {
+        "text": chunk_text(response).strip(),
+        "through": records[-1]["message_id"],
+        "message_count": (previous or {}).get("message_count", 0) + len(records),
+        "updated_at": datetime.utcnow().isoformat() + "Z"
+    }
+
+
+def update_summary(
+    chat,
+    previous: Optional[Dict],
+    through_id: str,
+    load_records: Callable[[], List[Dict]],
+    persist: Optional[Callable[[Dict], object]] = None,
+    admission=None
+) -> Optional[Dict]:
+    """
+    Background job: summarize the messages after the previous summary up to
+    through_id, and persist the result
+
+    Args:
+        chat: LangChain chat model
+        previous: Current summary, or None
+        through_id: message_id of the last message to cover
+        load_records: Returns message records (oldest first) spanning the range
+        persist: Called with the new summary
+        admission: Optional llm_admission.AdmissionController; the model call
+            then waits for its turn and is backed off if Bedrock throttles it
+
+    Returns:
+        The new summary, or None if there was nothing to add or it failed
+    """
+    try:
+        records = messages_between(load_records(), (previous or {}).get("through"), through_id)
+        if not records:
+            logger.warning("Messages to summarize up to %s not found", through_id)
+            return None
+        if admission is not None:
+            # Background work is not charged to the student's rate limit
+            summary = admission.call(None, summarize_messages, chat, previous, records)
+        else:
+            summary = summarize_messages(chat, previous, records)
+        if not summary["text"]:
+            return None
+        if persist is not None:
+            persist(summary)
+        return summary
+    except Exception as e:
+        logger.warning("Updating the conversation summary failed: %s", e)
+        return None
+
+
+# Process-wide summary workers, shared by all sessions
+_executor: Optional[ThreadPoolExecutor] = None
+_in_flight: Set[str] = set()
+_lock = threading.Lock()
+
+
+def submit_summary(key: str, job: Callable, *args, **kwargs) -> Optional[Future]:
+    """
+    Run a summary job in the background
+
+    Args:
+        key: Conversation the job belongs to; only one job per key runs at a time
+
+    Returns:
+        Future of the job's result, or None if one is already running for key
+    """
+    global _executor
+    with _lock:
+        if key in _in_flight:
+            return None
+        _in_flight.add(key)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="context-summary")
+
+    def done(_):
+        with _lock:
+            _in_flight.discard(key)
+
+    future = _executor.submit(job, *args, **kwargs)
+    future.add_done_callback(done)
+    return future
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Conversation Archive Bundles for ArchPal
+
+Every conversation is a header plus segment objects, so listings, exports
+and lifecycle rules pay per-object overhead for every conversation ever
+stored. Conversations nobody has touched for a while are therefore packed
+into per-user archive bundles:
+
+    users/{cognito_user_id}/archive/
+    ├── index.json            # conversation_id -> bundle, offset, length
+    └── {bundle_id}.bundle    # records back to back
+
+A record is one whole conversation as stitched from its header and segments
+(including "segments_through"), encoded on its own in the wire format (see
+storage_format), so a single conversation is read with one ranged GET of
+its bytes and a bulk reader fetches a whole bundle with one GET. The record
+takes the place of the conversation's header: if the student resumes an
+archived conversation, new segments are written as usual and stitched after
+it, and the conversation is archived again once it is idle again.
+
+Bundles are immutable. Archiving a conversation again, or a live header
+written after it was archived, only makes its old record unreachable; a
+bundle none of whose records are referenced by index.json any more is
+deleted by a later archive run.
+
+s3_storage does the packing (archive_conversations, also run in the
+background when storage_archive_after_days is set) and serves reads; the
+offline exports read archived conversations from whole bundles.
+
+Usage (from demo/demo-v1):
+    python -m utils.conversation_archive --days 30
+        [--secrets .streamlit/secrets.toml] [--user COGNITO_USER_ID]
+"""
+
+import argparse
+import logging
+from typing import Dict, Optional
+
+from utils import storage_format
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_INDEX_VERSION = 1
+ARCHIVE_DIRECTORY = "archive"
+INDEX_FILENAME = "index.json"
+BUNDLE_SUFFIX = ".bundle"
+
+# Conversations idle this many days are archived by the command line job
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+# Start a new bundle once the current one reaches this size
+BUNDLE_TARGET_BYTES = 8 * 1024 * 1024
+# Unreferenced bundles younger than this may belong to a run still in progress
+ORPHAN_GRACE_SECONDS = 3600
+
+
+def new_index() -> Dict:
+    """
+    Empty archive index
+
+    Index layout:
+        {"version": 1,
+         "conversations": {conversation_id: {"bundle": bundle_id, "offset": int,
+                                             "length": int, "format": int,
+                                             "segments_through": str,
+                                             "archived_at": str}}}
+    """
+    return {"version": ARCHIVE_INDEX_VERSION, "conversations": {}}
+
+
+def encode_record(conversation: Dict, format_version: int, gzip_level: int) -> bytes:
+    """Encode one conversation as a bundle record"""
+    body, _ = storage_format.encode_json(conversation, format_version, gzip_level)
+    return body
+
+
+def decode_record(record: bytes, entry: Dict) -> Dict:
+    """Decode a record's bytes, as read from the bundle at its index entry"""
+    return storage_format.decode_json(record, {storage_format.FORMAT_METADATA_KEY: str(entry["format"])})
+
+
+def read_record(bundle: bytes, entry: Dict) -> Optional[Dict]:
+    """Decode one conversation out of a whole bundle body (None if the bundle is too short)"""
+    record = bundle[entry["offset"]:entry["offset"] + entry["length"]]
+    if len(record) != entry["length"]:
+        return None
+    return decode_record(record, entry)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=float, default=DEFAULT_ARCHIVE_AFTER_DAYS,
+                        help=f"Archive conversations idle this many days (default: {DEFAULT_ARCHIVE_AFTER_DAYS})")
+    parser.add_argument("--user", action="append", help="Only archive this Cognito user ID (repeatable)")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml",
+                        help="secrets.toml with the storage settings (default: .streamlit/secrets.toml)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Imported here: s3_storage itself imports this module
+    from utils import s3_storage
+    from utils.research_export import load_settings
+    from utils.storage_backends import create_backend
+
+    settings = load_settings(args.secrets)
+    config = s3_storage.build_storage_config(settings)
+    # The app process owns the hot tier; work directly against the backend
+    settings = dict(settings, storage_hot_tier=False)
+    s3_storage.configure_storage(create_backend(dict(config, sdk_max_attempts=1)), settings)
+
+    user_ids = args.user or s3_storage.list_user_ids()
+    archived = 0
+    for user_id in user_ids:
+        count = s3_storage.archive_conversations(user_id, older_than_days=args.days)
+        if count is None:
+            logger.error("Archiving failed for user %s", user_id)
+            continue
+        archived += count
+        if count:
+            logger.info("Archived %d conversations of user %s", count, user_id)
+    print(f"Archived {archived} conversations of {len(user_ids)} users")
+
+
+if __name__ == "__main__":
+    main()
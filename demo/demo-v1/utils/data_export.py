@@ -4,6 +4,8 @@ import csv
 from datetime import datetime
 from fpdf import FPDF
 
+from utils.response_stream import is_empty_reply
+
 # --- Constants & Config ---
 
 def get_secrets():
@@ -12,30 +14,51 @@ def get_secrets():
 
 # --- CSV Generation ---
 
-def create_csv_data(message_log, unique_id, college_year, major, first_name, anonymize=False):
-    """Create CSV data from message log, optionally anonymizing names"""
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow([
-        "Unique Identifier",
-        "College Year",
-        "Major",
-        "userMessage",
-        "userMessageTime",
-        "AIMessage",
-        "AIMessageTime"
-    ])
-    
+CONVERSATION_CSV_HEADER = [
+    "Unique Identifier",
+    "College Year",
+    "Major",
+    "userMessage",
+    "userMessageTime",
+    "AIMessage",
+    "AIMessageTime"
+]
+
+IDENTIFIER_CSV_HEADER = [
+    "first_name",
+    "last_name",
+    "unique_id"
+]
+
+def build_message_log(stored_messages):
+    """Pair stored conversation messages into message_log entries (one per exchange)"""
+    message_log = []
+    for position, msg in enumerate(stored_messages):
+        if msg.get("role") == "user" and position + 1 < len(stored_messages):
+            ai_msg = stored_messages[position + 1]
+            ai_text = ai_msg.get("content", "")
+            if is_empty_reply(ai_text, (ai_msg.get("metadata") or {}).get("parse")):
+                # The app's stand-in for an empty model reply, not the tutor's words
+                ai_text = ""
+            message_log.append({
+                "userMessage": msg.get("content", ""),
+                "userMessageTime": msg.get("timestamp", ""),
+                "AIMessage": ai_text,
+                "AIMessageTime": ai_msg.get("timestamp", "")
+            })
+    return message_log
+
+def conversation_csv_rows(message_log, unique_id, college_year, major, first_name, anonymize=False):
+    """Yield CSV rows (without header) for a message log, optionally anonymizing names"""
     for entry in message_log:
         user_message = entry["userMessage"]
         ai_message = entry["AIMessage"]
         
-        if anonymize:
+        if anonymize and first_name:
             user_message = user_message.replace(first_name, "[NAME]")
             ai_message = ai_message.replace(first_name, "[NAME]")
         
-        writer.writerow([
+        yield [
             unique_id,
             college_year,
             major,
@@ -43,7 +66,15 @@ def create_csv_data(message_log, unique_id, college_year, major, first_name, ano
             entry["userMessageTime"],
             ai_message,
             entry["AIMessageTime"]
-        ])
+        ]
+
+def create_csv_data(message_log, unique_id, college_year, major, first_name, anonymize=False):
+    """Create CSV data from message log, optionally anonymizing names"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    writer.writerow(CONVERSATION_CSV_HEADER)
+    writer.writerows(conversation_csv_rows(message_log, unique_id, college_year, major, first_name, anonymize))
     
     csv_string = output.getvalue()
     output.close()
@@ -54,11 +85,7 @@ def create_identifier_csv(first_name, last_name, unique_id):
     output = io.StringIO()
     writer = csv.writer(output)
     
-    writer.writerow([
-        "first_name",
-        "last_name",
-        "unique_id"
-    ])
+    writer.writerow(IDENTIFIER_CSV_HEADER)
     
     writer.writerow([
         first_name,
@@ -0,0 +1,124 @@
+"""
+Incremental Export State for ArchPal
+
+Bulk exports (research_export, analytics_store) can run incrementally: a
+manifest stored next to the output records, for every exported
+conversation, a fingerprint of its stored objects (keys + ETags from the
+listing) and how many of its messages were exported. The next run lists the
+bucket as usual but only fetches conversations whose fingerprint changed or
+that are new, and only appends the messages after the ones already
+exported. A run therefore costs one listing plus work proportional to new
+activity.
+
+The manifest also records:
+- watermark: when the last successful run started listing; everything
+  stored before it has been exported
+- runs: output written by successful runs, so output left behind by a run
+  that crashed before saving its manifest can be rolled back
+
+Jobs are research_export.ConversationJob instances. The manifest is saved
+atomically (temp file + fsync + os.replace) only after the run's output is
+complete.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def fingerprint(job) -> str:
+    """Hash of a conversation's listed keys and ETags; changes whenever it is written"""
+    digest = hashlib.sha256()
+    for key, etag in sorted(job.versions):
+        digest.update(f"{key}\0{etag}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ExportManifest:
+    """What an export directory already contains"""
+
+    def __init__(self, path: str, data: Optional[Dict] = None):
+        self.path = path
+        self.data = data or {
+            "version": MANIFEST_VERSION,
+            "watermark": None,
+            "runs": [],
+            "conversations": {}
+        }
+
+    @classmethod
+    def load(cls, output_dir: str) -> "ExportManifest":
+        path = os.path.join(output_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def save(self) -> None:
+        """Atomically replace the manifest file"""
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self.data.get("watermark")
+
+    @property
+    def runs(self) -> List:
+        return self.data["runs"]
+
+    def entry(self, job) -> Optional[Dict]:
+        return self.data["conversations"].get(job.manifest_key)
+
+    def unchanged(self, job) -> bool:
+        entry = self.entry(job)
+        return entry is not None and entry.get("fingerprint") == fingerprint(job)
+
+    def new_messages_start(self, job, messages: List[Dict]) -> int:
+        """Index of the first message not exported yet"""
+        entry = self.entry(job)
+        if not entry or not entry.get("message_count"):
+            return 0
+        count = entry["message_count"]
+        last_id = entry.get("last_message_id")
+        if count <= len(messages) and messages[count - 1].get("message_id") == last_id:
+            return count
+        # Messages were rewritten (e.g. save_conversation); resume after the
+        # last exported message if it is still there
+        ids = [message.get("message_id") for message in messages]
+        if last_id in ids:
+            return ids.index(last_id) + 1
+        logger.warning("Conversation %s changed beyond recognition; exporting it again", job.manifest_key)
+        return 0
+
+    def record(self, job, messages: List[Dict], exported_through: int) -> None:
+        """Remember that messages[:exported_through] of a conversation are exported"""
+        entry = {"fingerprint": fingerprint(job), "message_count": exported_through}
+        if exported_through:
+            entry["last_message_id"] = messages[exported_through - 1].get("message_id")
+        self.data["conversations"][job.manifest_key] = entry
+
+    def finish_run(self, run: Dict, watermark: str) -> None:
+        """Record a completed run and save the manifest"""
+        self.data["runs"].append(run)
+        self.data["watermark"] = watermark
+        self.save()
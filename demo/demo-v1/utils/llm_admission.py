@@ -0,0 +1,333 @@
+"""
+LLM Admission Control for ArchPal
+
+When a whole class opens ArchPal right before a deadline, every session
+calls Bedrock at once; past the account's quota Bedrock throttles, and
+without a limit every session keeps adding load. AdmissionController sits
+in front of every model call in the process:
+
+- Concurrency cap: at most llm_max_concurrent calls run at once. The
+  effective limit adapts (AIMD): a throttling response halves it, and each
+  successful call raises it again gradually, up to the cap.
+- Backoff: after a throttling response no new call is admitted for a
+  full-jitter exponential backoff, and the throttled call is retried
+  through the queue (at its head) up to THROTTLE_MAX_ATTEMPTS times.
+- Fair FIFO queue: calls that cannot run yet wait in arrival order, and the
+  caller is told its position while it waits (e.g. "#3 in line").
+- Per-user token buckets: each user may start llm_user_burst calls at once
+  and llm_user_rate_per_minute on average; faster requests are rejected
+  with RateLimited (and how long to wait) instead of crowding out other
+  students.
+
+Calls waiting longer than llm_queue_timeout_seconds fail with QueueTimeout.
+Both are AdmissionRejected, whose message can be shown to the student as is.
+
+Configuration (secrets.toml):
+- llm_max_concurrent: Model calls running at once per process (default: 8)
+- llm_user_rate_per_minute: Average calls per user per minute (default: 10)
+- llm_user_burst: Calls a user may make back to back (default: 5)
+- llm_queue_timeout_seconds: Longest wait in the queue (default: 120)
+
+This module has no Streamlit dependency.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from utils import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 8
+DEFAULT_USER_RATE_PER_MINUTE = 10
+DEFAULT_USER_BURST = 5
+DEFAULT_QUEUE_TIMEOUT_SECONDS = 120
+
+# Attempts per call while Bedrock is throttling
+THROTTLE_MAX_ATTEMPTS = 3
+# Full-jitter backoff bounds (seconds) after a throttling response
+THROTTLE_BASE_DELAY = 1.0
+THROTTLE_MAX_DELAY = 30.0
+# How often a waiting caller re-checks the queue and reports its position
+WAIT_POLL_SECONDS = 0.5
+# Token buckets of users idle this long are forgotten
+BUCKET_IDLE_SECONDS = 3600
+
+# Capacity signals only: a transient 503 or a model still loading says nothing
+# about how much load Bedrock will take, so it must not shrink the limit
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+# LangChain re-raises Bedrock errors as ValueError with the error code in the message
+_THROTTLING_MESSAGE = re.compile("|".join(sorted(THROTTLING_ERROR_CODES)) + r"|Too many requests|Rate exceeded")
+
+
+class AdmissionRejected(Exception):
+    """A model call was not run; the message is meant for the student"""
+
+
+class RateLimited(AdmissionRejected):
+    """The user is sending requests faster than their rate limit allows"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        seconds = max(1, round(retry_after))
+        super().__init__(
+            f"You're sending messages faster than ArchPal can answer. Please wait {seconds} "
+            f"second{'s' if seconds != 1 else ''} and send your message again."
+        )
+
+
+class QueueTimeout(AdmissionRejected):
+    """The call waited in the queue for too long"""
+
+    def __init__(self):
+        super().__init__("ArchPal is very busy right now. Please try sending your message again in a minute.")
+
+
+class Overloaded(AdmissionRejected):
+    """Bedrock kept throttling the call"""
+
+    def __init__(self):
+        super().__init__("ArchPal is very busy right now. Please try sending your message again in a minute.")
+
+
+def is_throttling(exc: BaseException) -> bool:
+    """Whether an error (or one it was raised from) is a Bedrock throttling response"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, ClientError):
+            response = getattr(exc, "response", None) or {}
+            code = response.get("Error", {}).get("Code", "")
+            status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+            if code in THROTTLING_ERROR_CODES or status == 429:
+                return True
+        elif isinstance(exc, ValueError) and _THROTTLING_MESSAGE.search(str(exc)):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class TokenBucket:
+    """Classic token bucket: capacity burst, refilled at rate tokens per second"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0, or the seconds until one is available (none taken)"""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+class AdmissionController:
+    """
+    Process-wide scheduler for model calls
+
+    Args:
+        max_concurrent: Upper bound on calls running at once
+        user_rate_per_minute: Average calls per user per minute (0 disables
+            per-user limits)
+        user_burst: Calls a user may make back to back
+        queue_timeout: Longest wait in the queue, in seconds
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT,
+        user_rate_per_minute: float = DEFAULT_USER_RATE_PER_MINUTE,
+        user_burst: int = DEFAULT_USER_BURST,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT_SECONDS
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = max(1, user_burst)
+        self.queue_timeout = queue_timeout
+        self.limit = float(self.max_concurrent)
+        self._in_flight = 0
+        self._queue = deque()
+        self._paused_until = 0.0
+        self._consecutive_throttles = 0
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._counters = {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_timeouts": 0,
+                          "throttled": 0, "overloaded": 0}
+        self._cond = threading.Condition()
+
+    def _check_rate(self, user_id: str) -> None:
+        # Called with the lock held
+        now = time.monotonic()
+        if len(self._buckets) > 1024:
+            for key in [k for k, b in self._buckets.items() if now - b.updated > BUCKET_IDLE_SECONDS]:
+                del self._buckets[key]
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+        retry_after = bucket.take()
+        if retry_after:
+            self._counters["rate_limited"] += 1
+            raise RateLimited(retry_after)
+
+    def _can_run(self, ticket: object) -> bool:
+        # Called with the lock held
+        return (
+            self._queue[0] is ticket
+            and self._in_flight < max(1, int(self.limit))
+            and time.monotonic() >= self._paused_until
+        )
+
+    def _acquire(self, on_wait: Optional[Callable[[int], None]], head: bool) -> None:
+        """Wait for a slot in FIFO order (from the head of the queue if head)"""
+        ticket = object()
+        started = time.monotonic()
+        reported = None
+        with self._cond:
+            if head:
+                self._queue.appendleft(ticket)
+            else:
+                self._queue.append(ticket)
+            try:
+                while not self._can_run(ticket):
+                    waited = time.monotonic() - started
+                    if waited >= self.queue_timeout:
+                        self._counters["queue_timeouts"] += 1
+                        raise QueueTimeout()
+                    position = self._queue.index(ticket) + 1
+                    if reported is None:
+                        self._counters["queued"] += 1
+                    if on_wait is not None and position != reported:
+                        # Report outside the lock; the position is re-checked right after
+                        self._cond.release()
+                        try:
+                            on_wait(position)
+                        finally:
+                            self._cond.acquire()
+                    reported = position
+                    self._cond.wait(WAIT_POLL_SECONDS)
+                self._in_flight += 1
+                self._counters["admitted"] += 1
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+        if reported is not None:
+            llm_metrics.observe("admission_wait", time.monotonic() - started)
+            if on_wait is not None:
+                on_wait(0)
+
+    def _release(self, throttled: bool, overloaded: bool = False) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if overloaded:
+                self._counters["overloaded"] += 1
+            if throttled:
+                self._consecutive_throttles += 1
+                self._counters["throttled"] += 1
+                self.limit = max(1.0, self.limit / 2)
+                delay = random.uniform(0, min(
+                    THROTTLE_MAX_DELAY, THROTTLE_BASE_DELAY * 2 ** (self._consecutive_throttles - 1)
+                ))
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                logger.warning(
+                    "Bedrock throttled a call: concurrency limit now %d, pausing admissions for %.1fs",
+                    int(self.limit), delay
+                )
+            else:
+                self._consecutive_throttles = 0
+                self.limit = min(float(self.max_concurrent), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def call(
+        self,
+        user_id: Optional[str],
+        fn: Callable,
+        *args,
+        on_wait: Optional[Callable[[int], None]] = None,
+        **kwargs
+    ):
+        """
+        Run fn(*args, **kwargs) once admitted
+
+        Args:
+            user_id: User the call is made for, for the per-user rate limit;
+                None for background work, which is not rate limited
+            fn: The model call
+            on_wait: Called with the caller's queue position (1 = next)
+                whenever it changes while waiting, and with 0 once admitted
+                after waiting
+
+        Returns:
+            fn's result
+
+        Raises:
+            RateLimited, QueueTimeout, Overloaded, or whatever fn raises
+            other than throttling errors
+        """
+        if user_id is not None and self.user_rate > 0:
+            with self._cond:
+                self._check_rate(user_id)
+        for attempt in range(THROTTLE_MAX_ATTEMPTS):
+            # A retried call already waited its turn
+            self._acquire(on_wait, head=attempt > 0)
+            throttled = False
+            last_attempt = attempt == THROTTLE_MAX_ATTEMPTS - 1
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling(e):
+                    raise
+                throttled = True
+                if last_attempt:
+                    raise Overloaded() from e
+            finally:
+                self._release(throttled, overloaded=throttled and last_attempt)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return dict(
+                self._counters,
+                in_flight=self._in_flight,
+                waiting=len(self._queue),
+                concurrency_limit=int(self.limit),
+                max_concurrent=self.max_concurrent,
+                paused_seconds=max(0.0, self._paused_until - time.monotonic())
+            )
+
+
+# Process-wide controller, shared by all sessions
+_controller: Optional[AdmissionController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller(settings=None) -> AdmissionController:
+    """
+    Get or create the process-wide admission controller
+
+    Args:
+        settings: Secrets-like mapping with the llm_* keys, read when the
+            controller is created
+    """
+    global _controller
+    if _controller is None:
+        settings = settings or {}
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController(
+                    max_concurrent=int(settings.get("llm_max_concurrent", DEFAULT_MAX_CONCURRENT)),
+                    user_rate_per_minute=float(settings.get("llm_user_rate_per_minute", DEFAULT_USER_RATE_PER_MINUTE)),
+                    user_burst=int(settings.get("llm_user_burst", DEFAULT_USER_BURST)),
+                    queue_timeout=float(settings.get("llm_queue_timeout_seconds", DEFAULT_QUEUE_TIMEOUT_SECONDS))
+                )
+    return _controller
@@ -0,0 +1,105 @@
+"""
+Model Call Metrics for ArchPal
+
+The model-side counterpart of storage_metrics, sharing its registry,
+per-rerun metrics and exporter:
+
+- measure / observe time Bedrock calls under component "bedrock", so a
+  turn's model time can be compared with its storage time
+- record_tokens attributes a call's token usage to the current operation:
+  input, output, and prompt cache reads and writes, plus prompt cache hits
+  (cached tokens were read) and misses (the cache had to be written)
+- record_response counts how each reply's emotion and text could be
+  parsed, so structured-output failures are visible
+
+They are exported as archpal_llm_tokens_total, archpal_llm_prompt_cache_total
+and archpal_llm_responses_total next to the operation series.
+
+This module has no Streamlit dependency.
+"""
+
+from typing import List
+
+from utils import storage_metrics
+from utils.storage_metrics import METRIC_PREFIX
+
+COMPONENT = "bedrock"
+TOKEN_KINDS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+# Outcomes of parsing a model reply (see response_stream.parse_reply)
+RESPONSE_OUTCOMES = ("structured", "recovered", "fallback")
+
+
+def measure(operation: str):
+    """Context manager timing a model call as (bedrock, operation)"""
+    return storage_metrics.measure(operation, component=COMPONENT)
+
+
+def observe(operation: str, seconds: float) -> None:
+    """Record a model-side duration measured elsewhere (e.g. time to first token)"""
+    storage_metrics.observe(operation, seconds, component=COMPONENT)
+
+
+def record_tokens(
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cache_read_tokens: int = 0,
+    cache_write_tokens: int = 0
+) -> None:
+    """
+    Attribute a model call's token usage to the current operation
+
+    A call that read cached tokens counts as a prompt cache hit; one that
+    only wrote the cache counts as a miss.
+    """
+    counts = {
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cache_read_tokens": cache_read_tokens,
+        "cache_write_tokens": cache_write_tokens
+    }
+    if cache_read_tokens:
+        counts["cache_hits"] = 1
+    elif cache_write_tokens:
+        counts["cache_misses"] = 1
+    storage_metrics.record_counts(counts, component=COMPONENT)
+
+
+def record_response(outcome: str) -> None:
+    """Count how the current operation's reply could be parsed (one of RESPONSE_OUTCOMES)"""
+    storage_metrics.record_counts({f"responses_{outcome}": 1}, component=COMPONENT)
+
+
+def _prometheus_lines(operations: List[tuple]) -> List[str]:
+    lines = [
+        f"# HELP {METRIC_PREFIX}_llm_tokens_total Tokens of model calls, by kind",
+        f"# TYPE {METRIC_PREFIX}_llm_tokens_total counter"
+    ]
+    for (component, operation), metrics in operations:
+        for kind in TOKEN_KINDS:
+            if kind in metrics.counts:
+                lines.append(
+                    f'{METRIC_PREFIX}_llm_tokens_total{{component="{component}",operation="{operation}",'
+                    f'kind="{kind[:-len("_tokens")]}"}} {metrics.counts[kind]}'
+                )
+    lines.append(f"# HELP {METRIC_PREFIX}_llm_prompt_cache_total Model calls that read or wrote the prompt cache")
+    lines.append(f"# TYPE {METRIC_PREFIX}_llm_prompt_cache_total counter")
+    for (component, operation), metrics in operations:
+        for result, kind in (("hit", "cache_hits"), ("miss", "cache_misses")):
+            if kind in metrics.counts:
+                lines.append(
+                    f'{METRIC_PREFIX}_llm_prompt_cache_total{{component="{component}",operation="{operation}",'
+                    f'result="{result}"}} {metrics.counts[kind]}'
+                )
+    lines.append(f"# HELP {METRIC_PREFIX}_llm_responses_total Model replies, by how their structure could be parsed")
+    lines.append(f"# TYPE {METRIC_PREFIX}_llm_responses_total counter")
+    for (component, operation), metrics in operations:
+        for outcome in RESPONSE_OUTCOMES:
+            if f"responses_{outcome}" in metrics.counts:
+                lines.append(
+                    f'{METRIC_PREFIX}_llm_responses_total{{component="{component}",operation="{operation}",'
+                    f'parse="{outcome}"}} {metrics.counts[f"responses_{outcome}"]}'
+                )
+    return lines
+
+
+storage_metrics.add_prometheus_section(_prometheus_lines)
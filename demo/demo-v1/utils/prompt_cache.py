@@ -0,0 +1,123 @@
+"""
+Prompt Caching for ArchPal
+
+Every turn resends the same system prompt (base text, SYSTEM_PROMPT secret
+and student info) and the conversation so far, followed by one new message.
+Anthropic models on Bedrock can cache a request prefix marked with
+cache_control breakpoints; a later request starting with the same prefix
+reads it from the cache, which is faster and billed at a fraction of the
+input price.
+
+build_messages places two breakpoints:
+
+- on the system prompt, which is identical for the whole session
+- on the newest message, so the next turn finds the whole previous request
+  (system prompt, summary and history) cached and only processes the new
+  reply and message
+
+The context window only moves when the rolling summary is updated (see
+context_window.py), so the prefix stays stable between summary updates.
+Prefixes shorter than the model's minimum (about 1024 tokens) are simply not
+cached.
+
+record_usage reads the token usage of a response (including cache reads and
+writes), records it with llm_metrics.record_tokens and logs it, so
+cache hits, misses and cached tokens are visible per turn.
+
+This module has no Streamlit dependency.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from utils import llm_metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _text_block(text: str, cache: bool = False) -> Dict:
+    block = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = dict(CACHE_CONTROL)
+    return block
+
+
+def build_messages(system_prompt: str, history: List, summary_text: str = "", enabled: bool = True) -> List:
+    """
+    Request messages: the system prompt (plus summary) and the history
+
+    Args:
+        system_prompt: System prompt text
+        history: Messages to send, oldest first (not modified)
+        summary_text: Rolling summary section to add after the system prompt
+        enabled: Place cache breakpoints; otherwise plain string content
+
+    Returns:
+        LangChain messages
+    """
+    if not enabled:
+        system = "\n\n".join(text for text in (system_prompt, summary_text) if text)
+        return [SystemMessage(content=system)] + list(history)
+
+    system_blocks = [_text_block(system_prompt, cache=True)]
+    if summary_text:
+        system_blocks.append(_text_block(summary_text))
+    messages = [SystemMessage(content=system_blocks)] + list(history)
+
+    last = history[-1] if history else None
+    if isinstance(last, HumanMessage) and isinstance(last.content, str):
+        messages[-1] = HumanMessage(content=[_text_block(last.content, cache=True)], id=last.id)
+    return messages
+
+
+def usage_from(message) -> Dict[str, int]:
+    """
+    Token usage of a response message or chunk
+
+    Returns:
+        {"input_tokens", "output_tokens", "cache_read_tokens",
+        "cache_write_tokens"}, zero where not reported
+    """
+    usage = {kind: 0 for kind in llm_metrics.TOKEN_KINDS}
+    metadata = getattr(message, "usage_metadata", None)
+    if metadata:
+        details = metadata.get("input_token_details") or {}
+        usage["input_tokens"] = metadata.get("input_tokens") or 0
+        usage["output_tokens"] = metadata.get("output_tokens") or 0
+        usage["cache_read_tokens"] = details.get("cache_read") or 0
+        usage["cache_write_tokens"] = details.get("cache_creation") or 0
+        return usage
+    # Raw Anthropic usage, as reported in the response metadata
+    raw = (getattr(message, "response_metadata", None) or {}).get("usage") or {}
+    usage["input_tokens"] = raw.get("input_tokens") or raw.get("prompt_tokens") or 0
+    usage["output_tokens"] = raw.get("output_tokens") or raw.get("completion_tokens") or 0
+    usage["cache_read_tokens"] = raw.get("cache_read_input_tokens") or 0
+    usage["cache_write_tokens"] = raw.get("cache_creation_input_tokens") or 0
+    return usage
+
+
+def add_usage(total: Optional[Dict[str, int]], usage: Dict[str, int]) -> Dict[str, int]:
+    """Sum usage dicts (e.g. over the chunks of a stream)"""
+    if total is None:
+        return dict(usage)
+    return {kind: total.get(kind, 0) + usage.get(kind, 0) for kind in llm_metrics.TOKEN_KINDS}
+
+
+def record_usage(usage: Dict[str, int]) -> None:
+    """Record a response's usage with the current operation's metrics and log it"""
+    llm_metrics.record_tokens(**usage)
+    if usage["cache_read_tokens"]:
+        outcome = "hit"
+    elif usage["cache_write_tokens"]:
+        outcome = "miss"
+    else:
+        outcome = "not used"
+    logger.info(
+        "Model usage: %d input tokens (%d read from cache, %d written to cache), %d output tokens; prompt cache %s",
+        usage["input_tokens"], usage["cache_read_tokens"], usage["cache_write_tokens"],
+        usage["output_tokens"], outcome
+    )
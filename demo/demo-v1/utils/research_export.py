@@ -0,0 +1,528 @@
+#!/usr/bin/env python3
+"""
+Research Dataset Export for ArchPal
+
+Offline exporter that walks every stored conversation under ``users/`` and
+writes the research dataset in one pass:
+
+- conversations.csv: anonymized exchanges, with the same columns as
+  data_export.create_csv_data (one row per user message / AI reply pair)
+- identifiers.csv: one row per student (first_name, last_name, unique_id),
+  the same columns as data_export.create_identifier_csv
+
+The bucket is listed with paginated ListObjectsV2 (or the equivalent on
+another storage backend) and conversations are fetched by a thread pool.
+Only a bounded window of conversations is held in memory at once, and rows
+are written in listing order as soon as the window's head is ready, so
+memory stays flat no matter how large the bucket is. Archived
+conversations (see conversation_archive) are read from their bundle, which
+is fetched once for all the conversations in it. Progress (objects
+listed, conversations and rows written, bytes read, conversations/s) is
+logged periodically and summarized at the end.
+
+With --incremental, only conversations whose stored objects changed since
+the last run are fetched, and only their new exchanges are appended (see
+export_manifest).
+
+Usage (from demo/demo-v1):
+    python -m utils.research_export --output-dir exports/
+        [--secrets .streamlit/secrets.toml] [--workers 16] [--max-in-flight 64]
+        [--prefix users/] [--progress-interval 10] [--no-anonymize] [--incremental]
+"""
+
+import argparse
+import csv
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional
+
+from utils import conversation_archive, data_export, storage_format
+from utils.export_manifest import ExportManifest
+from utils.s3_storage import build_storage_config, stitch_conversation
+from utils.storage_backends import StorageBackend, create_backend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+DEFAULT_PROGRESS_INTERVAL = 10
+# Archive bundles held in memory by a stream at once
+BUNDLE_CACHE_SIZE = 4
+
+
+@dataclass
+class ConversationJob:
+    """Keys making up one stored conversation"""
+    user_id: str
+    conversation_id: str
+    header_key: Optional[str] = None
+    segment_keys: List[str] = field(default_factory=list)
+    # Bundle key and archive index entry, for an archived conversation
+    bundle_key: Optional[str] = None
+    archived: Optional[Dict] = None
+    # (key, etag) of every listed object, for change detection
+    versions: List[tuple] = field(default_factory=list)
+
+    @property
+    def manifest_key(self) -> str:
+        return f"{self.user_id}/{self.conversation_id}"
+
+
+@dataclass
+class ExportStats:
+    objects_listed: int = 0
+    conversations: int = 0
+    # Conversations fetched (e.g. changed by compaction) that added no exchanges
+    without_new_rows: int = 0
+    rows: int = 0
+    identifiers: int = 0
+    bytes_read: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add_bytes(self, count: int) -> None:
+        with self._lock:
+            self.bytes_read += count
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return (
+            f"{self.objects_listed} objects listed, {self.conversations} conversations "
+            f"(+{self.without_new_rows} without new exchanges), "
+            f"{self.rows} rows, {self.identifiers} identifiers, "
+            f"{self.bytes_read / 1e6:.1f} MB read, {self.failed} failed in {elapsed:.1f}s "
+            f"({self.conversations / elapsed:.1f} conversations/s, {self.bytes_read / 1e6 / elapsed:.2f} MB/s)"
+        )
+
+
+def _parse_key(key: str, prefix: str) -> Optional[tuple]:
+    """
+    Classify a storage key as (kind, user_id, conversation_id)
+
+    kind is "header" for users/{uid}/conversations/{cid}.json, "segment"
+    for users/{uid}/conversations/{cid}/segments/{segment_id}.json,
+    "archive_index" for users/{uid}/archive/index.json (conversation_id None)
+    and "bundle" for users/{uid}/archive/{bundle_id}.bundle (with the bundle
+    ID in place of conversation_id); other keys return None.
+    """
+    parts = key[len(prefix):].split("/")
+    if len(parts) == 3 and parts[1] == conversation_archive.ARCHIVE_DIRECTORY:
+        if parts[2] == conversation_archive.INDEX_FILENAME:
+            return "archive_index", parts[0], None
+        if parts[2].endswith(conversation_archive.BUNDLE_SUFFIX):
+            return "bundle", parts[0], parts[2][:-len(conversation_archive.BUNDLE_SUFFIX)]
+    if len(parts) == 3 and parts[1] == "conversations" and parts[2].endswith(".json"):
+        return "header", parts[0], parts[2][:-len(".json")]
+    if len(parts) == 5 and parts[1] == "conversations" and parts[3] == "segments" and parts[4].endswith(".json"):
+        return "segment", parts[0], parts[2]
+    return None
+
+
+def iter_conversation_jobs(backend: StorageBackend, prefix: str = "users/", stats: Optional[ExportStats] = None) -> Iterator[ConversationJob]:
+    """
+    Stream conversations from a paginated listing, one user at a time
+
+    Listings are in key order, so all of a user's keys are contiguous; only
+    the current user's jobs are held while their keys are being collected.
+    A user's archive/ keys sort before their conversations/ keys, so the
+    archive index is read (one GET) before their live objects are listed.
+    """
+    current_user = None
+    jobs: Dict[str, ConversationJob] = {}
+    bundle_etags: Dict[str, str] = {}
+    for info in backend.iter_objects(prefix):
+        if stats is not None:
+            stats.objects_listed += 1
+        parsed = _parse_key(info.key, prefix)
+        if parsed is None:
+            continue
+        kind, user_id, conversation_id = parsed
+        if user_id != current_user:
+            yield from jobs.values()
+            current_user, jobs, bundle_etags = user_id, {}, {}
+        if kind == "bundle":
+            bundle_etags[conversation_id] = info.etag
+            continue
+        if kind == "archive_index":
+            index = _get_json(backend, info.key, stats) or conversation_archive.new_index()
+            for archived_id, entry in index["conversations"].items():
+                job = jobs.setdefault(archived_id, ConversationJob(user_id, archived_id))
+                job.bundle_key = f"{prefix}{user_id}/{conversation_archive.ARCHIVE_DIRECTORY}/{entry['bundle']}{conversation_archive.BUNDLE_SUFFIX}"
+                job.archived = entry
+                job.versions.append((f"{job.bundle_key}#{entry['offset']}", bundle_etags.get(entry["bundle"])))
+            continue
+        job = jobs.setdefault(conversation_id, ConversationJob(user_id, conversation_id))
+        job.versions.append((info.key, info.etag))
+        if kind == "header":
+            job.header_key = info.key
+        else:
+            job.segment_keys.append(info.key)
+    yield from jobs.values()
+
+
+def _get_json(backend: StorageBackend, key: str, stats: Optional[ExportStats] = None):
+    stored = backend.get(key)
+    if stored is None:
+        return None
+    if stats is not None:
+        stats.add_bytes(len(stored.body))
+    return storage_format.decode_json(stored.body, stored.metadata)
+
+
+def _read_archived(backend: StorageBackend, job: ConversationJob, stats: Optional[ExportStats] = None) -> Optional[Dict]:
+    """Fetch an archived conversation's record with a ranged GET"""
+    record = backend.get_range(job.bundle_key, job.archived["offset"], job.archived["length"])
+    if record is None or len(record) != job.archived["length"]:
+        return None
+    if stats is not None:
+        stats.add_bytes(len(record))
+    return conversation_archive.decode_record(record, job.archived)
+
+
+def load_conversation(
+    backend: StorageBackend,
+    job: ConversationJob,
+    stats: Optional[ExportStats] = None,
+    read_archived: Optional[Callable[[ConversationJob], Optional[Dict]]] = None
+) -> Optional[Dict]:
+    """
+    Fetch and stitch a conversation's header and segments
+
+    An archived conversation without a header of its own uses its archived
+    record as the header, fetched by read_archived if given (e.g. from a
+    cached bundle) or with a ranged GET.
+    """
+    header = _get_json(backend, job.header_key, stats) if job.header_key else None
+    if header is None and job.archived is not None:
+        header = read_archived(job) if read_archived else _read_archived(backend, job, stats)
+    segments = [_get_json(backend, key, stats) for key in sorted(job.segment_keys)]
+    # A segment deleted by compaction after listing is covered by its merged replacement
+    return stitch_conversation(header, [segment for segment in segments if segment is not None])
+
+
+class ConversationStream:
+    """
+    Iterate stored conversations in listing order, fetching them in parallel
+
+    Yields (job, user_info, conversation) tuples; conversation is None if the
+    conversation could not be read (counted in stats.failed). At most
+    max_in_flight conversations are fetched or waiting at any time.
+    """
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        prefix: str = "users/",
+        workers: int = DEFAULT_WORKERS,
+        max_in_flight: Optional[int] = None,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL,
+        stats: Optional[ExportStats] = None
+    ):
+        self.backend = backend
+        self.prefix = prefix
+        self.workers = workers
+        self.max_in_flight = max_in_flight or workers * 4
+        self.progress_interval = progress_interval
+        self.stats = stats or ExportStats()
+        # Users are listed one after another, so only the users of the
+        # conversations in the window need their info kept
+        self._user_info = OrderedDict()
+        self._user_info_lock = threading.Lock()
+        # Bundle key -> Future of its body; conversations in a bundle are
+        # listed together, so a few recent bundles cover the whole window
+        self._bundles = OrderedDict()
+        self._bundles_lock = threading.Lock()
+
+    def _get_user_info(self, user_id: str) -> Optional[Dict]:
+        """info.json for a user, fetched once"""
+        with self._user_info_lock:
+            if user_id in self._user_info:
+                return self._user_info[user_id]
+        info = _get_json(self.backend, f"{self.prefix}{user_id}/info.json", self.stats)
+        with self._user_info_lock:
+            self._user_info[user_id] = info
+            while len(self._user_info) > self.max_in_flight + 1:
+                self._user_info.popitem(last=False)
+        return info
+
+    def _read_archived(self, job: ConversationJob) -> Optional[Dict]:
+        """An archived record, out of its bundle fetched with one GET for all its conversations"""
+        with self._bundles_lock:
+            future = self._bundles.get(job.bundle_key)
+            fetch = future is None
+            if fetch:
+                future = self._bundles[job.bundle_key] = Future()
+                while len(self._bundles) > BUNDLE_CACHE_SIZE:
+                    self._bundles.popitem(last=False)
+        if fetch:
+            try:
+                stored = self.backend.get(job.bundle_key)
+                if stored is not None:
+                    self.stats.add_bytes(len(stored.body))
+                future.set_result(stored.body if stored is not None else None)
+            except Exception as e:
+                # Let the next conversation of the bundle try again
+                with self._bundles_lock:
+                    if self._bundles.get(job.bundle_key) is future:
+                        del self._bundles[job.bundle_key]
+                future.set_exception(e)
+        bundle = future.result()
+        return conversation_archive.read_record(bundle, job.archived) if bundle is not None else None
+
+    def _load(self, job: ConversationJob) -> tuple:
+        try:
+            return (
+                job,
+                self._get_user_info(job.user_id),
+                load_conversation(self.backend, job, self.stats, self._read_archived)
+            )
+        except Exception:
+            logger.exception("Could not read conversation %s of user %s", job.conversation_id, job.user_id)
+            return job, None, None
+
+    def jobs(self) -> Iterator[ConversationJob]:
+        """Conversations to fetch; override to skip some"""
+        return iter_conversation_jobs(self.backend, self.prefix, self.stats)
+
+    def __iter__(self) -> Iterator[tuple]:
+        last_report = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="archpal-export") as pool:
+            # Futures in listing order; at most max_in_flight are outstanding
+            window = deque()
+            for job in self.jobs():
+                window.append(pool.submit(self._load, job))
+                while len(window) >= self.max_in_flight or (window and window[0].done()):
+                    yield self._finish(window.popleft().result())
+                if time.monotonic() - last_report >= self.progress_interval:
+                    logger.info("Export progress: %s", self.stats.summary())
+                    last_report = time.monotonic()
+            while window:
+                yield self._finish(window.popleft().result())
+
+    def _finish(self, result: tuple) -> tuple:
+        if result[2] is None:
+            self.stats.failed += 1
+        return result
+
+
+class IncrementalConversationStream(ConversationStream):
+    """
+    ConversationStream that skips conversations the manifest says are
+    unchanged
+
+    Yields (job, user_info, conversation, start), where start is the index
+    of the first message not exported yet. With an empty manifest every
+    conversation is yielded with start 0.
+    """
+
+    def __init__(self, *args, manifest: ExportManifest, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.manifest = manifest
+        self.skipped = 0
+        self.watermark = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+    def jobs(self) -> Iterator[ConversationJob]:
+        for job in super().jobs():
+            if self.manifest.unchanged(job):
+                self.skipped += 1
+                continue
+            yield job
+
+    def __iter__(self) -> Iterator[tuple]:
+        for job, user_info, conversation in super().__iter__():
+            if conversation is None:
+                yield job, user_info, None, 0
+                continue
+            yield job, user_info, conversation, self.manifest.new_messages_start(job, conversation.get("messages", []))
+
+
+class ResearchExporter:
+    """Streams conversations from a storage backend into the research CSVs"""
+
+    def __init__(
+        self,
+        backend: StorageBackend,
+        output_dir: str,
+        workers: int = DEFAULT_WORKERS,
+        max_in_flight: Optional[int] = None,
+        anonymize: bool = True,
+        progress_interval: float = DEFAULT_PROGRESS_INTERVAL
+    ):
+        self.backend = backend
+        self.output_dir = output_dir
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self.anonymize = anonymize
+        self.progress_interval = progress_interval
+        self.stats = ExportStats()
+
+    def _write(self, result: tuple, conversation_writer, identifier_writer, identified: set,
+               manifest: ExportManifest) -> None:
+        job, user_info, conversation, start = result
+        if conversation is None:
+            return
+        user_info = user_info or {}
+        metadata = conversation.get("metadata") or {}
+        unique_id = metadata.get("unique_identifier") or user_info.get("unique_identifier", "")
+        messages = conversation.get("messages", [])
+        # A trailing user message has no reply yet; leave it for the next run
+        exported_through = len(messages)
+        if exported_through > start and messages[-1].get("role") == "user":
+            exported_through -= 1
+        rows = data_export.conversation_csv_rows(
+            data_export.build_message_log(messages[start:exported_through]),
+            unique_id,
+            metadata.get("college_year") or user_info.get("college_year", ""),
+            metadata.get("major") or user_info.get("major", ""),
+            user_info.get("first_name", ""),
+            anonymize=self.anonymize
+        )
+        written = 0
+        for row in rows:
+            conversation_writer.writerow(row)
+            written += 1
+        self.stats.rows += written
+        if written:
+            self.stats.conversations += 1
+        else:
+            self.stats.without_new_rows += 1
+        # Recorded either way: the new fingerprint lets the next run skip it
+        manifest.record(job, messages, exported_through)
+
+        if user_info and unique_id and unique_id not in identified:
+            identified.add(unique_id)
+            identifier_writer.writerow([user_info.get("first_name", ""), user_info.get("last_name", ""), unique_id])
+            self.stats.identifiers += 1
+
+    def _resume(self, manifest: ExportManifest, paths: List[str]) -> bool:
+        """
+        Prepare the CSVs for appending to the last successful run
+
+        Rows appended by a run that crashed before saving the manifest are
+        cut off again. Returns False if there is nothing to append to.
+        """
+        if not manifest.runs or not all(os.path.exists(path) for path in paths):
+            return False
+        last_run = manifest.runs[-1]
+        for path, size_key in zip(paths, ("conversations_bytes", "identifiers_bytes")):
+            with open(path, "r+b") as f:
+                f.truncate(last_run[size_key])
+        return True
+
+    def run(self, prefix: str = "users/", incremental: bool = False) -> ExportStats:
+        """
+        Export everything under prefix; returns the final statistics
+
+        With incremental=True, rows are appended for the conversations and
+        messages added since the last run recorded in the output directory's
+        manifest; otherwise the CSVs are rewritten from scratch.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        conversations_path = os.path.join(self.output_dir, "conversations.csv")
+        identifiers_path = os.path.join(self.output_dir, "identifiers.csv")
+        manifest = ExportManifest.load(self.output_dir)
+        appending = incremental and self._resume(manifest, [conversations_path, identifiers_path])
+        if not appending:
+            manifest = ExportManifest(manifest.path)
+        identified = set(manifest.data.setdefault("identifiers", []))
+        stream = IncrementalConversationStream(
+            self.backend, prefix, self.workers, self.max_in_flight, self.progress_interval, self.stats,
+            manifest=manifest
+        )
+
+        mode = "a" if appending else "w"
+        with open(conversations_path, mode, newline="", encoding="utf-8") as conversations_file, \
+                open(identifiers_path, mode, newline="", encoding="utf-8") as identifiers_file:
+            conversation_writer = csv.writer(conversations_file)
+            identifier_writer = csv.writer(identifiers_file)
+            if not appending:
+                conversation_writer.writerow(data_export.CONVERSATION_CSV_HEADER)
+                identifier_writer.writerow(data_export.IDENTIFIER_CSV_HEADER)
+            for result in stream:
+                self._write(result, conversation_writer, identifier_writer, identified, manifest)
+            conversations_file.flush()
+            identifiers_file.flush()
+            os.fsync(conversations_file.fileno())
+            os.fsync(identifiers_file.fileno())
+            run = {
+                "run_id": stream.watermark,
+                "conversations_bytes": conversations_file.tell(),
+                "identifiers_bytes": identifiers_file.tell()
+            }
+
+        manifest.data["identifiers"] = sorted(identified)
+        manifest.finish_run(run, stream.watermark)
+        logger.info("Export finished: %s (%d unchanged conversations skipped)", self.stats.summary(), stream.skipped)
+        return self.stats
+
+
+def load_settings(path: str) -> Dict:
+    """Read a Streamlit secrets.toml file (missing file -> empty settings)"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    except ImportError:
+        import toml
+        return toml.load(path)
+
+
+def add_storage_arguments(parser: argparse.ArgumentParser) -> None:
+    """Command line options shared by the offline export tools"""
+    parser.add_argument("--secrets", default=os.path.join(".streamlit", "secrets.toml"),
+                        help="secrets.toml with the storage settings (default: .streamlit/secrets.toml)")
+    parser.add_argument("--backend", help="Override storage_backend from secrets (s3, local, sqlite)")
+    parser.add_argument("--bucket", help="Override s3_bucket_name from secrets")
+    parser.add_argument("--prefix", default="users/", help="Key prefix to export (default: users/)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent GETs")
+    parser.add_argument("--max-in-flight", type=int, help="Conversations held in memory at once (default: 4 x workers)")
+    parser.add_argument("--progress-interval", type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help="Seconds between progress reports")
+
+
+def backend_from_args(args: argparse.Namespace) -> StorageBackend:
+    """Build the storage backend described by secrets plus command line overrides"""
+    settings = dict(load_settings(args.secrets))
+    if args.backend:
+        settings["storage_backend"] = args.backend
+    if args.bucket:
+        settings["s3_bucket_name"] = args.bucket
+    config = build_storage_config(settings)
+    # Every worker needs its own pooled connection
+    config["max_pool_connections"] = max(config["max_pool_connections"], args.workers)
+    return create_backend(config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", required=True, help="Directory for conversations.csv and identifiers.csv")
+    add_storage_arguments(parser)
+    parser.add_argument("--no-anonymize", action="store_true", help="Keep first names in message text")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only append conversations and messages added since the last run")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    exporter = ResearchExporter(
+        backend_from_args(args),
+        args.output_dir,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        anonymize=not args.no_anonymize,
+        progress_interval=args.progress_interval
+    )
+    stats = exporter.run(args.prefix, incremental=args.incremental)
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
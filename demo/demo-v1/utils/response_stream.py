@@ -0,0 +1,300 @@
+"""
+Streaming Chat Responses for ArchPal
+
+With structured output (ArchPalResponse) nothing can be shown until the
+whole reply has been generated. In streaming mode the model is instead asked
+to open its reply with an emotion tag and write the response as plain text
+after it:
+
+    <emotion>smile</emotion>Great question! Let's look at your thesis...
+
+EmotionTagParser takes the tag off the front of the stream as soon as it is
+complete, so the avatar image can be chosen before the text starts, and
+passes everything after it through as display text. A reply that does not
+start with a valid tag is shown whole with the default emotion.
+
+ReplyStream wraps a LangChain chat model's stream(), yields display text as
+it arrives, and records the time to first token (logged, and observed as
+the bedrock "stream_first_token" metric) and the reply's token usage.
+
+Without streaming, the reply is requested as structured output
+(ArchPalResponse). parse_reply reads emotion and text from that single
+response even when it does not validate: from the tool call's arguments,
+from (partial) JSON or an emotion tag in the text, or else as plain text
+with the default emotion; a reply with no text at all becomes
+EMPTY_REPLY_TEXT. The model is never asked twice.
+
+Both paths count how each reply could be parsed with
+llm_metrics.record_response: "structured" (as asked), "recovered"
+(malformed, but the text and possibly the emotion were recovered) or
+"fallback" (plain text, default emotion). The app stores the outcome with
+the reply (metadata "parse"), so exports can tell EMPTY_REPLY_TEXT apart
+from what the model actually said (is_empty_reply).
+
+This module has no Streamlit dependency.
+"""
+
+import json
+import logging
+import re
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils import llm_metrics, prompt_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMOTION = "default"
+EMOTION_OPEN_TAG = "<emotion>"
+EMOTION_CLOSE_TAG = "</emotion>"
+# Give up waiting for a closing tag after this many characters
+MAX_TAG_PREFIX = 64
+# Shown when a structured reply carries no text at all
+EMPTY_REPLY_TEXT = "Sorry, I lost my train of thought there. Could you say that again?"
+
+
+def emotion_tag_instructions(valid_emotions: Iterable[str]) -> str:
+    """System prompt addition asking for the streaming reply format"""
+    return (
+        "Response format: begin every reply with an emotion tag naming the emotion that best "
+        f"matches your tone, e.g. {EMOTION_OPEN_TAG}smile{EMOTION_CLOSE_TAG}, then write your "
+        "reply to the student as plain text. Use exactly one of: "
+        + ", ".join(valid_emotions)
+        + ". Do not mention the tag or use it anywhere else."
+    )
+
+
+class EmotionTagParser:
+    """
+    Incrementally split an emotion tag off the start of streamed text
+
+    Args:
+        valid_emotions: Emotions the tag may name; others become the default
+        default: Emotion used when there is no valid tag
+    """
+
+    def __init__(self, valid_emotions: Iterable[str], default: str = DEFAULT_EMOTION):
+        self.valid_emotions = set(valid_emotions)
+        self.default = default
+        self.emotion: Optional[str] = None
+        # llm_metrics.RESPONSE_OUTCOMES value, once decided
+        self.outcome: Optional[str] = None
+        self._buffer = ""
+        # Whitespace between the tag and the reply is not part of the reply
+        self._after_tag = False
+
+    @property
+    def decided(self) -> bool:
+        """Whether the emotion is known (from the tag, or because there is none)"""
+        return self.emotion is not None
+
+    def feed(self, text: str) -> str:
+        """Add streamed text; returns the display text that can be shown now"""
+        if self.decided:
+            return self._reply_text(text)
+        self._buffer += text
+        head = self._buffer.lstrip()
+        if not head:
+            return ""
+        if not (head.startswith(EMOTION_OPEN_TAG) or EMOTION_OPEN_TAG.startswith(head)):
+            return self._give_up()
+        end = head.find(EMOTION_CLOSE_TAG)
+        if end == -1:
+            return self._give_up() if len(head) > MAX_TAG_PREFIX else ""
+        name = head[len(EMOTION_OPEN_TAG):end].strip().lower()
+        self.emotion = name if name in self.valid_emotions else self.default
+        self.outcome = "structured" if name in self.valid_emotions else "recovered"
+        self._buffer = ""
+        self._after_tag = True
+        return self._reply_text(head[end + len(EMOTION_CLOSE_TAG):])
+
+    def finish(self) -> str:
+        """End of stream; returns any text still held back"""
+        if self.decided:
+            return ""
+        return self._give_up()
+
+    def _reply_text(self, text: str) -> str:
+        if self._after_tag:
+            text = text.lstrip()
+            self._after_tag = not text
+        return text
+
+    def _give_up(self) -> str:
+        self.emotion = self.default
+        self.outcome = "fallback"
+        text, self._buffer = self._buffer, ""
+        return text
+
+
+def chunk_text(chunk) -> str:
+    """Text of a streamed message chunk (string content or Anthropic content blocks)"""
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else block.get("text", "")
+            for block in content
+            if isinstance(block, str) or block.get("type", "text") in ("text", "text_delta")
+        )
+    return ""
+
+
+class ReplyStream:
+    """
+    Iterate the display text of a streamed chat reply
+
+    After iteration, emotion and text hold the parsed reply,
+    first_token_seconds / total_seconds its timing, and usage its token
+    usage (see prompt_cache.usage_from).
+
+    Args:
+        chat: LangChain chat model (e.g. ChatBedrock)
+        messages: Messages to send
+        valid_emotions: Emotions the reply's tag may name
+    """
+
+    def __init__(self, chat, messages: List, valid_emotions: Iterable[str]):
+        self.chat = chat
+        self.messages = messages
+        self.parser = EmotionTagParser(valid_emotions)
+        self.text = ""
+        self.first_token_seconds: Optional[float] = None
+        self.total_seconds: Optional[float] = None
+        self.usage: Optional[Dict[str, int]] = None
+
+    @property
+    def emotion(self) -> Optional[str]:
+        """The reply's emotion, once known"""
+        return self.parser.emotion
+
+    def __iter__(self) -> Iterator[str]:
+        started = time.perf_counter()
+        with llm_metrics.measure("stream"):
+            for chunk in self.chat.stream(self.messages):
+                # Usage arrives in pieces, typically with the first and last chunks
+                self.usage = prompt_cache.add_usage(self.usage, prompt_cache.usage_from(chunk))
+                text = chunk_text(chunk)
+                if not text:
+                    continue
+                if self.first_token_seconds is None:
+                    self.first_token_seconds = time.perf_counter() - started
+                    llm_metrics.observe("stream_first_token", self.first_token_seconds)
+                    logger.info("Time to first token: %.3fs", self.first_token_seconds)
+                display = self.parser.feed(text)
+                if display:
+                    self.text += display
+                    yield display
+            display = self.parser.finish()
+            if display:
+                self.text += display
+                yield display
+            if self.usage is not None:
+                prompt_cache.record_usage(self.usage)
+            llm_metrics.record_response(self.parser.outcome)
+        self.total_seconds = time.perf_counter() - started
+        logger.info(
+            "Streamed reply: %d characters in %.3fs (first token after %s)",
+            len(self.text), self.total_seconds,
+            f"{self.first_token_seconds:.3f}s" if self.first_token_seconds is not None else "n/a"
+        )
+
+
+# "field": "string value", where the value may be cut off
+_JSON_STRING_FIELD = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)'
+
+
+def _json_string_field(text: str, field: str) -> Optional[str]:
+    """Value of a string field in possibly malformed or truncated JSON text"""
+    match = re.search(_JSON_STRING_FIELD.format(re.escape(field)), text, re.DOTALL)
+    if not match:
+        return None
+    # Drop a \uXXXX escape cut off by truncation
+    value = re.sub(r"\\u[0-9a-fA-F]{0,3}$", "", match.group(1))
+    try:
+        return json.loads(f'"{value}"')
+    except json.JSONDecodeError:
+        return value
+
+
+def _fields_from_text(text: str) -> Optional[Dict]:
+    """emotion and response_text from JSON embedded in text, tolerating damage"""
+    start = text.find("{")
+    if start == -1:
+        return None
+    end = text.rfind("}")
+    if end > start:
+        try:
+            data = json.loads(text[start:end + 1])
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+    fields = {
+        field: value for field in ("emotion", "response_text")
+        if (value := _json_string_field(text[start:], field)) is not None
+    }
+    return fields or None
+
+
+def _tool_arguments(raw) -> Optional[Dict]:
+    """Arguments of the structured-output tool call in a raw response"""
+    for call in getattr(raw, "tool_calls", None) or []:
+        if isinstance(call.get("args"), dict) and call["args"]:
+            return call["args"]
+    content = getattr(raw, "content", None)
+    for block in content if isinstance(content, list) else []:
+        if isinstance(block, dict) and block.get("type") == "tool_use":
+            arguments = block.get("input")
+            if isinstance(arguments, dict) and arguments:
+                return arguments
+            if isinstance(arguments, str) or block.get("partial_json"):
+                return _fields_from_text(arguments if isinstance(arguments, str) else block["partial_json"])
+    return None
+
+
+def parse_reply(result: Dict, valid_emotions: Iterable[str], default: str = DEFAULT_EMOTION) -> Tuple[str, str, str]:
+    """
+    Emotion and text of a structured-output reply, however malformed
+
+    Args:
+        result: Result of a structured runnable with include_raw=True:
+            {"raw": AIMessage, "parsed": ArchPalResponse or None, "parsing_error": ...}
+        valid_emotions: Emotions the reply may name
+        default: Emotion used when none can be recovered
+
+    Returns:
+        (emotion, text, outcome), outcome being one of
+        llm_metrics.RESPONSE_OUTCOMES
+    """
+    parsed = result.get("parsed")
+    if parsed is not None:
+        return parsed.emotion, parsed.response_text, "structured"
+
+    valid_emotions = set(valid_emotions)
+    raw = result.get("raw")
+    logger.warning("Structured output did not validate, recovering from the raw reply: %s", result.get("parsing_error"))
+
+    text = chunk_text(raw) if raw is not None else ""
+    fields = _tool_arguments(raw) or _fields_from_text(text) or {}
+    emotion = str(fields.get("emotion") or "").strip().lower()
+    emotion = emotion if emotion in valid_emotions else None
+    response_text = fields.get("response_text")
+    if isinstance(response_text, str) and response_text.strip():
+        return emotion or default, response_text, "recovered"
+
+    parser = EmotionTagParser(valid_emotions, default)
+    display = parser.feed(text) + parser.finish()
+    tagged = parser.outcome != "fallback"
+    if tagged and display.strip():
+        return parser.emotion, display, "recovered"
+    if not tagged and text.strip():
+        # e.g. a tool call with only the emotion, next to the reply as plain text
+        return emotion or default, text.strip(), "recovered" if emotion else "fallback"
+    return emotion or parser.emotion, EMPTY_REPLY_TEXT, "fallback"
+
+
+def is_empty_reply(text: str, outcome: Optional[str]) -> bool:
+    """Whether a reply is the EMPTY_REPLY_TEXT stand-in rather than model output"""
+    return outcome == "fallback" and text == EMPTY_REPLY_TEXT
@@ -12,67 +12,537 @@ s3://bucket-name/
 │   ├── {cognito_user_id}/
 │   │   ├── info.json
 │   │   ├── conversations.json
+│   │   ├── search_index.json
+│   │   ├── search_index/
+│   │   │   └── {delta_id}.json
+│   │   ├── history/
+│   │   │   └── {page_id}.json
+│   │   ├── archive/
+│   │   │   ├── index.json
+│   │   │   └── {bundle_id}.bundle
 │   │   └── conversations/
 │   │       ├── {conversation_id}.json
-│   │       └── {conversation_id}.json
+│   │       └── {conversation_id}/
+│   │           └── segments/
+│   │               ├── {segment_id}.json
+│   │               └── {segment_id}.json
 
-AWS Configuration Required:
+Conversations are append-only: {conversation_id}.json is a header holding
+conversation metadata (and the inline messages of conversations written
+before segments existed), and each append writes a small new segment object
+instead of rewriting the whole conversation. Segment IDs sort chronologically,
+so the read path stitches header messages plus segments back together in
+order. A background compaction step merges runs of small segments into
+larger ones so reads stay cheap. The header also holds the conversation's
+rolling context summary (save_context_summary, see context_window.py).
+
+conversations.json is the head of the history index: the most recent
+entries, kept sorted newest first. Older entries are spilled into immutable
+pages under history/, so the sidebar reads a bounded amount of data no
+matter how many conversations a user has, and get_conversation_history_page
+walks further back with a cursor. Legacy indexes (a plain list) are still
+read and are converted on their next update.
+
+search_index.json is a per-user full-text index of the user's conversations
+(see search_index.py). Every segment write also writes a small delta under
+search_index/ with the segment's term counts, so indexing never rewrites the
+index object on the chat path. search_conversations reads the index plus
+the outstanding deltas (one GET, usually served from cache, and one LIST),
+and folds the deltas into search_index.json in the background once there
+are SEARCH_MERGE_THRESHOLD of them. Conversations stored before the index
+existed are indexed by a background rebuild the first time the user
+searches.
+
+Conversations idle for a number of days can be archived: packed into a
+per-user bundle under archive/ and their header and segments deleted (see
+conversation_archive.py). Archived conversations stay readable through the
+same functions; the archived record is read with a ranged GET and takes the
+place of the header, so a resumed archived conversation simply gets new
+segments.
+
+Storage Backend (secrets.toml):
+- storage_backend: "s3" (default), "local", "sqlite" or "memory". The same
+  key layout is used on every backend; see storage_backends.py.
+- storage_local_path: Root directory for the local backend (default: data/storage)
+- storage_sqlite_path: Database file for the sqlite backend
+  (default: data/archpal.sqlite3)
+- storage_hot_tier: Keep active conversations in a local SQLite hot tier in
+  front of the backend (default: false); see tiered_storage.py
+- storage_hot_tier_path: SQLite file for the hot tier (default: data/hot_tier.sqlite3)
+- storage_hot_tier_idle_seconds: Demote conversations idle this long (default: 3600)
+- storage_archive_after_days: Archive a user's conversations idle this many
+  days, in the background after their history is loaded (default: 0, off;
+  python -m utils.conversation_archive does the same offline)
+
+AWS Configuration Required (s3 backend):
 - s3_bucket_name: Name of your S3 bucket (set in secrets.toml)
 - s3_region: AWS region where bucket is located (set in secrets.toml)
 - aws_access_key_id: AWS access key (set in secrets.toml)
 - aws_secret_access_key: AWS secret key (set in secrets.toml)
+
+Optional Tuning (secrets.toml):
+- s3_max_pool_connections: Size of the shared HTTP connection pool (default: 50)
+- s3_connect_timeout: Connect timeout in seconds (default: 5)
+- s3_read_timeout: Read timeout in seconds (default: 30)
+- s3_tcp_keepalive: Enable TCP keep-alive on pooled connections (default: true)
+- s3_cache_max_entries: Objects kept in the read-through cache (default: 1024)
+- s3_cache_max_bytes: Total bytes kept in the read-through cache (default: 64 MB)
+- s3_cache_ttl_seconds: How long a cached object is kept at all (default: 300)
+- s3_cache_fresh_seconds: How long a cached object is served without
+  revalidating it against S3 (default: 5)
+- s3_storage_format: Wire format for new objects, 1 (pretty JSON) or 2
+  (minified, gzip-compressed JSON; default). See storage_format.py.
+- s3_gzip_level: gzip compression level for format 2 (default: 6)
+- s3_deadline_get_seconds / s3_deadline_put_seconds / s3_deadline_list_seconds /
+  s3_deadline_delete_seconds: Overall time budget per operation, including
+  retries (defaults: 10 / 15 / 30 / 30; 0 disables)
+- s3_retry_max_attempts: Attempts per operation for transient errors (default: 4)
+- s3_retry_base_delay / s3_retry_max_delay: Jittered backoff bounds in
+  seconds (defaults: 0.05 / 2)
+- s3_retry_budget: Retry token bucket size shared by all operations (default: 100)
+- s3_hedge_percentile: Send a duplicate GET once a GET has been outstanding
+  longer than this percentile of recent GET latencies (default: 95; 0 disables)
+- s3_hedge_min_delay: Never hedge earlier than this many seconds (default: 0.05)
+- s3_circuit_failure_threshold: Consecutive failures that open the circuit
+  breaker (default: 5; 0 disables)
+- s3_circuit_reset_seconds: How long the breaker stays open before a probe
+  (default: 30)
+- s3_profile_cache_max_entries: User profiles (info.json) kept in the
+  profile cache (default: 4096)
+- s3_profile_cache_ttl_seconds: How long a cached profile is served without
+  contacting S3 (default: 600)
+- s3_cache_stale_seconds: How long past its TTL a cached object may still be
+  served while storage is failing (default: 3600)
+
+The backend (for S3, the client) and configuration are resolved once per
+process and shared by every Streamlit session, so concurrent users reuse warm
+pooled connections instead of each building their own client. Errors are
+logged, and also shown with st.error when running inside Streamlit. Reads go
+through a per-process cache keyed by S3 key: a recently fetched object is
+served from memory, an older one is revalidated with a conditional GET
+(If-None-Match on its ETag) and costs a 304 when unchanged, and the module's
+own writes update the cache in place.
+
+User profiles (info.json) additionally have their own process-wide cache
+keyed by Cognito user ID, which save_user_info writes through to. A profile
+is served from it for s3_profile_cache_ttl_seconds without any request, so
+new tabs and repeat logins of the same student render without an S3 round
+trip. Profiles are only changed through save_user_info, so the one risk is
+an edit made by another app process, which shows up once the entry expires.
+
+Every backend call goes through storage_resilience.ResilientBackend:
+per-operation deadlines, jittered retries limited by a retry budget, hedged
+GETs for tail latency, and a circuit breaker. When a read fails (or the
+breaker is open) and the object is cached, the cached copy is served even if
+it is stale, so a struggling store shows slightly old data instead of an
+error. The counters are part of get_storage_stats()["resilience"].
+
+With storage_hot_tier enabled, conversations being written live in a local
+SQLite hot tier (tiered_storage.TieredBackend) and are synced to the backend
+asynchronously; resuming a conversation from the sidebar promotes it back
+into the hot tier in the background. Only the backend (cold tier) calls go
+through ResilientBackend.
+
+Public operations are instrumented with storage_metrics (calls, errors,
+latency histograms and bytes per operation, process-wide and per rerun).
+
+Shared read-modify-write objects (conversations.json) are updated with
+optimistic concurrency: the PUT is conditional on the ETag that was read
+(If-Match, or If-None-Match: * for a new object), and on a conflict the
+object is re-read, the change re-applied and the write retried. Sessions of
+the same user can therefore update the index in parallel without locks and
+without silently overwriting each other.
 """
 
 import streamlit as st
-import boto3
+import copy
 import json
+import logging
+import threading
 import uuid
-from datetime import datetime
+import time
+import random
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, List
 from botocore.exceptions import ClientError, NoCredentialsError
 
+from utils import conversation_archive, search_index, storage_format, storage_metrics, storage_resilience, tiered_storage
+from utils.storage_backends import StorageBackend, NotModified, PreconditionFailed, create_backend
+from utils.storage_metrics import instrument
+from utils.storage_resilience import ResilientBackend
+from utils.tiered_storage import TieredBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_CACHE_MAX_ENTRIES = 1024
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_TTL_SECONDS = 300
+DEFAULT_CACHE_FRESH_SECONDS = 5
+DEFAULT_CACHE_STALE_SECONDS = 3600
+DEFAULT_PROFILE_CACHE_MAX_ENTRIES = 4096
+DEFAULT_PROFILE_CACHE_TTL_SECONDS = 600
+DEFAULT_LOCAL_PATH = "data/storage"
+DEFAULT_SQLITE_PATH = "data/archpal.sqlite3"
+
+# Optimistic concurrency for read-modify-write objects
+CONDITIONAL_WRITE_MAX_ATTEMPTS = 8
+CONDITIONAL_WRITE_BACKOFF_SECONDS = 0.05
+
+# The history index head keeps this many of the newest entries, and spills
+# the rest into an older page once it grows past HISTORY_HEAD_MAX
+HISTORY_HEAD_SIZE = 50
+HISTORY_HEAD_MAX = 100
+HISTORY_INDEX_VERSION = 2
+
+# Compact a conversation once it has this many segments...
+SEGMENT_COMPACTION_THRESHOLD = 16
+# ...merging runs of segments into segments of up to this many messages
+SEGMENT_TARGET_MESSAGES = 100
+
+# Messages returned by get_conversation_tail when resuming a conversation
+DEFAULT_TAIL_MESSAGES = 20
+
+# Fold search index deltas into search_index.json once there are this many
+SEARCH_MERGE_THRESHOLD = 32
+# Users whose parsed search index is kept in memory
+SEARCH_CACHE_MAX_ENTRIES = 256
+
+# Look for conversations to archive at most this often per user and process
+ARCHIVE_CHECK_INTERVAL_SECONDS = 6 * 3600
+
+# Process-wide storage state, shared by all sessions
+_config_cache = None
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def build_storage_config(settings) -> Dict:
+    """
+    Build the storage configuration from a secrets-like mapping
+
+    Offline tools and benchmarks can pass a plain dict; missing keys take
+    their defaults.
+    """
+    return {
+        "backend": settings.get("storage_backend", "s3"),
+        "local_path": settings.get("storage_local_path", DEFAULT_LOCAL_PATH),
+        "sqlite_path": settings.get("storage_sqlite_path", DEFAULT_SQLITE_PATH),
+        "bucket_name": settings.get("s3_bucket_name"),
+        "region": settings.get("s3_region", "us-east-1"),
+        "access_key_id": settings.get("aws_access_key_id"),
+        "secret_access_key": settings.get("aws_secret_access_key"),
+        "max_pool_connections": int(settings.get("s3_max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS)),
+        "connect_timeout": float(settings.get("s3_connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+        "read_timeout": float(settings.get("s3_read_timeout", DEFAULT_READ_TIMEOUT)),
+        "tcp_keepalive": bool(settings.get("s3_tcp_keepalive", True)),
+        "cache_max_entries": int(settings.get("s3_cache_max_entries", DEFAULT_CACHE_MAX_ENTRIES)),
+        "cache_max_bytes": int(settings.get("s3_cache_max_bytes", DEFAULT_CACHE_MAX_BYTES)),
+        "cache_ttl_seconds": float(settings.get("s3_cache_ttl_seconds", DEFAULT_CACHE_TTL_SECONDS)),
+        "cache_fresh_seconds": float(settings.get("s3_cache_fresh_seconds", DEFAULT_CACHE_FRESH_SECONDS)),
+        "storage_format": int(settings.get("s3_storage_format", storage_format.DEFAULT_FORMAT)),
+        "gzip_level": int(settings.get("s3_gzip_level", storage_format.DEFAULT_GZIP_LEVEL)),
+        "cache_stale_seconds": float(settings.get("s3_cache_stale_seconds", DEFAULT_CACHE_STALE_SECONDS)),
+        "profile_cache_max_entries": int(settings.get("s3_profile_cache_max_entries", DEFAULT_PROFILE_CACHE_MAX_ENTRIES)),
+        "hot_tier": str(settings.get("storage_hot_tier", False)).lower() in ("true", "1", "yes"),
+        "hot_tier_path": settings.get("storage_hot_tier_path", tiered_storage.DEFAULT_HOT_TIER_PATH),
+        "hot_tier_idle_seconds": float(settings.get("storage_hot_tier_idle_seconds", tiered_storage.DEFAULT_IDLE_SECONDS)),
+        "archive_after_days": float(settings.get("storage_archive_after_days", 0)),
+        "profile_cache_ttl_seconds": float(settings.get("s3_profile_cache_ttl_seconds", DEFAULT_PROFILE_CACHE_TTL_SECONDS)),
+        "deadlines": {
+            operation: float(settings.get(f"s3_deadline_{operation}_seconds", default))
+            for operation, default in storage_resilience.DEFAULT_DEADLINES.items()
+        },
+        "retry_max_attempts": int(settings.get("s3_retry_max_attempts", storage_resilience.DEFAULT_RETRY_MAX_ATTEMPTS)),
+        "retry_base_delay": float(settings.get("s3_retry_base_delay", storage_resilience.DEFAULT_RETRY_BASE_DELAY)),
+        "retry_max_delay": float(settings.get("s3_retry_max_delay", storage_resilience.DEFAULT_RETRY_MAX_DELAY)),
+        "retry_budget": int(settings.get("s3_retry_budget", storage_resilience.DEFAULT_RETRY_BUDGET)),
+        "hedge_percentile": float(settings.get("s3_hedge_percentile", storage_resilience.DEFAULT_HEDGE_PERCENTILE)),
+        "hedge_min_delay": float(settings.get("s3_hedge_min_delay", storage_resilience.DEFAULT_HEDGE_MIN_DELAY)),
+        "circuit_failure_threshold": int(settings.get(
+            "s3_circuit_failure_threshold", storage_resilience.DEFAULT_CIRCUIT_FAILURE_THRESHOLD
+        )),
+        "circuit_reset_seconds": float(settings.get(
+            "s3_circuit_reset_seconds", storage_resilience.DEFAULT_CIRCUIT_RESET_SECONDS
+        ))
+    }
+
 
 def get_s3_config():
-    """Get S3 configuration from secrets"""
+    """Get storage configuration from secrets (resolved once per process)"""
+    global _config_cache
+    if _config_cache is not None:
+        return _config_cache
+
     try:
-        secrets = st.secrets
-        return {
-            "bucket_name": secrets.get("s3_bucket_name"),
-            "region": secrets.get("s3_region", "us-east-1"),
-            "access_key_id": secrets.get("aws_access_key_id"),
-            "secret_access_key": secrets.get("aws_secret_access_key")
-        }
+        config = build_storage_config(st.secrets)
     except Exception as e:
-        st.error(f"Error loading S3 configuration: {str(e)}")
+        _report_error(f"Error loading S3 configuration: {str(e)}")
         return None
 
+    _config_cache = config
+    return config
 
-def get_s3_client():
-    """Get or create cached S3 client"""
-    if "s3_client" not in st.session_state or st.session_state["s3_client"] is None:
-        config = get_s3_config()
-        if not config or not config["bucket_name"]:
-            return None
-        
-        try:
-            # Create S3 client with credentials from secrets
-            # If access keys are not provided, boto3 will use IAM role (for EC2/ECS/Lambda)
-            s3_client = boto3.client(
-                's3',
-                region_name=config["region"],
-                aws_access_key_id=config.get("access_key_id") or None,
-                aws_secret_access_key=config.get("secret_access_key") or None
-            )
-            st.session_state["s3_client"] = s3_client
-            return s3_client
-        except NoCredentialsError:
-            st.error("AWS credentials not found. Please configure in secrets.toml")
-            return None
-        except Exception as e:
-            st.error(f"Error creating S3 client: {str(e)}")
-            return None
+
+def _report_error(message: str) -> None:
+    """Log a storage error and, inside a Streamlit run, show it to the user"""
+    logger.error(message)
+    storage_metrics.record_error()
+    if st.runtime.exists():
+        st.error(message)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after a fixed TTL.
     
-    return st.session_state.get("s3_client")
+    Bounded by entry count and by the total ``size`` reported for entries,
+    evicting least recently used entries first. Expired entries are kept for
+    another ``stale_seconds`` so get_stale() can still return them.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_size: Optional[int] = None,
+                 stale_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (value, age_seconds) or None if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] > self.ttl_seconds:
+                if entry is not None and now - entry[1] > self.ttl_seconds + self.stale_seconds:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], now - entry[1]
+
+    def get_stale(self, key):
+        """Like get, but also returns expired entries still within stale_seconds"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] > self.ttl_seconds + self.stale_seconds:
+                return None
+            return entry[0], now - entry[1]
+
+    def put(self, key, value, size: int = 1) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic(), size)
+            self._size += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_size is not None and self._size > self.max_size)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def touch(self, key) -> None:
+        """Restart an entry's TTL (e.g. after it was revalidated)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = (entry[0], time.monotonic(), entry[2])
+                self._entries.move_to_end(key)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key) -> None:
+        self._size -= self._entries.pop(key)[2]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+class StorageRuntime:
+    """
+    Process-wide storage backend plus connection pool bookkeeping.
+
+    The backend (and, for S3, its thread-safe botocore client and urllib3
+    connection pool) is shared by every session. Requests are counted while
+    in flight so pool saturation is visible: a request that starts while
+    ``max_pool_connections`` requests are already running has to wait for a
+    free connection.
+    """
+
+    def __init__(self, config: Dict, backend: Optional[StorageBackend] = None):
+        self.config = config
+        # Retries happen in ResilientBackend, so the SDK must not retry too
+        self.resilience = ResilientBackend(backend or create_backend(dict(config, sdk_max_attempts=1)), config)
+        self.backend = self.resilience
+        if config["hot_tier"]:
+            self.backend = TieredBackend(self.resilience, config["hot_tier_path"], config["hot_tier_idle_seconds"])
+        self.max_pool_connections = config["max_pool_connections"]
+        # Shared workers for parallel reads, and a separate small pool for
+        # background maintenance so it can fan out reads without deadlocking
+        self.executor = storage_metrics.ContextThreadPoolExecutor(
+            max_workers=min(16, self.max_pool_connections),
+            thread_name_prefix="archpal-s3"
+        )
+        self.background = ThreadPoolExecutor(max_workers=2, thread_name_prefix="archpal-s3-bg")
+        self._pending_compactions = set()
+        self._pending_search_jobs = set()
+        # Cognito user ID -> when archiving was last considered
+        self._archive_checked = {}
+        self.write_queue = None
+        # S3 key -> (etag, decoded JSON bytes)
+        self.object_cache = TTLCache(
+            max_entries=config["cache_max_entries"],
+            ttl_seconds=config["cache_ttl_seconds"],
+            max_size=config["cache_max_bytes"],
+            stale_seconds=config["cache_stale_seconds"]
+        )
+        self.cache_fresh_seconds = config["cache_fresh_seconds"]
+        # Cognito user ID -> parsed info.json
+        self.profile_cache = TTLCache(
+            max_entries=config["profile_cache_max_entries"],
+            ttl_seconds=config["profile_cache_ttl_seconds"]
+        )
+        # Cognito user ID -> (index signature, search index with deltas applied)
+        self.search_cache = TTLCache(
+            max_entries=SEARCH_CACHE_MAX_ENTRIES,
+            ttl_seconds=config["cache_ttl_seconds"]
+        )
+        self.storage_format = config["storage_format"]
+        self.gzip_level = config["gzip_level"]
+        self._revalidated = 0
+        self._conditional_writes = 0
+        self._write_conflicts = 0
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._saturated_requests = 0
+
+    @contextmanager
+    def track_request(self):
+        """Count a request against the shared connection pool while it runs"""
+        with self._lock:
+            if self._in_flight >= self.max_pool_connections:
+                self._saturated_requests += 1
+            self._in_flight += 1
+            self._requests += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+        try:
+            yield self.backend
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict:
+        """Snapshot of connection pool and cache usage"""
+        cache_stats = self.object_cache.stats()
+        with self._lock:
+            cache_stats["revalidated_not_modified"] = self._revalidated
+            return {
+                "backend": self.backend.name,
+                "cache": cache_stats,
+                "profile_cache": self.profile_cache.stats(),
+                "resilience": self.resilience.stats(),
+                "conditional_writes": self._conditional_writes,
+                "write_conflicts": self._write_conflicts,
+                "write_conflict_rate": (
+                    self._write_conflicts / self._conditional_writes if self._conditional_writes else 0.0
+                ),
+                "max_pool_connections": self.max_pool_connections,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "requests": self._requests,
+                "saturated_requests": self._saturated_requests,
+                "saturation_ratio": (
+                    self._saturated_requests / self._requests if self._requests else 0.0
+                )
+            }
+
+
+def get_storage_runtime() -> Optional[StorageRuntime]:
+    """Get or create the process-wide storage runtime"""
+    global _runtime
+    if _runtime is not None:
+        return _runtime
+
+    config = get_s3_config()
+    if not config or (config["backend"] == "s3" and not config["bucket_name"]):
+        return None
+
+    with _runtime_lock:
+        if _runtime is None:
+            try:
+                _runtime = StorageRuntime(config)
+            except NoCredentialsError:
+                _report_error("AWS credentials not found. Please configure in secrets.toml")
+                return None
+            except Exception as e:
+                _report_error(f"Error creating storage backend: {str(e)}")
+                return None
+    return _runtime
+
+
+def configure_storage(backend: StorageBackend, settings: Optional[Dict] = None) -> StorageRuntime:
+    """
+    Install a process-wide runtime on an explicit backend, bypassing secrets
+
+    Used by benchmarks and offline tools, e.g.
+    ``configure_storage(MemoryBackend())``.
+
+    Args:
+        backend: Backend to store objects in
+        settings: Optional secrets-style overrides (see build_storage_config)
+    """
+    global _runtime, _config_cache
+    config = build_storage_config(dict(settings or {}, storage_backend=backend.name))
+    with _runtime_lock:
+        _config_cache = config
+        _runtime = StorageRuntime(config, backend)
+    return _runtime
+
+
+def get_s3_client():
+    """Get the shared S3 client (None unless the S3 backend is in use)"""
+    runtime = get_storage_runtime()
+    return getattr(runtime.resilience, "client", None) if runtime else None
+
+
+def get_storage_stats() -> Dict:
+    """Get connection pool and write-behind queue metrics for the shared S3 client"""
+    runtime = get_storage_runtime()
+    if not runtime:
+        return {}
+    stats = runtime.stats()
+    if runtime.write_queue is not None:
+        stats["write_queue"] = runtime.write_queue.stats()
+    if isinstance(runtime.backend, TieredBackend):
+        stats["hot_tier"] = runtime.backend.stats()
+    return stats
 
 
 def build_s3_path(*parts):
@@ -82,13 +552,167 @@ def build_s3_path(*parts):
     return "/".join(filtered_parts)
 
 
+def _fetch_object(runtime: StorageRuntime, key: str) -> Optional[tuple]:
+    """
+    Fetch an object's (etag, body) through the read-through cache
+    
+    Returns:
+        (etag, body as UTF-8 JSON bytes in any storage format), or None if
+        the object does not exist. If storage fails but the object is cached,
+        the cached copy is returned even if stale; otherwise the error is
+        raised.
+    """
+    cached = runtime.object_cache.get(key)
+    if cached is not None:
+        (etag, body), age = cached
+        if age <= runtime.cache_fresh_seconds:
+            return etag, body
+
+    try:
+        with runtime.track_request() as backend:
+            stored = backend.get(key, if_none_match=etag if cached is not None else None)
+    except NotModified:
+        runtime.object_cache.touch(key)
+        with runtime._lock:
+            runtime._revalidated += 1
+        return etag, body
+    except Exception as e:
+        stale = runtime.object_cache.get_stale(key)
+        if stale is None:
+            raise
+        (etag, body), age = stale
+        runtime.resilience.count("stale_served")
+        logger.warning("Serving cached %s (%.0fs old) after storage error: %s", key, age, e)
+        return etag, body
+
+    if stored is None:
+        runtime.object_cache.discard(key)
+        return None
+    storage_metrics.record_bytes(read=len(stored.body))
+    body = storage_format.decode_body(stored.body, stored.metadata)
+    runtime.object_cache.put(key, (stored.etag, body), size=len(body))
+    return stored.etag, body
+
+
+def _read_json(runtime: StorageRuntime, key: str):
+    """
+    Download and parse a JSON object
+
+    Returns:
+        Parsed JSON (a fresh copy the caller may modify), or None if the
+        object does not exist. Other backend errors are raised.
+    """
+    return _read_json_versioned(runtime, key)[0]
+
+
+def _read_json_versioned(runtime: StorageRuntime, key: str) -> tuple:
+    """Like _read_json, but returns (data, etag); both are None if the object does not exist"""
+    fetched = _fetch_object(runtime, key)
+    if fetched is None:
+        return None, None
+    etag, body = fetched
+    return json.loads(body.decode('utf-8')), etag
+
+
+def _write_json(
+    runtime: StorageRuntime,
+    key: str,
+    data,
+    if_match: Optional[str] = None,
+    if_none_match: Optional[str] = None
+) -> None:
+    """
+    Serialize and upload a JSON object, updating the cache in place
+    
+    Args:
+        if_match: Only write if the current object has this ETag
+        if_none_match: "*" to only write if the object does not exist yet
+    
+    Raises:
+        PreconditionFailed: A condition did not hold
+    """
+    raw = storage_format.dump_json(data, runtime.storage_format)
+    body, put_args = storage_format.encode_body(raw, runtime.storage_format, runtime.gzip_level)
+    try:
+        with runtime.track_request() as backend:
+            etag = backend.put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+    except Exception:
+        runtime.object_cache.discard(key)
+        raise
+    storage_metrics.record_bytes(written=len(body))
+    # Cache the plain JSON so hits skip decompression
+    runtime.object_cache.put(key, (etag, raw), size=len(raw))
+
+
+def _update_json_object(runtime: StorageRuntime, key: str, mutate, default=None, load=None):
+    """
+    Optimistic read-modify-write of a JSON object
+    
+    Reads the object with its ETag, applies mutate, and writes it back only
+    if nobody else wrote it in the meantime. On a conflict the latest version
+    is re-read and mutate re-applied to it (so concurrent changes merge),
+    after a jittered backoff.
+    
+    Args:
+        runtime: Storage runtime
+        key: S3 key
+        mutate: Callable that edits the data in place and returns False if
+            there was nothing to change. It may be called more than once.
+        default: Factory for the initial data if the object does not exist
+        load: Optional callable that normalizes the stored data (or None)
+            before mutate sees it, e.g. to upgrade a legacy layout
+    
+    Returns:
+        The written data, or None if mutate made no change
+    """
+    for attempt in range(CONDITIONAL_WRITE_MAX_ATTEMPTS):
+        data, etag = _read_json_versioned(runtime, key)
+        if load is not None:
+            data = load(data)
+        if data is None:
+            data = default() if default else None
+        if data is None or not mutate(data):
+            return None
+
+        with runtime._lock:
+            runtime._conditional_writes += 1
+        try:
+            if etag:
+                _write_json(runtime, key, data, if_match=etag)
+            else:
+                _write_json(runtime, key, data, if_none_match="*")
+            return data
+        except PreconditionFailed:
+            if attempt == CONDITIONAL_WRITE_MAX_ATTEMPTS - 1:
+                raise
+            with runtime._lock:
+                runtime._write_conflicts += 1
+            logger.info("Write conflict on %s (attempt %d), retrying with latest version", key, attempt + 1)
+            time.sleep(random.uniform(0, CONDITIONAL_WRITE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+def _list_keys(runtime: StorageRuntime, prefix: str) -> List[str]:
+    """List all object keys under a prefix, in lexicographic order"""
+    with runtime.track_request() as backend:
+        return backend.list_keys(prefix)
+
+
+def _delete_keys(runtime: StorageRuntime, keys: List[str]) -> None:
+    """Delete objects, dropping them from the cache first"""
+    for key in keys:
+        runtime.object_cache.discard(key)
+    with runtime.track_request() as backend:
+        backend.delete(keys)
+
+
 # ============================================
 # User Info Operations
 # ============================================
 
+@instrument()
 def get_user_info(cognito_user_id: str) -> Optional[Dict]:
     """
-    Retrieve user info from S3
+    Retrieve user info from S3 (served from the profile cache when possible)
     
     Args:
         cognito_user_id: Cognito user ID (sub claim)
@@ -96,33 +720,32 @@ def get_user_info(cognito_user_id: str) -> Optional[Dict]:
     Returns:
         User info dict or None if not found
     """
-    s3_client = get_s3_client()
-    if not s3_client:
+    runtime = get_storage_runtime()
+    if not runtime:
         return None
     
-    config = get_s3_config()
-    if not config:
-        return None
+    cached = runtime.profile_cache.get(cognito_user_id)
+    if cached is not None:
+        return copy.deepcopy(cached[0])
     
     key = build_s3_path("users", cognito_user_id, "info.json")
     
     try:
-        response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-        content = response['Body'].read().decode('utf-8')
-        return json.loads(content)
+        # None means user info doesn't exist yet - this is normal for new
+        # users; it is not cached, since their first save_user_info fills it
+        user_info = _read_json(runtime, key)
+        if user_info is not None:
+            runtime.profile_cache.put(cognito_user_id, copy.deepcopy(user_info))
+        return user_info
     except ClientError as e:
-        error_code = e.response.get('Error', {}).get('Code', '')
-        if error_code == 'NoSuchKey':
-            # User info doesn't exist yet - this is normal for new users
-            return None
-        else:
-            st.error(f"Error retrieving user info from S3: {str(e)}")
-            return None
+        _report_error(f"Error retrieving user info from S3: {str(e)}")
+        return None
     except Exception as e:
-        st.error(f"Unexpected error retrieving user info: {str(e)}")
+        _report_error(f"Unexpected error retrieving user info: {str(e)}")
         return None
 
 
+@instrument()
 def save_user_info(cognito_user_id: str, user_info: Dict) -> bool:
     """
     Save user info to S3
@@ -134,12 +757,8 @@ def save_user_info(cognito_user_id: str, user_info: Dict) -> bool:
     Returns:
         True if successful, False otherwise
     """
-    s3_client = get_s3_client()
-    if not s3_client:
-        return False
-    
-    config = get_s3_config()
-    if not config:
+    runtime = get_storage_runtime()
+    if not runtime:
         return False
     
     # Add/update timestamps
@@ -152,16 +771,12 @@ def save_user_info(cognito_user_id: str, user_info: Dict) -> bool:
     key = build_s3_path("users", cognito_user_id, "info.json")
     
     try:
-        json_data = json.dumps(user_info, indent=2)
-        s3_client.put_object(
-            Bucket=config["bucket_name"],
-            Key=key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json'
-        )
+        _write_json(runtime, key, user_info)
+        runtime.profile_cache.put(cognito_user_id, copy.deepcopy(user_info))
         return True
     except Exception as e:
-        st.error(f"Error saving user info to S3: {str(e)}")
+        runtime.profile_cache.discard(cognito_user_id)
+        _report_error(f"Error saving user info to S3: {str(e)}")
         return False
 
 
@@ -169,6 +784,141 @@ def save_user_info(cognito_user_id: str, user_info: Dict) -> bool:
 # Conversation History Operations
 # ============================================
 
+def _history_key(cognito_user_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "conversations.json")
+
+
+def _history_page_key(cognito_user_id: str, page_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "history", f"{page_id}.json")
+
+
+def _sort_history(conversations: List[Dict], limit: int) -> List[Dict]:
+    """Sort by last_updated (newest first) and limit"""
+    sorted_conversations = sorted(
+        conversations,
+        key=lambda x: x.get("last_updated", ""),
+        reverse=True
+    )
+    return sorted_conversations[:limit]
+
+
+def _load_history_index(data) -> Dict:
+    """
+    Normalize a stored conversations.json into the paginated index layout
+    
+    Index layout:
+        {"version": 2,
+         "entries": [...],   # most recent entries, sorted newest first
+         "pages": [{"page_id": str, "count": int, "hidden": [conversation_id, ...]}, ...]}
+    
+    Pages are listed newest first. Legacy indexes (a plain list of entries)
+    become an index with no pages; they are rewritten in the new layout on
+    their next update.
+    """
+    if data is None:
+        return {"version": HISTORY_INDEX_VERSION, "entries": [], "pages": []}
+    if isinstance(data, list):
+        return {
+            "version": HISTORY_INDEX_VERSION,
+            "entries": _sort_history(data, len(data)),
+            "pages": []
+        }
+    return data
+
+
+def _read_history_page(runtime: StorageRuntime, cognito_user_id: str, page_id: str) -> List[Dict]:
+    return _read_json(runtime, _history_page_key(cognito_user_id, page_id)) or []
+
+
+def _locate_paged_entry(runtime: StorageRuntime, cognito_user_id: str, index: Dict, conversation_id: str) -> Optional[tuple]:
+    """Find a conversation's entry in the index pages as (page, entry), newest page first"""
+    for page in index["pages"]:
+        if conversation_id in page.get("hidden", []):
+            continue
+        entry = _find_history_entry(_read_history_page(runtime, cognito_user_id, page["page_id"]), conversation_id)
+        if entry is not None:
+            return page, entry
+    return None
+
+
+def _update_history_index(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    mutate,
+    conversation_id: Optional[str] = None
+) -> Optional[List[Dict]]:
+    """
+    Read-modify-write the conversation history index with conditional writes
+    
+    The head (conversations.json) keeps the most recent entries sorted newest
+    first. If conversation_id has been paged out, its entry is moved back into
+    the head before mutate runs. When the head grows past HISTORY_HEAD_MAX
+    entries, everything beyond the newest HISTORY_HEAD_SIZE is written to a
+    new immutable page.
+    
+    Args:
+        runtime: Storage runtime
+        cognito_user_id: Cognito user ID (sub claim)
+        mutate: Callable that edits the head entries list in place and
+            returns False if there was nothing to change. It is re-applied to
+            the latest index if another session wrote it concurrently.
+        conversation_id: Conversation that mutate looks up, if any
+    
+    Returns:
+        The updated head entries, or None if mutate made no change
+    """
+    written_pages = []
+
+    def mutate_index(index):
+        entries = index["entries"]
+        if conversation_id and not _find_history_entry(entries, conversation_id):
+            located = _locate_paged_entry(runtime, cognito_user_id, index, conversation_id)
+            if located is not None:
+                page, entry = located
+                entries.append(dict(entry))
+                page["hidden"] = page.get("hidden", []) + [conversation_id]
+        if not mutate(entries):
+            return False
+
+        entries.sort(key=lambda x: x.get("last_updated", ""), reverse=True)
+        if len(entries) > HISTORY_HEAD_MAX:
+            page_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+            spilled = entries[HISTORY_HEAD_SIZE:]
+            _write_json(runtime, _history_page_key(cognito_user_id, page_id), spilled, if_none_match="*")
+            written_pages.append(page_id)
+            del entries[HISTORY_HEAD_SIZE:]
+            index["pages"].insert(0, {"page_id": page_id, "count": len(spilled), "hidden": []})
+        return True
+
+    try:
+        result = _update_json_object(runtime, _history_key(cognito_user_id), mutate_index, load=_load_history_index)
+    finally:
+        _discard_orphan_pages(runtime, cognito_user_id, written_pages)
+    return result["entries"] if result is not None else None
+
+
+def _discard_orphan_pages(runtime: StorageRuntime, cognito_user_id: str, page_ids: List[str]) -> None:
+    """Delete pages written by attempts whose index update lost a conflict"""
+    if not page_ids:
+        return
+    try:
+        index = _load_history_index(_read_json(runtime, _history_key(cognito_user_id)))
+        referenced = {page["page_id"] for page in index["pages"]}
+        orphans = [_history_page_key(cognito_user_id, page_id) for page_id in page_ids if page_id not in referenced]
+        if orphans:
+            _delete_keys(runtime, orphans)
+    except Exception:
+        logger.exception("Could not clean up history pages for user %s", cognito_user_id)
+
+
+def _find_history_entry(conversations: List[Dict], conversation_id: str) -> Optional[Dict]:
+    for conv in conversations:
+        if conv.get("conversation_id") == conversation_id:
+            return conv
+    return None
+
+
+@instrument()
 def get_conversation_history(cognito_user_id: str, limit: int = 5) -> List[Dict]:
     """
     Retrieve conversation history for a user
@@ -180,41 +930,99 @@ def get_conversation_history(cognito_user_id: str, limit: int = 5) -> List[Dict]
     Returns:
         List of conversation metadata dicts, sorted by last_updated (newest first)
     """
-    s3_client = get_s3_client()
-    if not s3_client:
-        return []
+    return get_conversation_history_page(cognito_user_id, limit)[0]
+
+
+@instrument()
+def get_conversation_history_page(cognito_user_id: str, limit: int = 5, cursor: Optional[str] = None) -> tuple:
+    """
+    Retrieve one page of a user's conversation history
     
-    config = get_s3_config()
-    if not config:
-        return []
+    Reads only the index head, plus the older pages the requested range
+    reaches into.
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        limit: Maximum number of conversations to return (default: 5)
+        cursor: next_cursor from the previous page, or None for the newest
     
-    key = build_s3_path("users", cognito_user_id, "conversations.json")
+    Returns:
+        (conversations, next_cursor): metadata dicts sorted by last_updated
+        (newest first), and the cursor for the following page (None at the end)
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return [], None
     
+    if cursor is None:
+        _schedule_archival(runtime, cognito_user_id)
     try:
-        response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-        content = response['Body'].read().decode('utf-8')
-        conversations = json.loads(content)
+        index = _load_history_index(_read_json(runtime, _history_key(cognito_user_id)))
         
-        # Sort by last_updated (newest first) and limit
-        sorted_conversations = sorted(
-            conversations,
-            key=lambda x: x.get("last_updated", ""),
-            reverse=True
-        )
-        return sorted_conversations[:limit]
+        # Include turns still waiting in the write-behind queue
+        if runtime.write_queue is not None:
+            for conversation_id, turn, in_progress in runtime.write_queue.pending_turns(cognito_user_id):
+                # A write in progress may already have updated the index;
+                # only fill in the entry if it's still missing
+                if in_progress and _find_history_entry(index["entries"], conversation_id):
+                    continue
+                _apply_turn_to_history(index["entries"], conversation_id, len(turn["messages"]), turn["title"])
+            index["entries"] = _sort_history(index["entries"], len(index["entries"]))
+        
+        # An empty list means no conversations yet - this is normal for new users
+        return _history_slice(runtime, cognito_user_id, index, limit, cursor)
     except ClientError as e:
-        error_code = e.response.get('Error', {}).get('Code', '')
-        if error_code == 'NoSuchKey':
-            # No conversations yet - this is normal for new users
-            return []
-        else:
-            st.error(f"Error retrieving conversation history: {str(e)}")
-            return []
+        _report_error(f"Error retrieving conversation history: {str(e)}")
+        return [], None
     except Exception as e:
-        st.error(f"Unexpected error retrieving conversation history: {str(e)}")
-        return []
+        _report_error(f"Unexpected error retrieving conversation history: {str(e)}")
+        return [], None
+
+
+def _all_history_entries(runtime: StorageRuntime, cognito_user_id: str) -> List[Dict]:
+    """Every entry of a user's history index, head and pages, newest first"""
+    index = _load_history_index(_read_json(runtime, _history_key(cognito_user_id)))
+    total = len(index["entries"]) + sum(page.get("count", 0) for page in index["pages"])
+    return _history_slice(runtime, cognito_user_id, index, max(total, 1), None)[0]
+
+
+def _history_slice(runtime: StorageRuntime, cognito_user_id: str, index: Dict, limit: int, cursor: Optional[str]) -> tuple:
+    """
+    Walk the head, then the pages newest first, from a cursor
+    
+    Cursors are "<page_id or 'head'>:<offset>". Pages are immutable, so
+    offsets into them stay valid; entries hidden from a page are skipped.
+    """
+    source, _, offset = (cursor or "head:0").rpartition(":")
+    offset = int(offset)
+    sources = ["head"] + [page["page_id"] for page in index["pages"]]
+    if source not in sources:
+        return [], None
+
+    # Entries moved back into the head are stale in the pages
+    head_ids = {conv.get("conversation_id") for conv in index["entries"]}
+    result = []
+    for position in range(sources.index(source), len(sources)):
+        if position == 0:
+            entries, hidden = index["entries"], set()
+        else:
+            page = index["pages"][position - 1]
+            entries = _read_history_page(runtime, cognito_user_id, page["page_id"])
+            hidden = head_ids.union(page.get("hidden", []))
+        while offset < len(entries):
+            conv = entries[offset]
+            offset += 1
+            if conv.get("conversation_id") in hidden:
+                continue
+            result.append(conv)
+            if len(result) == limit:
+                more = offset < len(entries) or position + 1 < len(sources)
+                return result, f"{sources[position]}:{offset}" if more else None
+        offset = 0
+    return result, None
 
 
+@instrument()
 def add_conversation_to_history(cognito_user_id: str, conversation_id: str, title: Optional[str] = None) -> bool:
     """
     Add a new conversation to the history
@@ -227,39 +1035,17 @@ def add_conversation_to_history(cognito_user_id: str, conversation_id: str, titl
     Returns:
         True if successful, False otherwise
     """
-    s3_client = get_s3_client()
-    if not s3_client:
-        return False
-    
-    config = get_s3_config()
-    if not config:
+    runtime = get_storage_runtime()
+    if not runtime:
         return False
     
-    key = build_s3_path("users", cognito_user_id, "conversations.json")
-    
-    try:
-        # Try to get existing conversations
-        try:
-            response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-            content = response['Body'].read().decode('utf-8')
-            conversations = json.loads(content)
-        except ClientError as e:
-            if e.response.get('Error', {}).get('Code', '') == 'NoSuchKey':
-                conversations = []
-            else:
-                raise
-        
-        # Check if conversation already exists
-        existing_ids = [c.get("conversation_id") for c in conversations]
-        if conversation_id in existing_ids:
+    def mutate(conversations):
+        now = datetime.utcnow().isoformat() + "Z"
+        conv = _find_history_entry(conversations, conversation_id)
+        if conv:
             # Conversation already exists, update it
-            for conv in conversations:
-                if conv.get("conversation_id") == conversation_id:
-                    conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
-                    break
+            conv["last_updated"] = now
         else:
-            # Add new conversation
-            now = datetime.utcnow().isoformat() + "Z"
             conversations.append({
                 "conversation_id": conversation_id,
                 "created_at": now,
@@ -267,21 +1053,17 @@ def add_conversation_to_history(cognito_user_id: str, conversation_id: str, titl
                 "message_count": 0,
                 "title": title or f"Conversation {len(conversations) + 1}"
             })
-        
-        # Save back to S3
-        json_data = json.dumps(conversations, indent=2)
-        s3_client.put_object(
-            Bucket=config["bucket_name"],
-            Key=key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json'
-        )
+        return True
+    
+    try:
+        _update_history_index(runtime, cognito_user_id, mutate, conversation_id)
         return True
     except Exception as e:
-        st.error(f"Error updating conversation history: {str(e)}")
+        _report_error(f"Error updating conversation history: {str(e)}")
         return False
 
 
+@instrument()
 def update_conversation_metadata(cognito_user_id: str, conversation_id: str, message_count: int) -> bool:
     """
     Update conversation metadata (message count, last updated)
@@ -294,54 +1076,43 @@ def update_conversation_metadata(cognito_user_id: str, conversation_id: str, mes
     Returns:
         True if successful, False otherwise
     """
-    s3_client = get_s3_client()
-    if not s3_client:
+    runtime = get_storage_runtime()
+    if not runtime:
         return False
     
-    config = get_s3_config()
-    if not config:
-        return False
-    
-    key = build_s3_path("users", cognito_user_id, "conversations.json")
+    def mutate(conversations):
+        conv = _find_history_entry(conversations, conversation_id)
+        if not conv:
+            return False
+        conv["message_count"] = message_count
+        conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
+        return True
     
     try:
-        # Get existing conversations
-        try:
-            response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-            content = response['Body'].read().decode('utf-8')
-            conversations = json.loads(content)
-        except ClientError as e:
-            if e.response.get('Error', {}).get('Code', '') == 'NoSuchKey':
-                return False
-            else:
-                raise
-        
-        # Update conversation metadata
-        updated = False
-        for conv in conversations:
-            if conv.get("conversation_id") == conversation_id:
-                conv["message_count"] = message_count
-                conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
-                updated = True
-                break
-        
-        if not updated:
+        return _update_history_index(runtime, cognito_user_id, mutate, conversation_id) is not None
+    except Exception as e:
+        _report_error(f"Error updating conversation metadata: {str(e)}")
+        return False
+
+
+def _increment_message_count(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str, added: int) -> bool:
+    """Add to a conversation's message count in the history index without reading the conversation"""
+    def mutate(conversations):
+        conv = _find_history_entry(conversations, conversation_id)
+        if not conv:
             return False
-        
-        # Save back to S3
-        json_data = json.dumps(conversations, indent=2)
-        s3_client.put_object(
-            Bucket=config["bucket_name"],
-            Key=key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json'
-        )
+        conv["message_count"] = conv.get("message_count", 0) + added
+        conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
         return True
+
+    try:
+        return _update_history_index(runtime, cognito_user_id, mutate, conversation_id) is not None
     except Exception as e:
-        st.error(f"Error updating conversation metadata: {str(e)}")
+        _report_error(f"Error updating conversation metadata: {str(e)}")
         return False
 
 
+@instrument()
 def update_conversation_title(cognito_user_id: str, conversation_id: str, title: str) -> bool:
     """
     Update the title of a conversation in the history index.
@@ -354,96 +1125,430 @@ def update_conversation_title(cognito_user_id: str, conversation_id: str, title:
     Returns:
         True if successful, False otherwise
     """
-    s3_client = get_s3_client()
-    if not s3_client:
-        return False
-
-    config = get_s3_config()
-    if not config:
+    runtime = get_storage_runtime()
+    if not runtime:
         return False
 
-    key = build_s3_path("users", cognito_user_id, "conversations.json")
+    def mutate(conversations):
+        conv = _find_history_entry(conversations, conversation_id)
+        if not conv:
+            return False
+        conv["title"] = title
+        conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
+        return True
 
     try:
-        try:
-            response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-            content = response['Body'].read().decode('utf-8')
-            conversations = json.loads(content)
-        except ClientError as e:
-            if e.response.get('Error', {}).get('Code', '') == 'NoSuchKey':
-                return False
-            else:
-                raise
-
-        updated = False
-        for conv in conversations:
-            if conv.get("conversation_id") == conversation_id:
-                conv["title"] = title
-                conv["last_updated"] = datetime.utcnow().isoformat() + "Z"
-                updated = True
-                break
-
-        if not updated:
+        if _update_history_index(runtime, cognito_user_id, mutate, conversation_id) is None:
             return False
-
-        json_data = json.dumps(conversations, indent=2)
-        s3_client.put_object(
-            Bucket=config["bucket_name"],
-            Key=key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json'
-        )
-        return True
     except Exception as e:
-        st.error(f"Error updating conversation title: {str(e)}")
+        _report_error(f"Error updating conversation title: {str(e)}")
         return False
+    _index_change(runtime, cognito_user_id, search_index.build_delta(
+        conversation_id, title=title, last_updated=datetime.utcnow().isoformat() + "Z"
+    ))
+    return True
 
 
 # ============================================
 # Conversation Data Operations
 # ============================================
 
-def get_conversation(cognito_user_id: str, conversation_id: str) -> Optional[Dict]:
-    """
-    Retrieve a specific conversation
-    
-    Args:
-        cognito_user_id: Cognito user ID (sub claim)
-        conversation_id: Conversation ID
+def _conversation_key(cognito_user_id: str, conversation_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "conversations", f"{conversation_id}.json")
+
+
+def _segment_prefix(cognito_user_id: str, conversation_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "conversations", conversation_id, "segments") + "/"
+
+
+def _segment_key(cognito_user_id: str, conversation_id: str, segment_id: str) -> str:
+    return _segment_prefix(cognito_user_id, conversation_id) + f"{segment_id}.json"
+
+
+def _archive_index_key(cognito_user_id: str) -> str:
+    return build_s3_path(
+        "users", cognito_user_id, conversation_archive.ARCHIVE_DIRECTORY, conversation_archive.INDEX_FILENAME
+    )
+
+
+def _archive_bundle_key(cognito_user_id: str, bundle_id: str) -> str:
+    return build_s3_path(
+        "users", cognito_user_id, conversation_archive.ARCHIVE_DIRECTORY,
+        bundle_id + conversation_archive.BUNDLE_SUFFIX
+    )
+
+
+def new_segment_id() -> str:
+    """Create a segment ID that sorts chronologically (UTC timestamp plus a random suffix)"""
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%S%f") + "-" + uuid.uuid4().hex[:8]
+
+
+def build_message(
+    role: str,
+    content: str,
+    metadata: Optional[Dict] = None,
+    timestamp: Optional[str] = None,
+    message_id: Optional[str] = None
+) -> Dict:
+    """Build a stored message record"""
+    return {
+        "message_id": message_id or str(uuid.uuid4()),
+        "role": role,
+        "content": content,
+        "timestamp": timestamp or datetime.utcnow().isoformat() + "Z",
+        "metadata": metadata or {}
+    }
+
+
+def _drop_repeated_messages(messages: List[Dict]) -> List[Dict]:
+    """Keep the first copy of each message_id (a retried write may store a turn twice)"""
+    seen = set()
+    unique = []
+    for message in messages:
+        message_id = message.get("message_id")
+        if message_id is not None:
+            if message_id in seen:
+                continue
+            seen.add(message_id)
+        unique.append(message)
+    return unique
+
+
+def stitch_conversation(header: Optional[Dict], segments: List[Dict]) -> Optional[Dict]:
+    """
+    Combine a conversation header and its segments into a single conversation
+    
+    Args:
+        header: Header object ({conversation_id}.json), or None if it doesn't exist
+        segments: Segment objects, sorted by segment_id
+    
+    Returns:
+        Conversation dict in the single-object shape (with a full "messages"
+        list), or None if there is neither a header nor any segments
+    """
+    live = []
+    for segment in segments:
+        merged_from = segment.get("merged_from")
+        if merged_from:
+            # A merged segment supersedes its sources, which linger if
+            # compaction stopped before deleting them
+            live = [s for s in live if s["segment_id"] < merged_from]
+        live.append(segment)
+
+    # Segments up to segments_through were already folded into the header
+    segments_through = (header or {}).get("segments_through", "")
+    live = [s for s in live if s["segment_id"] > segments_through]
+
+    if header is None and not live:
+        return None
+
+    conversation = dict(header) if header else {
+        "conversation_id": live[0].get("conversation_id"),
+        "user_id": live[0].get("user_id"),
+        "created_at": live[0]["messages"][0]["timestamp"] if live[0].get("messages") else None,
+        "metadata": {}
+    }
+    messages = list(conversation.get("messages", []))
+    metadata = dict(conversation.get("metadata") or {})
+    for segment in live:
+        messages.extend(segment.get("messages", []))
+        # Conversation metadata recorded with a turn never overrides the header's
+        for field, value in (segment.get("conversation_metadata") or {}).items():
+            metadata.setdefault(field, value)
+    messages = _drop_repeated_messages(messages)
+    for index, message in enumerate(messages):
+        message.setdefault("metadata", {})["message_index"] = index
+    conversation["messages"] = messages
+    conversation["metadata"] = metadata
+    # A header written only to hold the context summary has no creation time
+    if not conversation.get("created_at") and messages:
+        conversation["created_at"] = messages[0].get("timestamp")
+
+    if live:
+        conversation["segments_through"] = live[-1]["segment_id"]
+        if messages:
+            conversation["last_updated"] = max(
+                conversation.get("last_updated") or "",
+                messages[-1].get("timestamp", "")
+            )
+    return conversation
+
+
+def _read_segments(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str, parallel: bool = True) -> List[Dict]:
+    """Fetch all segment objects of a conversation in segment_id order"""
+    keys = _list_keys(runtime, _segment_prefix(cognito_user_id, conversation_id))
+    if parallel and len(keys) > 1:
+        segments = list(runtime.executor.map(lambda k: _read_json(runtime, k), keys))
+    else:
+        segments = [_read_json(runtime, k) for k in keys]
+    if any(segment is None for segment in segments):
+        # A concurrent compaction deleted a listed segment; its merged
+        # replacement is visible on a fresh listing
+        return _read_segments(runtime, cognito_user_id, conversation_id, parallel)
+    return segments
+
+
+def _read_header(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> Optional[Dict]:
+    """The conversation header, or for an archived conversation its archived record"""
+    header = _read_json(runtime, _conversation_key(cognito_user_id, conversation_id))
+    if header is not None:
+        return header
+    return _read_archived(runtime, cognito_user_id, conversation_id)
+
+
+def _read_archived(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> Optional[Dict]:
+    """Fetch an archived conversation's record with a ranged GET of its bundle"""
+    index = _read_json(runtime, _archive_index_key(cognito_user_id))
+    entry = (index or {}).get("conversations", {}).get(conversation_id)
+    if entry is None:
+        return None
+
+    bundle_key = _archive_bundle_key(cognito_user_id, entry["bundle"])
+    # Records never change, so a cached copy is always current
+    cache_key = f"{bundle_key}#{entry['offset']}"
+    cached = runtime.object_cache.get(cache_key)
+    if cached is not None:
+        return json.loads(cached[0][1].decode('utf-8'))
+
+    with runtime.track_request() as backend:
+        record = backend.get_range(bundle_key, entry["offset"], entry["length"])
+    if record is None or len(record) != entry["length"]:
+        logger.warning("Archived record of conversation %s is missing from %s", conversation_id, bundle_key)
+        return None
+    storage_metrics.record_bytes(read=len(record))
+    body = storage_format.decode_body(record, {storage_format.FORMAT_METADATA_KEY: str(entry["format"])})
+    runtime.object_cache.put(cache_key, (None, body), size=len(body))
+    return json.loads(body.decode('utf-8'))
+
+
+def _load_conversation(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> Optional[Dict]:
+    """Read header and segments concurrently and stitch them"""
+    header_future = runtime.executor.submit(_read_header, runtime, cognito_user_id, conversation_id)
+    segments = _read_segments(runtime, cognito_user_id, conversation_id)
+    header = header_future.result()
+
+    if len(segments) >= SEGMENT_COMPACTION_THRESHOLD:
+        _schedule_compaction(runtime, cognito_user_id, conversation_id)
+    conversation = stitch_conversation(header, segments)
+
+    # Include turns still waiting in the write-behind queue
+    if runtime.write_queue is not None:
+        queued = runtime.write_queue.pending_messages(cognito_user_id, conversation_id)
+        if queued:
+            conversation = conversation or {
+                "conversation_id": conversation_id,
+                "user_id": cognito_user_id,
+                "created_at": queued[0]["timestamp"],
+                "metadata": {},
+                "messages": []
+            }
+            stored_ids = {m.get("message_id") for m in conversation["messages"]}
+            conversation["messages"].extend(
+                dict(m) for m in queued if m["message_id"] not in stored_ids
+            )
+            for index, message in enumerate(conversation["messages"]):
+                message.setdefault("metadata", {})["message_index"] = index
+    return conversation
+
+
+@instrument()
+def get_conversation(cognito_user_id: str, conversation_id: str) -> Optional[Dict]:
+    """
+    Retrieve a specific conversation
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        conversation_id: Conversation ID
     
     Returns:
         Conversation dict or None if not found
     """
-    s3_client = get_s3_client()
-    if not s3_client:
+    runtime = get_storage_runtime()
+    if not runtime:
         return None
     
-    config = get_s3_config()
-    if not config:
+    try:
+        return _load_conversation(runtime, cognito_user_id, conversation_id)
+    except ClientError as e:
+        _report_error(f"Error retrieving conversation: {str(e)}")
+        return None
+    except Exception as e:
+        _report_error(f"Unexpected error retrieving conversation: {str(e)}")
         return None
+
+
+@instrument()
+def get_conversation_tail(
+    cognito_user_id: str,
+    conversation_id: str,
+    max_messages: int = DEFAULT_TAIL_MESSAGES,
+    before: Optional[str] = None
+) -> Optional[Dict]:
+    """
+    Retrieve the most recent messages of a conversation, newest segments first
     
-    key = build_s3_path("users", cognito_user_id, "conversations", f"{conversation_id}.json")
+    Only the header, the segment listing and the segments holding the
+    requested messages are read, so resuming a long conversation costs the
+    same as resuming a short one. The returned slice starts at a user message
+    where possible.
     
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        conversation_id: Conversation ID
+        max_messages: Number of messages to return
+        before: earlier_cursor from a previous call, to page further back
+    
+    Returns:
+        Dict with the header fields (conversation_id, created_at, metadata, ...),
+        "messages" (oldest first) and "earlier_cursor" (None when there are no
+        earlier messages), or None if the conversation doesn't exist. Metadata
+        recorded with segments is not included; use get_conversation for the
+        complete conversation.
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return None
+    
+    if before is None:
+        _schedule_promotion(runtime, cognito_user_id, conversation_id)
     try:
-        response = s3_client.get_object(Bucket=config["bucket_name"], Key=key)
-        content = response['Body'].read().decode('utf-8')
-        return json.loads(content)
+        return _load_conversation_tail(runtime, cognito_user_id, conversation_id, max_messages, before)
     except ClientError as e:
-        error_code = e.response.get('Error', {}).get('Code', '')
-        if error_code == 'NoSuchKey':
-            return None
-        else:
-            st.error(f"Error retrieving conversation: {str(e)}")
-            return None
+        _report_error(f"Error retrieving conversation: {str(e)}")
+        return None
     except Exception as e:
-        st.error(f"Unexpected error retrieving conversation: {str(e)}")
+        _report_error(f"Unexpected error retrieving conversation: {str(e)}")
         return None
 
 
+def _load_conversation_tail(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    conversation_id: str,
+    max_messages: int,
+    before: Optional[str]
+) -> Optional[Dict]:
+    """
+    Walk segments from newest to oldest until max_messages are collected
+    
+    Cursors are "<segment_id or 'header'>:<message_id>", meaning "messages
+    older than this one". If the segment was compacted since, the merged
+    segment holding the message is the first listed segment at or after it.
+    """
+    header_future = runtime.executor.submit(_read_header, runtime, cognito_user_id, conversation_id)
+    prefix = _segment_prefix(cognito_user_id, conversation_id)
+    segment_ids = [key[len(prefix):-len(".json")] for key in _list_keys(runtime, prefix)]
+    header = header_future.result()
+    segments_through = (header or {}).get("segments_through", "")
+
+    source, before_id = before.split(":", 1) if before else (None, None)
+
+    # Unwritten turns from the write-behind queue are the newest messages
+    queued = []
+    if runtime.write_queue is not None and source in (None, "queued"):
+        queued = runtime.write_queue.pending_messages(cognito_user_id, conversation_id)
+        queued_ids = [m["message_id"] for m in queued]
+        if source == "queued":
+            # If the message was written since, it is found in the segments
+            queued = queued[:queued_ids.index(before_id)] if before_id in queued_ids else []
+            if before_id in queued_ids:
+                before_id = None
+            source = None
+
+    if source == "header":
+        candidates = []
+    elif source is not None:
+        start = next((i for i, sid in enumerate(segment_ids) if sid >= source), len(segment_ids))
+        candidates = segment_ids[:start + 1][::-1]
+    else:
+        candidates = segment_ids[::-1]
+    candidates = [sid for sid in candidates if sid > segments_through]
+
+    # (source, messages) chunks, oldest first
+    chunks = []
+    collected = len(queued)
+    merged_floor = None
+    batch_size = max(2, max_messages // 2)
+    position = 0
+    while position < len(candidates) and collected < max_messages:
+        batch = candidates[position:position + batch_size]
+        position += len(batch)
+        segments = list(runtime.executor.map(
+            lambda sid: _read_json(runtime, _segment_key(cognito_user_id, conversation_id, sid)), batch
+        ))
+        for segment_id, segment in zip(batch, segments):
+            # Sources of a merged segment we already read are superseded
+            if merged_floor is not None and segment_id >= merged_floor:
+                continue
+            if segment is None:
+                # Compacted away after listing; the merged segment covers it
+                continue
+            messages = segment.get("messages", [])
+            if before_id is not None:
+                ids = [m.get("message_id") for m in messages]
+                if before_id not in ids:
+                    continue
+                messages = messages[:ids.index(before_id)]
+                before_id = None
+            if segment.get("merged_from"):
+                merged_floor = segment["merged_from"]
+            chunks.insert(0, (segment_id, messages))
+            collected += len(messages)
+    exhausted = not any(
+        merged_floor is None or segment_id < merged_floor for segment_id in candidates[position:]
+    )
+
+    if exhausted and collected < max_messages and header is not None:
+        messages = header.get("messages", [])
+        if source == "header" and before_id is not None:
+            ids = [m.get("message_id") for m in messages]
+            messages = messages[:ids.index(before_id)] if before_id in ids else []
+        chunks.insert(0, ("header", messages))
+        header_read = True
+    else:
+        header_read = header is None or not header.get("messages")
+
+    if queued:
+        stored_ids = {m.get("message_id") for _, messages in chunks for m in messages}
+        chunks.append(("queued", [m for m in queued if m["message_id"] not in stored_ids]))
+
+    if header is None and not any(messages for _, messages in chunks):
+        return None
+
+    tagged = [(chunk_source, message) for chunk_source, messages in chunks for message in messages]
+    unique = {id(message) for message in _drop_repeated_messages([message for _, message in tagged])}
+    tagged = [(chunk_source, message) for chunk_source, message in tagged if id(message) in unique]
+    cut = max(0, len(tagged) - max_messages)
+    # Start at a user message so the slice can be replayed to the model
+    while cut < len(tagged) - 1 and cut > 0 and tagged[cut][1].get("role") != "user":
+        cut += 1
+    tail = tagged[cut:]
+
+    has_earlier = cut > 0 or not exhausted or not header_read
+    earlier_cursor = None
+    if has_earlier and tail:
+        earlier_cursor = f"{tail[0][0]}:{tail[0][1].get('message_id')}"
+    elif has_earlier and not tail:
+        earlier_cursor = before
+
+    conversation = {k: v for k, v in (header or {}).items() if k != "messages"}
+    conversation.setdefault("conversation_id", conversation_id)
+    conversation.setdefault("user_id", cognito_user_id)
+    conversation.setdefault("metadata", {})
+    conversation["messages"] = [dict(message) for _, message in tail]
+    conversation["earlier_cursor"] = earlier_cursor
+    return conversation
+
+
+@instrument()
 def save_conversation(cognito_user_id: str, conversation_id: str, conversation_data: Dict) -> bool:
     """
     Save a conversation to S3
     
+    The data is written as the conversation header. Pass a dict obtained from
+    get_conversation (which records the segments it already contains in
+    "segments_through") so existing segments are not counted twice.
+    
     Args:
         cognito_user_id: Cognito user ID (sub claim)
         conversation_id: Conversation ID
@@ -452,12 +1557,8 @@ def save_conversation(cognito_user_id: str, conversation_id: str, conversation_d
     Returns:
         True if successful, False otherwise
     """
-    s3_client = get_s3_client()
-    if not s3_client:
-        return False
-    
-    config = get_s3_config()
-    if not config:
+    runtime = get_storage_runtime()
+    if not runtime:
         return False
     
     # Ensure conversation has required fields
@@ -467,22 +1568,102 @@ def save_conversation(cognito_user_id: str, conversation_id: str, conversation_d
         conversation_data["created_at"] = datetime.utcnow().isoformat() + "Z"
     conversation_data["last_updated"] = datetime.utcnow().isoformat() + "Z"
     
-    key = build_s3_path("users", cognito_user_id, "conversations", f"{conversation_id}.json")
+    key = _conversation_key(cognito_user_id, conversation_id)
     
     try:
-        json_data = json.dumps(conversation_data, indent=2)
-        s3_client.put_object(
-            Bucket=config["bucket_name"],
-            Key=key,
-            Body=json_data.encode('utf-8'),
-            ContentType='application/json'
+        _write_json(runtime, key, conversation_data)
+    except Exception as e:
+        _report_error(f"Error saving conversation to S3: {str(e)}")
+        return False
+    # The header replaces the conversation's messages, so reindex it whole
+    _index_change(runtime, cognito_user_id, search_index.build_delta(
+        conversation_id,
+        ["", conversation_data.get("segments_through", "")],
+        conversation_data.get("messages", []),
+        title=conversation_data.get("title"),
+        last_updated=conversation_data["last_updated"],
+        replace=True
+    ))
+    return True
+
+
+@instrument()
+def save_context_summary(cognito_user_id: str, conversation_id: str, summary: Dict) -> bool:
+    """
+    Store a conversation's rolling context summary in its header
+
+    The summary (see context_window.py) is returned with the header fields
+    by get_conversation and get_conversation_tail, so a resumed conversation
+    reuses it. A conversation without a header gets one holding just the
+    summary; an archived one gets its archived record back as header. An
+    older summary never replaces a newer one written by another session.
+
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        conversation_id: Conversation ID
+        summary: Summary dict with "text", "through" and "message_count"
+
+    Returns:
+        True if stored (or a newer summary is already stored), False otherwise
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return False
+
+    def load(header):
+        if header is None:
+            header = _read_archived(runtime, cognito_user_id, conversation_id)
+        return header
+
+    def mutate(header):
+        current = header.get("context_summary") or {}
+        if current.get("message_count", 0) >= summary.get("message_count", 0):
+            return False
+        header["context_summary"] = summary
+        return True
+
+    try:
+        _update_json_object(
+            runtime,
+            _conversation_key(cognito_user_id, conversation_id),
+            mutate,
+            default=lambda: {"conversation_id": conversation_id, "user_id": cognito_user_id, "metadata": {}},
+            load=load
         )
         return True
     except Exception as e:
-        st.error(f"Error saving conversation to S3: {str(e)}")
+        _report_error(f"Error saving conversation summary: {str(e)}")
         return False
 
 
+def _write_segment(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    conversation_id: str,
+    messages: List[Dict],
+    conversation_metadata: Optional[Dict] = None,
+    segment_id: Optional[str] = None
+) -> str:
+    """
+    Write messages as a new segment object and return its segment_id
+
+    A retry passes the segment_id of the first attempt, so it overwrites that
+    segment instead of storing the messages twice.
+    """
+    segment_id = segment_id or new_segment_id()
+    segment = {
+        "segment_id": segment_id,
+        "conversation_id": conversation_id,
+        "user_id": cognito_user_id,
+        "messages": messages
+    }
+    if conversation_metadata:
+        segment["conversation_metadata"] = conversation_metadata
+    _write_json(runtime, _segment_key(cognito_user_id, conversation_id, segment_id), segment)
+    return segment_id
+
+
+@instrument()
 def append_message_to_conversation(
     cognito_user_id: str,
     conversation_id: str,
@@ -491,7 +1672,10 @@ def append_message_to_conversation(
     metadata: Optional[Dict] = None
 ) -> bool:
     """
-    Append a message to an existing conversation
+    Append a message to a conversation
+    
+    Writes only a new segment holding the message; the existing
+    conversation is neither downloaded nor rewritten.
     
     Args:
         cognito_user_id: Cognito user ID (sub claim)
@@ -503,45 +1687,944 @@ def append_message_to_conversation(
     Returns:
         True if successful, False otherwise
     """
-    # Get existing conversation
-    conversation = get_conversation(cognito_user_id, conversation_id)
+    runtime = get_storage_runtime()
+    if not runtime:
+        return False
+    
+    message = build_message(role, content, metadata)
     
-    if conversation is None:
-        # Create new conversation
-        conversation = {
+    try:
+        segment_id = _write_segment(runtime, cognito_user_id, conversation_id, [message])
+    except Exception as e:
+        _report_error(f"Error saving conversation to S3: {str(e)}")
+        return False
+    
+    _index_messages(runtime, cognito_user_id, conversation_id, segment_id, [message])
+    # Update conversation history metadata
+    _increment_message_count(runtime, cognito_user_id, conversation_id, 1)
+    return True
+
+
+@instrument()
+def commit_turn(
+    cognito_user_id: str,
+    conversation_id: str,
+    user_msg: Dict,
+    ai_msg: Dict,
+    metadata: Optional[Dict] = None,
+    title: Optional[str] = None,
+    limit: int = 5
+) -> Optional[List[Dict]]:
+    """
+    Persist a complete chat turn in as few S3 requests as possible
+    
+    The user/assistant pair (plus first-turn conversation metadata) is written
+    as one segment, followed by its search index delta; only then is the
+    history index read and written once with the new entry or updated count,
+    so a failed segment write never bumps message_count. That is four
+    requests, versus a GET and PUT of both the conversation and the index for
+    every message.
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        conversation_id: Conversation ID (new or existing)
+        user_msg: {"content": str, "metadata": dict, "timestamp": optional str,
+            "message_id": optional str}
+        ai_msg: {"content": str, "metadata": dict, "timestamp": optional str,
+            "message_id": optional str}
+        metadata: Optional conversation-level metadata (e.g. student info),
+            normally passed on the first turn only
+        title: Title used if the conversation is not in the history yet
+        limit: Number of history entries to return (default: 5)
+    
+    Returns:
+        The updated conversation history (newest first, up to limit) for the
+        sidebar, or None if the turn could not be saved
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return None
+    
+    messages = _build_turn_messages(user_msg, ai_msg)
+    
+    try:
+        # The index head is kept sorted newest first
+        conversations = _commit_messages(runtime, cognito_user_id, conversation_id, messages, metadata, title)
+        return conversations[:limit]
+    except Exception as e:
+        _report_error(f"Error saving conversation to S3: {str(e)}")
+        return None
+
+
+def _build_turn_messages(user_msg: Dict, ai_msg: Dict) -> List[Dict]:
+    return [
+        build_message("user", user_msg["content"], user_msg.get("metadata"), user_msg.get("timestamp"), user_msg.get("message_id")),
+        build_message("assistant", ai_msg["content"], ai_msg.get("metadata"), ai_msg.get("timestamp"), ai_msg.get("message_id"))
+    ]
+
+
+def _apply_turn_to_history(conversations: List[Dict], conversation_id: str, added: int, title: Optional[str]) -> None:
+    """Insert or update a conversation's history entry for newly added messages"""
+    now = datetime.utcnow().isoformat() + "Z"
+    conv = _find_history_entry(conversations, conversation_id)
+    if conv is None:
+        conv = {
             "conversation_id": conversation_id,
-            "user_id": cognito_user_id,
-            "created_at": datetime.utcnow().isoformat() + "Z",
-            "messages": [],
-            "metadata": {}
+            "created_at": now,
+            "message_count": 0,
+            "title": title or f"Conversation {len(conversations) + 1}"
         }
+        conversations.append(conv)
+    conv["message_count"] = conv.get("message_count", 0) + added
+    conv["last_updated"] = now
+
+
+def _commit_messages(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    conversation_id: str,
+    messages: List[Dict],
+    metadata: Optional[Dict],
+    title: Optional[str],
+    segment_id: Optional[str] = None
+) -> List[Dict]:
+    """
+    Write messages as one segment, then update the history index once
+
+    Retries must pass the same segment_id: the segment and its search index
+    delta are then overwritten rather than duplicated if an earlier attempt
+    stored them but failed on the index.
+    """
+    def mutate(conversations):
+        _apply_turn_to_history(conversations, conversation_id, len(messages), title)
+        return True
+
+    segment_id = _write_segment(runtime, cognito_user_id, conversation_id, messages, metadata, segment_id)
+    # Indexed only once stored, so a failed write is never searchable
+    _index_messages(runtime, cognito_user_id, conversation_id, segment_id, messages, title)
+    return _update_history_index(runtime, cognito_user_id, mutate, conversation_id)
+
+
+# ============================================
+# Write-Behind Queue
+# ============================================
+
+class WriteBehindQueue:
+    """
+    Process-wide background writer for chat turns.
     
-    # Ensure messages list exists
-    if "messages" not in conversation:
-        conversation["messages"] = []
+    A single worker thread drains pending writes in arrival order of each
+    conversation's oldest pending turn. All turns queued for the same
+    conversation are coalesced into one segment and one index update, and a
+    conversation is never written by two batches at once, so per-conversation
+    ordering is preserved.
     
-    # Create new message
-    message_id = str(uuid.uuid4())
-    message = {
-        "message_id": message_id,
-        "role": role,
-        "content": content,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "metadata": metadata or {}
+    A batch that still fails after MAX_ATTEMPTS is not dropped: it is held
+    (reads keep including it) and retried after an exponential backoff of
+    up to HELD_RETRY_MAX_SECONDS, or right away by flush(). Held batches
+    keep their segment ID, so they stitch into place before any turns
+    written since.
+    """
+
+    MAX_ATTEMPTS = 3
+    HELD_RETRY_BASE_SECONDS = 5.0
+    HELD_RETRY_MAX_SECONDS = 300.0
+
+    def __init__(self, runtime: StorageRuntime):
+        self.runtime = runtime
+        self._cond = threading.Condition()
+        # (cognito_user_id, conversation_id) -> list of pending turns
+        self._pending = OrderedDict()
+        self._in_progress = {}
+        # Batches that failed MAX_ATTEMPTS times, oldest first:
+        # {"job", "turns", "segment_id", "rounds", "retry_at"}
+        self._held = []
+        self._enqueued = 0
+        self._batches = 0
+        self._coalesced = 0
+        self._failed = 0
+        self._last_flush_seconds = 0.0
+        self._max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+        self._worker = threading.Thread(target=self._run, name="archpal-write-behind", daemon=True)
+        self._worker.start()
+        atexit.register(self.flush, 30)
+
+    def enqueue(self, cognito_user_id: str, conversation_id: str, messages: List[Dict], metadata: Optional[Dict], title: Optional[str]) -> None:
+        """Queue messages for a conversation and return immediately"""
+        with self._cond:
+            self._pending.setdefault((cognito_user_id, conversation_id), []).append({
+                "messages": messages,
+                "metadata": metadata,
+                "title": title
+            })
+            self._enqueued += 1
+            self._cond.notify_all()
+
+    def pending_messages(self, cognito_user_id: str, conversation_id: str) -> List[Dict]:
+        """Messages accepted for a conversation but not yet confirmed written"""
+        job = (cognito_user_id, conversation_id)
+        with self._cond:
+            turns = [turn for held in self._held if held["job"] == job for turn in held["turns"]]
+            turns += self._in_progress.get(job, []) + self._pending.get(job, [])
+            return [message for turn in turns for message in turn["messages"]]
+
+    def pending_turns(self, cognito_user_id: str) -> List[tuple]:
+        """
+        (conversation_id, turn, in_progress) for a user's unconfirmed turns,
+        where in_progress marks turns whose write has already started
+        (including held batches, which may have been partly written)
+        """
+        with self._cond:
+            batches = [(True, held["job"], held["turns"]) for held in self._held]
+            batches += [(True, job, turns) for job, turns in self._in_progress.items()]
+            batches += [(False, job, turns) for job, turns in self._pending.items()]
+            return [
+                (conversation_id, turn, in_progress)
+                for in_progress, (user_id, conversation_id), turns in batches
+                if user_id == cognito_user_id
+                for turn in turns
+            ]
+
+    def unsaved_turns(self, cognito_user_id: str) -> int:
+        """Number of a user's turns held after failing to be written"""
+        with self._cond:
+            return sum(len(held["turns"]) for held in self._held if held["job"][0] == cognito_user_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until every queued write has been attempted, retrying held
+        batches once more now; False on timeout or if any batch is still held
+        """
+        with self._cond:
+            started = time.monotonic()
+            for held in self._held:
+                held["retry_at"] = started
+            self._cond.notify_all()
+            drained = self._cond.wait_for(
+                lambda: not self._pending and not self._in_progress
+                and all(held["retry_at"] > started for held in self._held),
+                timeout
+            )
+            return drained and not self._held
+
+    def _next_batch(self) -> Optional[tuple]:
+        """Called with the lock held: (job, turns, held batch or None) to write next"""
+        now = time.monotonic()
+        for held in self._held:
+            if held["retry_at"] <= now and held["job"] not in self._in_progress:
+                self._held.remove(held)
+                return held["job"], held["turns"], held
+        if self._pending:
+            job, turns = self._pending.popitem(last=False)
+            return job, turns, None
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    batch = self._next_batch()
+                    if batch is not None:
+                        break
+                    retry_at = min((held["retry_at"] for held in self._held), default=None)
+                    self._cond.wait(None if retry_at is None else max(0.0, retry_at - time.monotonic()))
+                job, turns, held = batch
+                self._in_progress[job] = turns
+            try:
+                self._write(job, turns, held)
+            finally:
+                with self._cond:
+                    del self._in_progress[job]
+                    self._cond.notify_all()
+
+    def _write(self, job: tuple, turns: List[Dict], held: Optional[Dict] = None) -> None:
+        cognito_user_id, conversation_id = job
+        messages = [message for turn in turns for message in turn["messages"]]
+        metadata = next((turn["metadata"] for turn in turns if turn["metadata"]), None)
+        title = next((turn["title"] for turn in turns if turn["title"]), None)
+
+        # Every attempt writes the same segment (and search delta) key
+        segment_id = held["segment_id"] if held else new_segment_id()
+        started = time.monotonic()
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                with storage_metrics.measure("write_behind_commit"):
+                    _commit_messages(
+                        self.runtime, cognito_user_id, conversation_id, messages, metadata, title, segment_id
+                    )
+                break
+            except Exception:
+                if attempt == self.MAX_ATTEMPTS:
+                    rounds = held["rounds"] + 1 if held else 1
+                    delay = min(self.HELD_RETRY_MAX_SECONDS, self.HELD_RETRY_BASE_SECONDS * 2 ** (rounds - 1))
+                    logger.exception(
+                        "Could not write %d queued messages for conversation %s after %d attempts; "
+                        "retrying in %.0fs", len(messages), conversation_id, attempt, delay
+                    )
+                    with self._cond:
+                        self._failed += len(turns)
+                        self._held.append({
+                            "job": job,
+                            "turns": turns,
+                            "segment_id": segment_id,
+                            "rounds": rounds,
+                            "retry_at": time.monotonic() + delay
+                        })
+                    return
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._batches += 1
+            self._coalesced += len(turns) - 1
+            self._last_flush_seconds = elapsed
+            self._max_flush_seconds = max(self._max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+
+    def stats(self) -> Dict:
+        """Queue depth and flush latency"""
+        with self._cond:
+            return {
+                "depth": sum(len(turns) for turns in self._pending.values()),
+                "in_progress": sum(len(turns) for turns in self._in_progress.values()),
+                "enqueued": self._enqueued,
+                "batches_written": self._batches,
+                "coalesced": self._coalesced,
+                "failed": self._failed,
+                "held": sum(len(held["turns"]) for held in self._held),
+                "last_flush_seconds": self._last_flush_seconds,
+                "max_flush_seconds": self._max_flush_seconds,
+                "avg_flush_seconds": (
+                    self._total_flush_seconds / self._batches if self._batches else 0.0
+                )
+            }
+
+
+def _get_write_queue(runtime: StorageRuntime) -> WriteBehindQueue:
+    with _runtime_lock:
+        if runtime.write_queue is None:
+            runtime.write_queue = WriteBehindQueue(runtime)
+    return runtime.write_queue
+
+
+@instrument()
+def enqueue_turn(
+    cognito_user_id: str,
+    conversation_id: str,
+    user_msg: Dict,
+    ai_msg: Dict,
+    metadata: Optional[Dict] = None,
+    title: Optional[str] = None,
+    history: Optional[List[Dict]] = None,
+    limit: int = 5
+) -> Optional[List[Dict]]:
+    """
+    Queue a chat turn for background persistence and return immediately
+    
+    Same arguments as commit_turn, plus the session's current history. The
+    write itself happens on the write-behind worker; reads from this process
+    (get_conversation, get_conversation_history) include queued turns.
+    
+    Args:
+        history: Current sidebar history, used to build the returned value
+    
+    Returns:
+        The sidebar history with this turn applied locally (newest first, up
+        to limit), or None if storage is not configured
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return None
+    
+    messages = _build_turn_messages(user_msg, ai_msg)
+    _get_write_queue(runtime).enqueue(cognito_user_id, conversation_id, messages, metadata, title)
+    
+    conversations = [dict(conv) for conv in (history or [])]
+    _apply_turn_to_history(conversations, conversation_id, len(messages), title)
+    return _sort_history(conversations, limit)
+
+
+@instrument()
+def flush_pending_writes(timeout: Optional[float] = 10) -> bool:
+    """
+    Wait for queued writes to reach S3 (e.g. before logout), retrying
+    turns held after failed writes
+    
+    Returns:
+        True if the queue drained within the timeout and nothing is held
+    """
+    runtime = get_storage_runtime()
+    if not runtime or runtime.write_queue is None:
+        return True
+    return runtime.write_queue.flush(timeout)
+
+
+def get_unsaved_turns(cognito_user_id: str) -> int:
+    """
+    Number of a user's chat turns that could not be written yet
+    
+    They are kept and retried in the background (and by
+    flush_pending_writes), but are lost if the process stops first.
+    """
+    runtime = get_storage_runtime()
+    if not runtime or runtime.write_queue is None:
+        return 0
+    return runtime.write_queue.unsaved_turns(cognito_user_id)
+
+
+def get_write_queue_stats() -> Dict:
+    """Get write-behind queue depth and flush latency"""
+    runtime = get_storage_runtime()
+    if not runtime or runtime.write_queue is None:
+        return {}
+    return runtime.write_queue.stats()
+
+
+# ============================================
+# Segment Compaction
+# ============================================
+
+def _schedule_compaction(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> None:
+    """Queue a background compaction unless one is already pending for this conversation"""
+    job = (cognito_user_id, conversation_id)
+    with runtime._lock:
+        if job in runtime._pending_compactions:
+            return
+        runtime._pending_compactions.add(job)
+
+    def run():
+        try:
+            with storage_metrics.measure("background_compaction"):
+                _compact_conversation(runtime, cognito_user_id, conversation_id)
+        except Exception:
+            logger.exception("Background compaction failed for conversation %s", conversation_id)
+        finally:
+            with runtime._lock:
+                runtime._pending_compactions.discard(job)
+
+    runtime.background.submit(run)
+
+
+def _schedule_promotion(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> None:
+    """With a hot tier, move a resumed conversation into it in the background"""
+    if not isinstance(runtime.backend, TieredBackend):
+        return
+    unit = build_s3_path("users", cognito_user_id, "conversations", conversation_id)
+    if runtime.backend.is_hot(unit):
+        return
+
+    def run():
+        try:
+            with storage_metrics.measure("hot_tier_promotion"):
+                runtime.backend.promote(unit)
+        except Exception:
+            logger.exception("Could not promote conversation %s to the hot tier", conversation_id)
+
+    runtime.background.submit(run)
+
+
+def _compact_conversation(runtime: StorageRuntime, cognito_user_id: str, conversation_id: str) -> int:
+    """
+    Merge runs of small segments into segments of up to SEGMENT_TARGET_MESSAGES
+    
+    Each merged segment is written under the key of the last segment it
+    replaces, with "merged_from" naming the first, before the sources are
+    deleted - so an interrupted compaction never loses or duplicates messages.
+    
+    Returns:
+        Number of segment objects removed
+    """
+    header = _read_header(runtime, cognito_user_id, conversation_id)
+    segments = _read_segments(runtime, cognito_user_id, conversation_id, parallel=False)
+    segments_through = (header or {}).get("segments_through", "")
+
+    stale = []
+    live = []
+    for segment in segments:
+        if segment["segment_id"] <= segments_through:
+            stale.append(segment)
+            continue
+        merged_from = segment.get("merged_from")
+        if merged_from:
+            stale.extend(s for s in live if s["segment_id"] >= merged_from)
+            live = [s for s in live if s["segment_id"] < merged_from]
+        live.append(segment)
+
+    # Greedily group consecutive segments up to the target size
+    batches = []
+    for segment in live:
+        count = len(segment.get("messages", []))
+        if batches and batches[-1][0] + count <= SEGMENT_TARGET_MESSAGES:
+            batches[-1][0] += count
+            batches[-1][1].append(segment)
+        else:
+            batches.append([count, [segment]])
+
+    for _, batch in batches:
+        if len(batch) < 2:
+            continue
+        last_id = batch[-1]["segment_id"]
+        _write_json(runtime, _segment_key(cognito_user_id, conversation_id, last_id), {
+            "segment_id": last_id,
+            "conversation_id": conversation_id,
+            "user_id": cognito_user_id,
+            "merged_from": batch[0]["segment_id"],
+            "messages": [m for s in batch for m in s.get("messages", [])]
+        })
+        stale.extend(batch[:-1])
+
+    stale_keys = sorted({_segment_key(cognito_user_id, conversation_id, s["segment_id"]) for s in stale})
+    _delete_keys(runtime, stale_keys)
+    return len(stale_keys)
+
+
+@instrument()
+def compact_conversation(cognito_user_id: str, conversation_id: str) -> bool:
+    """
+    Merge a conversation's small segments now instead of waiting for the
+    background compaction triggered by reads
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        conversation_id: Conversation ID
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return False
+    
+    try:
+        _compact_conversation(runtime, cognito_user_id, conversation_id)
+        return True
+    except Exception as e:
+        _report_error(f"Error compacting conversation: {str(e)}")
+        return False
+
+
+# ============================================
+# Conversation Search
+# ============================================
+
+def _search_index_key(cognito_user_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "search_index.json")
+
+
+def _search_delta_prefix(cognito_user_id: str) -> str:
+    return build_s3_path("users", cognito_user_id, "search_index") + "/"
+
+
+def _index_change(runtime: StorageRuntime, cognito_user_id: str, delta: Dict, delta_id: Optional[str] = None) -> None:
+    """
+    Write a search index delta; a failure is logged, since it only affects search
+
+    A delta_id (default: a new one) names the delta, so rewriting a delta
+    replaces it.
+    """
+    key = _search_delta_prefix(cognito_user_id) + f"{delta_id or new_segment_id()}.json"
+    try:
+        _write_json(runtime, key, delta)
+    except Exception:
+        logger.exception("Could not index a change to conversation %s", delta["conversation_id"])
+
+
+def _index_messages(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    conversation_id: str,
+    segment_id: str,
+    messages: List[Dict],
+    title: Optional[str] = None
+) -> None:
+    """Add the messages of a newly written segment to the search index"""
+    # Keyed by the segment, so indexing a rewritten segment again replaces its delta
+    _index_change(runtime, cognito_user_id, search_index.build_delta(
+        conversation_id, [segment_id, segment_id], messages, title=title
+    ), delta_id=segment_id)
+
+
+def _read_search_deltas(runtime: StorageRuntime, cognito_user_id: str, keys: List[str]) -> List[Dict]:
+    """Fetch deltas in key (chronological) order, skipping any merged away meanwhile"""
+    if len(keys) > 1:
+        deltas = runtime.executor.map(lambda k: _read_json(runtime, k), keys)
+    else:
+        deltas = [_read_json(runtime, k) for k in keys]
+    return [delta for delta in deltas if delta is not None]
+
+
+def _current_search_index(runtime: StorageRuntime, cognito_user_id: str) -> tuple:
+    """
+    The stored search index with its outstanding deltas applied
+
+    The result is cached per user and reused while neither the index object
+    nor the set of deltas changes.
+
+    Returns:
+        (index, number of outstanding deltas). The index is shared and must
+        not be modified.
+    """
+    listing = runtime.executor.submit(_list_keys, runtime, _search_delta_prefix(cognito_user_id))
+    fetched = _fetch_object(runtime, _search_index_key(cognito_user_id))
+    delta_keys = listing.result()
+    signature = (fetched[0] if fetched else None, tuple(delta_keys))
+
+    cached = runtime.search_cache.get(cognito_user_id)
+    if cached is not None and cached[0][0] == signature:
+        return cached[0][1], len(delta_keys)
+
+    index = json.loads(fetched[1].decode('utf-8')) if fetched else search_index.new_index()
+    for delta in _read_search_deltas(runtime, cognito_user_id, delta_keys):
+        search_index.apply_delta(index, delta)
+    runtime.search_cache.put(cognito_user_id, (signature, index))
+    return index, len(delta_keys)
+
+
+def _merge_search_index(runtime: StorageRuntime, cognito_user_id: str) -> int:
+    """
+    Fold outstanding deltas into search_index.json, then delete them
+
+    Returns:
+        Number of deltas merged
+    """
+    keys = _list_keys(runtime, _search_delta_prefix(cognito_user_id))
+    if not keys:
+        return 0
+    deltas = _read_search_deltas(runtime, cognito_user_id, keys)
+
+    def mutate(index):
+        changed = False
+        for delta in deltas:
+            changed = search_index.apply_delta(index, delta) or changed
+        return changed
+
+    _update_json_object(runtime, _search_index_key(cognito_user_id), mutate, default=search_index.new_index)
+    _delete_keys(runtime, keys)
+    return len(keys)
+
+
+def _rebuild_search_index(runtime: StorageRuntime, cognito_user_id: str) -> int:
+    """
+    Index every conversation in the user's history from its stored objects
+
+    Each conversation is read raw (header plus segments, without turns still
+    in the write-behind queue) and covers its segments up to
+    segments_through, so deltas written while the rebuild runs are applied
+    on top without being counted twice. Deltas listed before the rebuild
+    started are contained in it and are deleted.
+
+    Returns:
+        Number of conversations indexed
+    """
+    delta_keys = _list_keys(runtime, _search_delta_prefix(cognito_user_id))
+    rebuilt = search_index.new_index()
+    for entry in _all_history_entries(runtime, cognito_user_id):
+        conversation_id = entry.get("conversation_id")
+        header_future = runtime.executor.submit(_read_header, runtime, cognito_user_id, conversation_id)
+        segments = _read_segments(runtime, cognito_user_id, conversation_id)
+        conversation = stitch_conversation(header_future.result(), segments)
+        if conversation is None:
+            continue
+        search_index.apply_delta(rebuilt, search_index.build_delta(
+            conversation_id,
+            ["", conversation.get("segments_through", "")],
+            conversation.get("messages", []),
+            title=entry.get("title", ""),
+            last_updated=entry.get("last_updated") or conversation.get("last_updated"),
+            replace=True
+        ))
+    rebuilt["complete"] = True
+
+    def mutate(index):
+        index.clear()
+        index.update(rebuilt)
+        return True
+
+    _update_json_object(runtime, _search_index_key(cognito_user_id), mutate, default=search_index.new_index)
+    _delete_keys(runtime, delta_keys)
+    return len(rebuilt["docs"])
+
+
+def _schedule_search_maintenance(runtime: StorageRuntime, cognito_user_id: str, rebuild: bool) -> None:
+    """Queue a background rebuild or delta merge unless one is already pending for this user"""
+    with runtime._lock:
+        if cognito_user_id in runtime._pending_search_jobs:
+            return
+        runtime._pending_search_jobs.add(cognito_user_id)
+
+    def run():
+        try:
+            with storage_metrics.measure("background_search_index"):
+                if rebuild:
+                    _rebuild_search_index(runtime, cognito_user_id)
+                else:
+                    _merge_search_index(runtime, cognito_user_id)
+        except Exception:
+            logger.exception("Search index maintenance failed for user %s", cognito_user_id)
+        finally:
+            with runtime._lock:
+                runtime._pending_search_jobs.discard(cognito_user_id)
+
+    runtime.background.submit(run)
+
+
+@instrument()
+def search_conversations(cognito_user_id: str, query: str, limit: int = 10) -> tuple:
+    """
+    Full-text search over all of a user's conversations
+    
+    Costs one LIST and one (usually cached) GET regardless of how many
+    conversations the user has. The first search of a user whose older
+    conversations were never indexed starts indexing them in the background;
+    until it finishes, only messages written since are found.
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        query: Free-text query
+        limit: Maximum number of results (default: 10)
+    
+    Returns:
+        (results, complete): {"conversation_id", "title", "last_updated",
+        "score"} dicts, best match first, and whether every conversation is
+        indexed yet
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return [], False
+    
+    try:
+        index, outstanding = _current_search_index(runtime, cognito_user_id)
+        if not index.get("complete"):
+            _schedule_search_maintenance(runtime, cognito_user_id, rebuild=True)
+        elif outstanding >= SEARCH_MERGE_THRESHOLD:
+            _schedule_search_maintenance(runtime, cognito_user_id, rebuild=False)
+        return search_index.search(index, query, limit), bool(index.get("complete"))
+    except Exception as e:
+        _report_error(f"Error searching conversations: {str(e)}")
+        return [], False
+
+
+@instrument()
+def rebuild_search_index(cognito_user_id: str) -> bool:
+    """
+    Rebuild a user's search index from their stored conversations now
+    
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+    
+    Returns:
+        True if successful, False otherwise
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return False
+    
+    try:
+        _rebuild_search_index(runtime, cognito_user_id)
+        return True
+    except Exception as e:
+        _report_error(f"Error rebuilding search index: {str(e)}")
+        return False
+
+
+# ============================================
+# Conversation Archive
+# ============================================
+
+def _list_conversation_objects(runtime: StorageRuntime, cognito_user_id: str) -> Dict[str, Dict[str, str]]:
+    """All stored conversation objects of a user as {conversation_id: {key: etag}}, from one listing"""
+    prefix = build_s3_path("users", cognito_user_id, "conversations") + "/"
+    with runtime.track_request() as backend:
+        listed = list(backend.iter_objects(prefix))
+    objects = {}
+    for info in listed:
+        name = info.key[len(prefix):]
+        conversation_id = name.split("/", 1)[0] if "/" in name else name[:-len(".json")]
+        objects.setdefault(conversation_id, {})[info.key] = info.etag
+    return objects
+
+
+def _write_bundle(
+    runtime: StorageRuntime,
+    cognito_user_id: str,
+    batch: List[tuple],
+    listed: Dict[str, Dict[str, str]]
+) -> int:
+    """
+    Store (conversation_id, record, segments_through) tuples as one bundle,
+    index them, and delete the conversations' own objects
+
+    A conversation's objects are only deleted if a fresh listing shows them
+    unchanged since they were listed for archiving. A conversation written
+    meanwhile keeps them; its record then only acts as its header, and a
+    later run archives it again.
+
+    Returns:
+        Number of conversations archived
+    """
+    bundle_id = new_segment_id()
+    archived_at = datetime.utcnow().isoformat() + "Z"
+    entries = {}
+    offset = 0
+    for conversation_id, record, segments_through in batch:
+        entries[conversation_id] = {
+            "bundle": bundle_id,
+            "offset": offset,
+            "length": len(record),
+            "format": runtime.storage_format,
+            "segments_through": segments_through,
+            "archived_at": archived_at
+        }
+        offset += len(record)
+    body = b"".join(record for _, record, _ in batch)
+    with runtime.track_request() as backend:
+        backend.put(
+            _archive_bundle_key(cognito_user_id, bundle_id), body,
+            {"ContentType": "application/octet-stream"}, if_none_match="*"
+        )
+    storage_metrics.record_bytes(written=len(body))
+
+    def mutate(index):
+        index["conversations"].update(entries)
+        return True
+
+    _update_json_object(runtime, _archive_index_key(cognito_user_id), mutate, default=conversation_archive.new_index)
+
+    current = _list_conversation_objects(runtime, cognito_user_id)
+    stale = []
+    for conversation_id in entries:
+        if current.get(conversation_id) == listed.get(conversation_id):
+            stale.extend(current[conversation_id])
+        else:
+            logger.info("Conversation %s changed while being archived; keeping its objects", conversation_id)
+    _delete_keys(runtime, sorted(stale))
+    return len(entries)
+
+
+def _discard_orphan_bundles(runtime: StorageRuntime, cognito_user_id: str) -> None:
+    """Delete bundles the archive index no longer references"""
+    index = _read_json(runtime, _archive_index_key(cognito_user_id)) or conversation_archive.new_index()
+    referenced = {entry["bundle"] for entry in index["conversations"].values()}
+    prefix = build_s3_path("users", cognito_user_id, conversation_archive.ARCHIVE_DIRECTORY) + "/"
+    # A bundle written moments ago may not be indexed yet by the run writing it
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=conversation_archive.ORPHAN_GRACE_SECONDS)
+    with runtime.track_request() as backend:
+        listed = list(backend.iter_objects(prefix))
+    orphans = [
+        info.key for info in listed
+        if info.key.endswith(conversation_archive.BUNDLE_SUFFIX)
+        and info.key[len(prefix):-len(conversation_archive.BUNDLE_SUFFIX)] not in referenced
+        and info.last_modified is not None and info.last_modified < cutoff
+    ]
+    if orphans:
+        _delete_keys(runtime, orphans)
+
+
+def _archive_conversations(runtime: StorageRuntime, cognito_user_id: str, older_than_days: float) -> int:
+    """
+    Pack a user's conversations idle for older_than_days into archive bundles
+
+    Idle conversations (by their history entry) that still have objects of
+    their own are stitched and written as records, in bundles of about
+    conversation_archive.BUNDLE_TARGET_BYTES. Conversations with turns in the
+    write-behind queue are skipped.
+
+    Returns:
+        Number of conversations archived
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat() + "Z"
+    idle = {
+        entry.get("conversation_id") for entry in _all_history_entries(runtime, cognito_user_id)
+        if (entry.get("last_updated") or entry.get("created_at") or "") < cutoff
     }
-    message["metadata"]["message_index"] = len(conversation["messages"])
+    if runtime.write_queue is not None:
+        idle.difference_update(conversation_id for conversation_id, _, _ in runtime.write_queue.pending_turns(cognito_user_id))
+    listed = _list_conversation_objects(runtime, cognito_user_id)
+
+    archived = 0
+    batch = []
+    size = 0
+    for conversation_id in sorted(idle.intersection(listed)):
+        header_future = runtime.executor.submit(_read_header, runtime, cognito_user_id, conversation_id)
+        segments = _read_segments(runtime, cognito_user_id, conversation_id)
+        conversation = stitch_conversation(header_future.result(), segments)
+        if conversation is None:
+            continue
+        record = conversation_archive.encode_record(conversation, runtime.storage_format, runtime.gzip_level)
+        batch.append((conversation_id, record, conversation.get("segments_through", "")))
+        size += len(record)
+        if size >= conversation_archive.BUNDLE_TARGET_BYTES:
+            archived += _write_bundle(runtime, cognito_user_id, batch, listed)
+            batch, size = [], 0
+    if batch:
+        archived += _write_bundle(runtime, cognito_user_id, batch, listed)
+    _discard_orphan_bundles(runtime, cognito_user_id)
+    return archived
+
+
+def _schedule_archival(runtime: StorageRuntime, cognito_user_id: str) -> None:
+    """With storage_archive_after_days set, archive the user's idle conversations in the background"""
+    days = runtime.config["archive_after_days"]
+    if days <= 0:
+        return
+    now = time.monotonic()
+    with runtime._lock:
+        checked = runtime._archive_checked.get(cognito_user_id)
+        if checked is not None and now - checked < ARCHIVE_CHECK_INTERVAL_SECONDS:
+            return
+        runtime._archive_checked[cognito_user_id] = now
+
+    def run():
+        try:
+            with storage_metrics.measure("background_archive"):
+                _archive_conversations(runtime, cognito_user_id, days)
+        except Exception:
+            logger.exception("Archiving failed for user %s", cognito_user_id)
+
+    runtime.background.submit(run)
+
+
+@instrument()
+def archive_conversations(cognito_user_id: str, older_than_days: Optional[float] = None) -> Optional[int]:
+    """
+    Archive a user's conversations that have been idle for a number of days
     
-    # Append message
-    conversation["messages"].append(message)
+    Args:
+        cognito_user_id: Cognito user ID (sub claim)
+        older_than_days: Idle time in days (default: storage_archive_after_days,
+            or conversation_archive.DEFAULT_ARCHIVE_AFTER_DAYS if that is not set)
     
-    # Update last_updated
-    conversation["last_updated"] = datetime.utcnow().isoformat() + "Z"
+    Returns:
+        Number of conversations archived, or None on error
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return None
     
-    # Save conversation
-    success = save_conversation(cognito_user_id, conversation_id, conversation)
+    if older_than_days is None:
+        older_than_days = runtime.config["archive_after_days"] or conversation_archive.DEFAULT_ARCHIVE_AFTER_DAYS
+    try:
+        return _archive_conversations(runtime, cognito_user_id, older_than_days)
+    except Exception as e:
+        _report_error(f"Error archiving conversations: {str(e)}")
+        return None
+
+
+def list_user_ids() -> List[str]:
+    """
+    Cognito user IDs of every user with a conversation history
     
-    # Update conversation history metadata
-    if success:
-        update_conversation_metadata(cognito_user_id, conversation_id, len(conversation["messages"]))
+    Lists every object under users/, so it is meant for offline tools.
+    """
+    runtime = get_storage_runtime()
+    if not runtime:
+        return []
     
-    return success
+    user_ids = []
+    with runtime.track_request() as backend:
+        for info in backend.iter_objects("users/"):
+            parts = info.key.split("/")
+            if len(parts) == 3 and parts[2] == "conversations.json":
+                user_ids.append(parts[1])
+    return user_ids
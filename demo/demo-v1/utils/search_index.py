@@ -0,0 +1,237 @@
+"""
+Conversation Search Index for ArchPal
+
+A per-user inverted index over the text of a student's conversations, ranked
+with BM25. This module only builds, updates and queries the index as plain
+JSON-compatible dicts; s3_storage stores it and keeps it current.
+
+Index layout:
+    {"version": 1,
+     "complete": bool,   # every stored conversation has been indexed
+     "docs": {conversation_id: {"title": str, "last_updated": str,
+                                "length": int, "sources": [[lo, hi], ...]}},
+     "postings": {term: {conversation_id: term frequency}}}
+
+Each conversation is one document. Messages are added as deltas, one per
+written segment, carrying the segment's term frequencies. "sources" records
+which segment IDs a document already contains, as inclusive ranges: a delta
+for segment S is applied once and ignored if S falls in any range. A rebuild
+from the stored conversation covers everything up to the conversation's last
+segment ("", segments_through), so deltas that race with a rebuild are not
+counted twice.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+INDEX_VERSION = 1
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Score added per query term that appears in a conversation's title
+TITLE_BOOST = 1.5
+
+# Vocabulary terms a trailing partial query word expands to
+MAX_PREFIX_EXPANSIONS = 20
+
+MAX_TERM_LENGTH = 40
+
+_TOKEN_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can
+could did do does for from had has have he her him his how i if in into is
+it its just me more my no not of on or our out she so some than that the
+their them then there these they this to too us was we were what when where
+which who why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, without stopwords, single characters and runaway strings"""
+    return [
+        token for token in _TOKEN_RE.findall((text or "").lower())
+        if 1 < len(token) <= MAX_TERM_LENGTH and token not in STOPWORDS
+    ]
+
+
+def new_index() -> Dict:
+    return {"version": INDEX_VERSION, "complete": False, "docs": {}, "postings": {}}
+
+
+def build_delta(
+    conversation_id: str,
+    source: Optional[List[str]] = None,
+    messages: Iterable[Dict] = (),
+    title: Optional[str] = None,
+    last_updated: Optional[str] = None,
+    replace: bool = False
+) -> Dict:
+    """
+    Describe a change to one conversation's document
+
+    Args:
+        conversation_id: Conversation the change applies to
+        source: [lo, hi] segment ID range the messages came from; None for a
+            change without messages (e.g. a rename)
+        messages: Stored message records to add
+        title: Conversation title; replaces the indexed title only for
+            deltas without messages or with replace, since turns pass the
+            title they were started with
+        last_updated: Timestamp of the change (default: last message's)
+        replace: Drop what the document contains before applying the delta
+
+    Returns:
+        Delta dict for apply_delta
+    """
+    messages = list(messages)
+    terms = Counter()
+    for message in messages:
+        terms.update(tokenize(message.get("content")))
+    if last_updated is None and messages:
+        last_updated = messages[-1].get("timestamp")
+    delta = {
+        "conversation_id": conversation_id,
+        "terms": dict(terms),
+        "length": sum(terms.values()),
+        "last_updated": last_updated or ""
+    }
+    if source is not None:
+        delta["source"] = list(source)
+    if title is not None:
+        delta["title"] = title
+    if replace:
+        delta["replace"] = True
+    return delta
+
+
+def _covered(doc: Dict, segment_id: str) -> bool:
+    return any(lo <= segment_id <= hi for lo, hi in doc["sources"])
+
+
+def remove_document(index: Dict, conversation_id: str) -> None:
+    """Drop a conversation and its postings from the index"""
+    if index["docs"].pop(conversation_id, None) is None:
+        return
+    for term in list(index["postings"]):
+        postings = index["postings"][term]
+        if postings.pop(conversation_id, None) is not None and not postings:
+            del index["postings"][term]
+
+
+def apply_delta(index: Dict, delta: Dict) -> bool:
+    """
+    Apply a delta to the index in place
+
+    Returns:
+        False if the delta was already applied (nothing changed)
+    """
+    conversation_id = delta["conversation_id"]
+    source = delta.get("source")
+    doc = index["docs"].get(conversation_id)
+
+    if delta.get("replace"):
+        remove_document(index, conversation_id)
+        doc = None
+    elif doc is not None and source is not None and _covered(doc, source[1]):
+        return False
+
+    if doc is None:
+        doc = index["docs"][conversation_id] = {
+            "title": delta.get("title", ""),
+            "last_updated": "",
+            "length": 0,
+            "sources": []
+        }
+    elif "title" in delta and (source is None or not doc["title"]):
+        doc["title"] = delta["title"]
+
+    if source is not None:
+        doc["sources"].append(list(source))
+        doc["length"] += delta["length"]
+        for term, count in delta["terms"].items():
+            postings = index["postings"].setdefault(term, {})
+            postings[conversation_id] = postings.get(conversation_id, 0) + count
+    doc["last_updated"] = max(doc["last_updated"], delta.get("last_updated") or "")
+    return True
+
+
+def _expand_prefix(index: Dict, prefix: str) -> List[str]:
+    """Vocabulary terms starting with prefix, most widespread first"""
+    matches = [term for term in index["postings"] if term.startswith(prefix)]
+    matches.sort(key=lambda term: len(index["postings"][term]), reverse=True)
+    return matches[:MAX_PREFIX_EXPANSIONS]
+
+
+def search(index: Dict, query: str, limit: int = 10) -> List[Dict]:
+    """
+    Rank conversations against a free-text query with BM25
+
+    The last query word is also matched as a prefix, so results appear
+    while a word is still being typed. Conversations whose title contains a
+    query word get a bonus.
+
+    Args:
+        index: Search index
+        query: Free-text query
+        limit: Maximum number of results
+
+    Returns:
+        List of {"conversation_id", "title", "last_updated", "score"} dicts,
+        best match first (ties broken by most recently updated)
+    """
+    words = tokenize(query)
+    docs = index["docs"]
+    if not words or not docs:
+        return []
+
+    # Each query word is a group of alternative terms (more than one only for
+    # a prefix); a conversation scores the best alternative of each group
+    groups = [[word] for word in dict.fromkeys(words)]
+    last = groups[-1]
+    if len(last[0]) >= 3:
+        last.extend(term for term in _expand_prefix(index, last[0]) if term != last[0])
+
+    total_docs = len(docs)
+    average_length = (sum(doc["length"] for doc in docs.values()) / total_docs) or 1.0
+    scores = {}
+    for group in groups:
+        best = {}
+        for term in group:
+            postings = index["postings"].get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for conversation_id, frequency in postings.items():
+                length = docs[conversation_id]["length"]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                score = idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                if score > best.get(conversation_id, 0.0):
+                    best[conversation_id] = score
+        for conversation_id, score in best.items():
+            scores[conversation_id] = scores.get(conversation_id, 0.0) + score
+
+    for conversation_id, doc in docs.items():
+        title_terms = set(tokenize(doc["title"]))
+        for group in groups:
+            if title_terms.intersection(group):
+                scores[conversation_id] = scores.get(conversation_id, 0.0) + TITLE_BOOST
+
+    ranked = sorted(
+        scores.items(),
+        key=lambda item: (item[1], docs[item[0]]["last_updated"]),
+        reverse=True
+    )
+    return [
+        {
+            "conversation_id": conversation_id,
+            "title": docs[conversation_id]["title"],
+            "last_updated": docs[conversation_id]["last_updated"],
+            "score": round(score, 4)
+        }
+        for conversation_id, score in ranked[:limit]
+    ]
@@ -0,0 +1,483 @@
+"""
+Storage Backends for ArchPal
+
+s3_storage keeps all of its logic (caching, segments, conditional index
+updates, write-behind) on top of a small object-store interface, so the same
+code can run against:
+
+- S3Backend: AWS S3 (production)
+- LocalFileBackend: a directory on the local filesystem (single-node deployments)
+- SQLiteBackend: a single SQLite database file (single-node deployments)
+- MemoryBackend: an in-process dict (benchmarks and load tests)
+
+Every backend stores opaque bytes under string keys and supports what the
+upper layer relies on: ETags, conditional GETs (If-None-Match), conditional
+PUTs (If-Match / If-None-Match: *), ranged GETs and prefix listing in key
+order.
+
+This module has no Streamlit dependency; select a backend with
+create_backend() and a config dict.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+BACKENDS = ("s3", "local", "sqlite", "memory")
+
+
+class NotModified(Exception):
+    """A conditional GET matched the current ETag"""
+
+
+class PreconditionFailed(Exception):
+    """A conditional PUT's If-Match / If-None-Match did not hold"""
+
+
+@dataclass
+class StoredObject:
+    body: bytes
+    etag: str
+    metadata: Dict = field(default_factory=dict)
+
+
+@dataclass
+class ObjectInfo:
+    key: str
+    etag: str
+    size: int
+    last_modified: datetime
+
+
+def _content_etag(body: bytes) -> str:
+    return '"%s"' % hashlib.md5(body).hexdigest()
+
+
+def _stat_etag(stat: os.stat_result) -> str:
+    """ETag of a file from its metadata (inode, size, modification time), like a web server's"""
+    return '"%x-%x-%x"' % (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class StorageBackend:
+    """Interface implemented by every backend"""
+
+    name = "base"
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> Optional[StoredObject]:
+        """
+        Fetch an object
+
+        Returns:
+            The object, or None if it does not exist
+
+        Raises:
+            NotModified: if_none_match equals the current ETag
+        """
+        raise NotImplementedError
+
+    def get_range(self, key: str, start: int, length: int) -> Optional[bytes]:
+        """
+        Fetch length bytes of an object, starting at byte offset start
+
+        Returns:
+            The bytes (fewer if the object ends first), or None if the object
+            does not exist
+        """
+        stored = self.get(key)
+        return None if stored is None else stored.body[start:start + length]
+
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        put_args: Optional[Dict] = None,
+        if_match: Optional[str] = None,
+        if_none_match: Optional[str] = None
+    ) -> str:
+        """
+        Store an object
+
+        Args:
+            put_args: S3-style ContentType / ContentEncoding / Metadata
+            if_match: Only write if the current ETag equals this
+            if_none_match: "*" to only write if the key does not exist
+
+        Returns:
+            The new ETag
+
+        Raises:
+            PreconditionFailed: A condition did not hold
+        """
+        raise NotImplementedError
+
+    def delete(self, keys: List[str]) -> None:
+        """Delete objects; missing keys are ignored"""
+        raise NotImplementedError
+
+    def iter_objects(self, prefix: str) -> Iterator[ObjectInfo]:
+        """Yield objects under a prefix in lexicographic key order"""
+        raise NotImplementedError
+
+    def list_keys(self, prefix: str) -> List[str]:
+        return [info.key for info in self.iter_objects(prefix)]
+
+    def _check_preconditions(self, current_etag: Optional[str], if_match: Optional[str], if_none_match: Optional[str]) -> None:
+        if if_none_match == "*" and current_etag is not None:
+            raise PreconditionFailed("Object already exists")
+        if if_match is not None and current_etag != if_match:
+            raise PreconditionFailed("ETag does not match")
+
+
+# ============================================
+# S3
+# ============================================
+
+class S3Backend(StorageBackend):
+    """AWS S3 bucket, via one shared (thread-safe) boto3 client"""
+
+    name = "s3"
+
+    def __init__(self, config: Dict):
+        self.bucket_name = config["bucket_name"]
+        # If access keys are not provided, boto3 will use IAM role (for EC2/ECS/Lambda)
+        self.client = boto3.client(
+            's3',
+            region_name=config["region"],
+            aws_access_key_id=config.get("access_key_id") or None,
+            aws_secret_access_key=config.get("secret_access_key") or None,
+            config=Config(
+                max_pool_connections=config["max_pool_connections"],
+                connect_timeout=config["connect_timeout"],
+                read_timeout=config["read_timeout"],
+                tcp_keepalive=config["tcp_keepalive"],
+                # Callers with their own retry layer pass sdk_max_attempts=1
+                retries={"mode": "standard", "total_max_attempts": config.get("sdk_max_attempts", 3)}
+            )
+        )
+
+    def get(self, key, if_none_match=None):
+        request = {"Bucket": self.bucket_name, "Key": key}
+        if if_none_match:
+            request["IfNoneMatch"] = if_none_match
+        try:
+            response = self.client.get_object(**request)
+            body = response['Body'].read()
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+            code = e.response.get('Error', {}).get('Code', '')
+            if if_none_match and (status == 304 or code in ('304', 'NotModified')):
+                raise NotModified(key) from e
+            if code == 'NoSuchKey':
+                return None
+            raise
+        return StoredObject(body=body, etag=response.get('ETag'), metadata=response.get('Metadata') or {})
+
+    def get_range(self, key, start, length):
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket_name, Key=key, Range=f"bytes={start}-{start + length - 1}"
+            )
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code', '') == 'NoSuchKey':
+                return None
+            raise
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        request = {"Bucket": self.bucket_name, "Key": key, "Body": body, **(put_args or {})}
+        if if_match:
+            request["IfMatch"] = if_match
+        if if_none_match:
+            request["IfNoneMatch"] = if_none_match
+        try:
+            response = self.client.put_object(**request)
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+            code = e.response.get('Error', {}).get('Code', '')
+            if status in (409, 412) or code in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise PreconditionFailed(key) from e
+            raise
+        return response.get('ETag')
+
+    def delete(self, keys):
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            self.client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+
+    def iter_objects(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield ObjectInfo(
+                    key=obj["Key"],
+                    etag=obj.get("ETag"),
+                    size=obj.get("Size", 0),
+                    last_modified=obj.get("LastModified")
+                )
+
+
+# ============================================
+# Local Filesystem
+# ============================================
+
+class LocalFileBackend(StorageBackend):
+    """
+    Objects stored as files under a root directory, one file per key.
+
+    ETags come from file metadata (see _stat_etag), so listing a prefix
+    never reads file contents. Writes are atomic (temp file + rename) and
+    conditional writes are serialized with a lock file, so several app
+    processes on one machine can share the directory.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(self.root, ".lock")
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *key.split("/")))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _current_etag(self, key: str) -> Optional[str]:
+        try:
+            return _stat_etag(os.stat(self._path(key)))
+        except FileNotFoundError:
+            return None
+
+    def get(self, key, if_none_match=None):
+        try:
+            with open(self._path(key), "rb") as f:
+                # fstat describes the open file even if it is replaced meanwhile
+                etag = _stat_etag(os.fstat(f.fileno()))
+                if if_none_match and if_none_match == etag:
+                    raise NotModified(key)
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        return StoredObject(body=body, etag=etag)
+
+    def get_range(self, key, start, length):
+        try:
+            with open(self._path(key), "rb") as f:
+                f.seek(start)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock, open(self._lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if if_match is not None or if_none_match is not None:
+                    self._check_preconditions(self._current_etag(key), if_match, if_none_match)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(body)
+                    f.flush()
+                    # The rename keeps inode, size and mtime, so this is the stored ETag
+                    etag = _stat_etag(os.fstat(f.fileno()))
+                os.replace(tmp_path, path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return etag
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def iter_objects(self, prefix):
+        # Walk only the deepest directory the prefix fully names
+        base_dir = os.path.join(self.root, *prefix.split("/")[:-1])
+        found = []
+        for dirpath, _, filenames in os.walk(base_dir):
+            for filename in filenames:
+                if filename.startswith(".tmp-") or filename == ".lock":
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    found.append((key, path))
+        for key, path in sorted(found):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            yield ObjectInfo(
+                key=key,
+                etag=_stat_etag(stat),
+                size=stat.st_size,
+                last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            )
+
+
+# ============================================
+# SQLite
+# ============================================
+
+class SQLiteBackend(StorageBackend):
+    """Objects stored as rows of a single SQLite database (WAL mode)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS objects ("
+            " key TEXT PRIMARY KEY,"
+            " body BLOB NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " metadata TEXT NOT NULL DEFAULT '{}',"
+            " last_modified REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key, if_none_match=None):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, metadata FROM objects WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        body, etag, metadata = row
+        if if_none_match and if_none_match == etag:
+            raise NotModified(key)
+        return StoredObject(body=bytes(body), etag=etag, metadata=json.loads(metadata))
+
+    def get_range(self, key, start, length):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT substr(body, ?, ?) FROM objects WHERE key = ?", (start + 1, length, key)
+            ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        etag = _content_etag(body)
+        metadata = json.dumps((put_args or {}).get("Metadata") or {})
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if if_match is not None or if_none_match is not None:
+                    row = self._conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+                    self._check_preconditions(row[0] if row else None, if_match, if_none_match)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO objects (key, body, etag, metadata, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(body), etag, metadata, time.time())
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return etag
+
+    def delete(self, keys):
+        with self._lock:
+            self._conn.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in keys])
+
+    def iter_objects(self, prefix):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, etag, length(body), last_modified FROM objects"
+                " WHERE key >= ? AND key < ? ORDER BY key",
+                (prefix, prefix + "\U0010ffff")
+            ).fetchall()
+        for key, etag, size, modified in rows:
+            yield ObjectInfo(key=key, etag=etag, size=size,
+                             last_modified=datetime.fromtimestamp(modified, tz=timezone.utc))
+
+
+# ============================================
+# In-Memory
+# ============================================
+
+class MemoryBackend(StorageBackend):
+    """Process-local dict of objects, for benchmarks and load tests"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, if_none_match=None):
+        with self._lock:
+            stored = self._objects.get(key)
+        if stored is None:
+            return None
+        obj, _ = stored
+        if if_none_match and if_none_match == obj.etag:
+            raise NotModified(key)
+        return obj
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None):
+        obj = StoredObject(body=bytes(body), etag=_content_etag(body), metadata=dict((put_args or {}).get("Metadata") or {}))
+        with self._lock:
+            current = self._objects.get(key)
+            self._check_preconditions(current[0].etag if current else None, if_match, if_none_match)
+            self._objects[key] = (obj, datetime.now(timezone.utc))
+        return obj.etag
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._objects.pop(key, None)
+
+    def iter_objects(self, prefix):
+        with self._lock:
+            items = sorted((k, v) for k, v in self._objects.items() if k.startswith(prefix))
+        for key, (obj, modified) in items:
+            yield ObjectInfo(key=key, etag=obj.etag, size=len(obj.body), last_modified=modified)
+
+
+def create_backend(config: Dict) -> StorageBackend:
+    """
+    Build the backend selected by config["backend"]
+
+    Args:
+        config: Storage configuration (see s3_storage.build_storage_config)
+    """
+    backend = config.get("backend", "s3")
+    if backend == "s3":
+        return S3Backend(config)
+    if backend == "local":
+        return LocalFileBackend(config["local_path"])
+    if backend == "sqlite":
+        return SQLiteBackend(config["sqlite_path"])
+    if backend == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown storage backend '{backend}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,104 @@
+"""
+Wire Format for ArchPal Storage Objects
+
+Every JSON object ArchPal stores (user info, conversation history index,
+conversation headers and segments) is encoded with one of these formats:
+
+- Format 1 (legacy): pretty-printed UTF-8 JSON (indent=2), uncompressed.
+  Objects written before format versions existed carry no format metadata
+  and are read as format 1.
+- Format 2 (compact): minified UTF-8 JSON, gzip-compressed and stored with
+  Content-Encoding: gzip.
+
+The version is recorded in the object's user metadata
+(x-amz-meta-archpal-format) so readers pick the right decoder and new
+formats can be introduced without rewriting old objects. As a safeguard the
+decoder also recognizes gzip data by its magic bytes, in case an object was
+copied without its metadata.
+
+This module has no Streamlit or AWS dependencies so offline tools and
+benchmarks can use it directly.
+"""
+
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple
+
+FORMAT_METADATA_KEY = "archpal-format"
+
+LEGACY_FORMAT = 1
+COMPACT_FORMAT = 2
+SUPPORTED_FORMATS = (LEGACY_FORMAT, COMPACT_FORMAT)
+DEFAULT_FORMAT = COMPACT_FORMAT
+
+DEFAULT_GZIP_LEVEL = 6
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def dump_json(data: Any, format_version: int = DEFAULT_FORMAT) -> bytes:
+    """Serialize data as UTF-8 JSON the way the given format lays it out"""
+    if format_version == LEGACY_FORMAT:
+        return json.dumps(data, indent=2).encode('utf-8')
+    if format_version == COMPACT_FORMAT:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode('utf-8')
+    raise ValueError(f"Unsupported storage format: {format_version}")
+
+
+def encode_body(raw: bytes, format_version: int = DEFAULT_FORMAT, gzip_level: int = DEFAULT_GZIP_LEVEL) -> Tuple[bytes, Dict]:
+    """
+    Encode serialized JSON (from dump_json) for storage
+
+    Args:
+        raw: UTF-8 JSON bytes
+        format_version: Format to write (1 or 2)
+        gzip_level: Compression level for format 2 (1-9)
+
+    Returns:
+        (body, put_args): the object body and the extra put_object arguments
+        (ContentType, ContentEncoding, Metadata) describing it
+    """
+    put_args = {
+        "ContentType": 'application/json',
+        "Metadata": {FORMAT_METADATA_KEY: str(format_version)}
+    }
+    if format_version == LEGACY_FORMAT:
+        return raw, put_args
+    if format_version == COMPACT_FORMAT:
+        put_args["ContentEncoding"] = 'gzip'
+        # mtime=0 keeps the output deterministic for identical data
+        return gzip.compress(raw, compresslevel=gzip_level, mtime=0), put_args
+    raise ValueError(f"Unsupported storage format: {format_version}")
+
+
+def encode_json(data: Any, format_version: int = DEFAULT_FORMAT, gzip_level: int = DEFAULT_GZIP_LEVEL) -> Tuple[bytes, Dict]:
+    """Serialize and encode data for storage; see encode_body for the return value"""
+    return encode_body(dump_json(data, format_version), format_version, gzip_level)
+
+
+def decode_body(body: bytes, metadata: Optional[Dict] = None) -> bytes:
+    """
+    Turn a stored object body back into UTF-8 JSON bytes
+
+    Args:
+        body: Raw object body as returned by S3
+        metadata: Object user metadata (response["Metadata"]), if available
+
+    Returns:
+        UTF-8 encoded JSON
+    """
+    format_version = int((metadata or {}).get(FORMAT_METADATA_KEY, LEGACY_FORMAT))
+    if format_version not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported storage format: {format_version}")
+
+    # Format 2 bodies are sent with Content-Encoding: gzip and may already
+    # have been inflated by the HTTP stack, so go by the magic bytes; JSON
+    # text never starts with them
+    if body[:2] == _GZIP_MAGIC:
+        return gzip.decompress(body)
+    return body
+
+
+def decode_json(body: bytes, metadata: Optional[Dict] = None) -> Any:
+    """Decode a stored object body into Python data"""
+    return json.loads(decode_body(body, metadata).decode('utf-8'))
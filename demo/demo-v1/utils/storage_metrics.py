@@ -0,0 +1,471 @@
+"""
+Operation Metrics for ArchPal
+
+Every public s3_storage operation (get/save user info, history reads and
+updates, conversation reads, saves and appends) is wrapped with
+@instrument, which records per operation:
+
+- calls and errors (raised exceptions, plus errors s3_storage reports and
+  swallows)
+- a latency histogram
+- bytes read from and written to the storage backend (cache hits read 0)
+
+Model calls are measured the same way under component "bedrock" (see
+llm_metrics, which also records their token usage and reply parsing in
+this registry and adds its own series to the exposition), so a turn's
+storage time can be compared with its model time.
+
+Metrics are kept twice: process-wide (REGISTRY, exported in Prometheus text
+format) and per Streamlit script rerun (start_rerun() returns a RerunMetrics
+the admin debug panel reads). Operations nested inside another instrumented
+operation are counted for themselves, but only the outermost one adds to a
+rerun's total time, so totals are not double counted.
+
+Exposition (secrets.toml, see start_exporter):
+- metrics_textfile: Rewrite this file every metrics_interval_seconds
+  (default 15), e.g. for the node_exporter textfile collector
+- metrics_port: Serve GET /metrics on this port
+- metrics_host: Address the metrics port listens on (default 127.0.0.1,
+  i.e. only local scrapers; "0.0.0.0" for all interfaces). The endpoint has
+  no authentication.
+
+This module has no Streamlit dependency.
+"""
+
+import contextvars
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_EXPORT_INTERVAL = 15
+DEFAULT_EXPORT_HOST = "127.0.0.1"
+METRIC_PREFIX = "archpal"
+
+# Innermost instrumented operation of the current call chain, as
+# (component, operation), and the current rerun's metrics
+_current_operation = contextvars.ContextVar("archpal_operation", default=None)
+_current_rerun = contextvars.ContextVar("archpal_rerun", default=None)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class OperationMetrics:
+    """Counters for one (component, operation)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.latency = Histogram()
+        # Named counters added with record_counts (e.g. llm_metrics' token kinds)
+        self.counts: Dict[str, int] = {}
+
+    def snapshot(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "seconds": self.latency.sum,
+            "p50_seconds": self.latency.quantile(0.5),
+            "p95_seconds": self.latency.quantile(0.95),
+            "p99_seconds": self.latency.quantile(0.99),
+            **self.counts
+        }
+
+
+# Extra exposition sections: callables taking the registry's sorted
+# ((component, operation), OperationMetrics) pairs and returning lines
+_SECTIONS: List[Callable[[List[tuple]], List[str]]] = []
+
+
+def add_prometheus_section(render: Callable[[List[tuple]], List[str]]) -> None:
+    """Add series derived from the registry's counters to the exposition"""
+    _SECTIONS.append(render)
+
+
+class MetricsRegistry:
+    """Thread-safe set of OperationMetrics keyed by (component, operation)"""
+
+    def __init__(self):
+        self._operations: Dict[tuple, OperationMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple) -> OperationMetrics:
+        metrics = self._operations.get(key)
+        if metrics is None:
+            metrics = self._operations.setdefault(key, OperationMetrics())
+        return metrics
+
+    def observe(self, key: tuple, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            metrics = self._get(key)
+            metrics.calls += 1
+            metrics.latency.observe(seconds)
+            if error:
+                metrics.errors += 1
+
+    def add_error(self, key: tuple) -> None:
+        with self._lock:
+            self._get(key).errors += 1
+
+    def add_bytes(self, key: tuple, read: int = 0, written: int = 0) -> None:
+        with self._lock:
+            metrics = self._get(key)
+            metrics.bytes_read += read
+            metrics.bytes_written += written
+
+    def add_counts(self, key: tuple, counts: Dict[str, int]) -> None:
+        with self._lock:
+            totals = self._get(key).counts
+            for name, count in counts.items():
+                totals[name] = totals.get(name, 0) + count
+
+    def snapshot(self) -> Dict[tuple, Dict]:
+        with self._lock:
+            return {key: metrics.snapshot() for key, metrics in sorted(self._operations.items())}
+
+    def render_prometheus(self) -> str:
+        """All operations in Prometheus text exposition format"""
+        with self._lock:
+            operations = sorted(self._operations.items())
+            lines = [
+                f"# HELP {METRIC_PREFIX}_operation_duration_seconds Latency of instrumented operations",
+                f"# TYPE {METRIC_PREFIX}_operation_duration_seconds histogram"
+            ]
+            for (component, operation), metrics in operations:
+                labels = f'component="{component}",operation="{operation}"'
+                cumulative = 0
+                for bound, count in zip(metrics.latency.buckets, metrics.latency.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_PREFIX}_operation_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_PREFIX}_operation_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.latency.count}')
+                lines.append(f"{METRIC_PREFIX}_operation_duration_seconds_sum{{{labels}}} {metrics.latency.sum:.6f}")
+                lines.append(f"{METRIC_PREFIX}_operation_duration_seconds_count{{{labels}}} {metrics.latency.count}")
+            for name, help_text, value in (
+                ("operation_calls_total", "Calls of instrumented operations", lambda m: m.calls),
+                ("operation_errors_total", "Failed calls of instrumented operations", lambda m: m.errors)
+            ):
+                lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+                lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+                for (component, operation), metrics in operations:
+                    lines.append(
+                        f'{METRIC_PREFIX}_{name}{{component="{component}",operation="{operation}"}} {value(metrics)}'
+                    )
+            lines.append(f"# HELP {METRIC_PREFIX}_storage_bytes_total Bytes transferred to and from storage")
+            lines.append(f"# TYPE {METRIC_PREFIX}_storage_bytes_total counter")
+            for (component, operation), metrics in operations:
+                for direction, value in (("read", metrics.bytes_read), ("written", metrics.bytes_written)):
+                    if value:
+                        lines.append(
+                            f'{METRIC_PREFIX}_storage_bytes_total{{operation="{operation}",direction="{direction}"}} {value}'
+                        )
+            for section in _SECTIONS:
+                lines.extend(section(operations))
+        return "\n".join(lines) + "\n"
+
+
+class RerunMetrics:
+    """What one script rerun spent, per operation"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.operations: Dict[tuple, Dict] = {}
+        # Outermost operations only, so nested calls are not counted twice
+        self.component_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, key: tuple) -> Dict:
+        return self.operations.setdefault(
+            key, {"calls": 0, "errors": 0, "seconds": 0.0, "bytes_read": 0, "bytes_written": 0}
+        )
+
+    def observe(self, key: tuple, seconds: float, error: bool, outermost: bool) -> None:
+        with self._lock:
+            entry = self._entry(key)
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            if error:
+                entry["errors"] += 1
+            if outermost:
+                self.component_seconds[key[0]] = self.component_seconds.get(key[0], 0.0) + seconds
+
+    def add(self, key: tuple, field: str, amount: int = 1) -> None:
+        with self._lock:
+            entry = self._entry(key)
+            entry[field] = entry.get(field, 0) + amount
+
+    def rows(self) -> List[Dict]:
+        """One dict per operation, for display"""
+        with self._lock:
+            return [
+                dict(component=component, operation=operation, **values)
+                for (component, operation), values in sorted(self.operations.items())
+            ]
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+
+REGISTRY = MetricsRegistry()
+
+# Bytes moved outside any instrumented operation (e.g. background compaction)
+BACKGROUND_OPERATION = ("storage", "background")
+
+
+def start_rerun() -> RerunMetrics:
+    """Start collecting metrics for the current script rerun"""
+    rerun = RerunMetrics()
+    _current_rerun.set(rerun)
+    return rerun
+
+
+@contextmanager
+def measure(operation: str, component: str = "storage"):
+    """Time a block as one call of operation; exceptions count as errors"""
+    key = (component, operation)
+    outermost = _current_operation.get() is None
+    token = _current_operation.set(key)
+    rerun = _current_rerun.get()
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _current_operation.reset(token)
+        REGISTRY.observe(key, elapsed, error)
+        if rerun is not None:
+            rerun.observe(key, elapsed, error, outermost)
+
+
+def observe(operation: str, seconds: float, component: str = "storage") -> None:
+    """
+    Record a latency measured elsewhere (e.g. time to first token) as one
+    call of operation; it does not add to the rerun's component time
+    """
+    key = (component, operation)
+    REGISTRY.observe(key, seconds)
+    rerun = _current_rerun.get()
+    if rerun is not None:
+        rerun.observe(key, seconds, False, outermost=False)
+
+
+def instrument(operation: Optional[str] = None, component: str = "storage") -> Callable:
+    """Decorator recording each call of a function with measure()"""
+    def decorator(fn):
+        name = operation or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with measure(name, component):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_error() -> None:
+    """Count an error that the current operation handles without raising"""
+    key = _current_operation.get() or BACKGROUND_OPERATION
+    REGISTRY.add_error(key)
+    rerun = _current_rerun.get()
+    if rerun is not None:
+        rerun.add(key, "errors")
+
+
+def record_counts(counts: Dict[str, int], component: str = "storage") -> None:
+    """
+    Add named counters to the current operation (outside one, to
+    (component, "background"))
+    """
+    key = _current_operation.get() or (component, "background")
+    REGISTRY.add_counts(key, counts)
+    rerun = _current_rerun.get()
+    if rerun is not None:
+        for name, count in counts.items():
+            rerun.add(key, name, count)
+
+
+def record_bytes(read: int = 0, written: int = 0) -> None:
+    """Attribute bytes transferred to/from storage to the current operation"""
+    key = _current_operation.get() or BACKGROUND_OPERATION
+    REGISTRY.add_bytes(key, read, written)
+    rerun = _current_rerun.get()
+    if rerun is not None:
+        if read:
+            rerun.add(key, "bytes_read", read)
+        if written:
+            rerun.add(key, "bytes_written", written)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs tasks in the submitter's context, so
+    work fanned out by an operation is still attributed to it"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ============================================
+# Exposition
+# ============================================
+
+def _gauge_lines(stats: Dict, prefix: str) -> List[str]:
+    """Flatten numeric values of a nested stats dict into gauge samples"""
+    lines = []
+    for name, value in sorted(stats.items()):
+        metric = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{name}")
+        if isinstance(value, dict):
+            lines.extend(_gauge_lines(value, metric))
+        elif isinstance(value, bool):
+            lines.append(f"{metric} {int(value)}")
+        elif isinstance(value, (int, float)):
+            lines.append(f"{metric} {value}")
+    return lines
+
+
+def render_prometheus(
+    extra_stats: Optional[Callable[[], Dict]] = None,
+    llm_stats: Optional[Callable[[], Dict]] = None
+) -> str:
+    """
+    Prometheus text for the registry plus, optionally, stats dicts flattened
+    into gauges: extra_stats (e.g. s3_storage.get_storage_stats) as
+    archpal_storage_*, and llm_stats (e.g. the model admission queue) as
+    archpal_llm_*
+    """
+    text = REGISTRY.render_prometheus()
+    for namespace, stats in (("storage", extra_stats), ("llm", llm_stats)):
+        if stats is None:
+            continue
+        try:
+            text += "\n".join(_gauge_lines(stats() or {}, f"{METRIC_PREFIX}_{namespace}")) + "\n"
+        except Exception:
+            logger.exception("Could not collect %s stats for metrics", namespace)
+    return text
+
+
+def write_textfile(
+    path: str,
+    extra_stats: Optional[Callable[[], Dict]] = None,
+    llm_stats: Optional[Callable[[], Dict]] = None
+) -> None:
+    """Atomically write the metrics to path"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(render_prometheus(extra_stats, llm_stats))
+    os.replace(tmp_path, path)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter(
+    textfile: Optional[str] = None,
+    port: Optional[int] = None,
+    interval: float = DEFAULT_EXPORT_INTERVAL,
+    extra_stats: Optional[Callable[[], Dict]] = None,
+    host: str = DEFAULT_EXPORT_HOST,
+    llm_stats: Optional[Callable[[], Dict]] = None
+) -> None:
+    """
+    Start exporting metrics (once per process; later calls do nothing)
+
+    Args:
+        textfile: Rewrite this file every interval seconds
+        port: Serve GET /metrics on this port (unauthenticated)
+        extra_stats: Callable returning a storage stats dict to include as gauges
+        host: Address the port is bound to; only local clients by default
+        llm_stats: Callable returning a model stats dict to include as gauges
+    """
+    global _exporter_started
+    if not textfile and not port:
+        return
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    if textfile:
+        def write_loop():
+            while True:
+                try:
+                    write_textfile(textfile, extra_stats, llm_stats)
+                except Exception:
+                    logger.exception("Could not write metrics to %s", textfile)
+                time.sleep(interval)
+        threading.Thread(target=write_loop, name="archpal-metrics-file", daemon=True).start()
+
+    if port:
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = render_prometheus(extra_stats, llm_stats).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics: " + format, *args)
+
+        try:
+            server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+        except OSError as e:
+            logger.error("Could not serve metrics on %s:%s: %s", host, port, e)
+            return
+        threading.Thread(target=server.serve_forever, name="archpal-metrics-http", daemon=True).start()
+        logger.info("Serving metrics on %s:%s/metrics", host, port)
@@ -0,0 +1,409 @@
+"""
+Storage Resilience for ArchPal
+
+ResilientBackend wraps any StorageBackend (see storage_backends.py) so that
+a slow or failing object store degrades a rerun instead of stalling it:
+
+- Deadlines: every operation has an overall time budget (get, put, list,
+  delete), covering all of its attempts. A call that runs past it raises
+  DeadlineExceeded; the abandoned request finishes in the background.
+- Adaptive retries: transient errors (throttling, 5xx, timeouts, connection
+  errors, a locked SQLite database) are retried with full-jitter
+  exponential backoff. Every retry spends tokens from a shared retry budget
+  that successful calls refill, so retries back off on their own while the
+  store is struggling instead of multiplying the load. Conditional PUTs are
+  not retried after a timeout, because the first attempt may have landed.
+- Hedged reads: a GET that has not answered after the recent GET latency
+  percentile (e.g. p95) is sent a second time, and whichever copy answers
+  first wins. This cuts the tail caused by one slow request for the price
+  of a few percent more GETs.
+- Circuit breaker: after a run of consecutive failures, calls fail fast with
+  CircuitOpen until a cool-down has passed; then a single probe decides
+  whether to close it again. s3_storage serves cached (possibly stale) data
+  while the breaker is open.
+
+All of it is reported in stats() (see s3_storage.get_storage_stats).
+
+This module has no Streamlit dependency.
+"""
+
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from utils.storage_backends import NotModified, ObjectInfo, PreconditionFailed, StorageBackend, StoredObject
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINES = {"get": 10.0, "put": 15.0, "list": 30.0, "delete": 30.0}
+DEFAULT_RETRY_MAX_ATTEMPTS = 4
+DEFAULT_RETRY_BASE_DELAY = 0.05
+DEFAULT_RETRY_MAX_DELAY = 2.0
+DEFAULT_RETRY_BUDGET = 100
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_MIN_DELAY = 0.05
+DEFAULT_CIRCUIT_FAILURE_THRESHOLD = 5
+DEFAULT_CIRCUIT_RESET_SECONDS = 30.0
+
+# Retry budget accounting (the same scheme as the AWS SDKs' retry quota)
+RETRY_COST = 5
+TIMEOUT_RETRY_COST = 10
+SUCCESS_REFILL = 1
+
+# GET latencies remembered for the hedging threshold, and how many are
+# needed before hedging starts
+LATENCY_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+
+RETRYABLE_ERROR_CODES = {
+    "SlowDown", "Throttling", "ThrottlingException", "RequestTimeout", "RequestTimeTooSkewed",
+    "InternalError", "ServiceUnavailable", "503", "500"
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """An operation did not finish within its deadline"""
+
+
+class CircuitOpen(Exception):
+    """The circuit breaker is open; the store is not being called"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an error is transient, i.e. the same request may succeed later"""
+    if isinstance(exc, (NotModified, PreconditionFailed, CircuitOpen)):
+        return False
+    if isinstance(exc, DeadlineExceeded):
+        return True
+    if isinstance(exc, ClientError):
+        response = getattr(exc, "response", None) or {}
+        code = response.get("Error", {}).get("Code", "")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return code in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+    if isinstance(exc, BotoCoreError):
+        # Connection, read and connect timeout errors
+        return True
+    if isinstance(exc, sqlite3.OperationalError):
+        return "locked" in str(exc) or "busy" in str(exc)
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+class LatencyTracker:
+    """Recent latencies of one operation, for percentile thresholds"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """The pct-th percentile, or None until enough samples were seen"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+class RetryBudget:
+    """Token bucket shared by all operations; retries spend, successes refill"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._tokens = capacity
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: int) -> bool:
+        with self._lock:
+            if self._tokens < cost:
+                return False
+            self._tokens -= cost
+            return True
+
+    def refill(self, amount: int = SUCCESS_REFILL) -> None:
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker
+
+    closed -> open after failure_threshold consecutive failures; open ->
+    half_open after reset_seconds, letting one probe through; the probe's
+    outcome closes or re-opens it. A threshold of 0 disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.opened = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """Raise CircuitOpen unless a call may go through"""
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpen("Storage circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            if self.state != "closed":
+                logger.info("Storage circuit breaker closed")
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        if not self.failure_threshold:
+            return
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or (
+                self.state == "closed" and self._failures >= self.failure_threshold
+            ):
+                if self.state == "closed":
+                    logger.warning("Storage circuit breaker opened after %d consecutive failures", self._failures)
+                self.state = "open"
+                self.opened += 1
+                self._opened_at = time.monotonic()
+
+
+class ResilientBackend(StorageBackend):
+    """
+    StorageBackend wrapper adding deadlines, retries, hedged GETs and a
+    circuit breaker around another backend
+
+    Args:
+        backend: The backend doing the actual work
+        config: Storage configuration (see s3_storage.build_storage_config);
+            missing resilience keys take their defaults
+    """
+
+    def __init__(self, backend: StorageBackend, config: Optional[Dict] = None):
+        config = config or {}
+        self.inner = backend
+        self.deadlines = dict(DEFAULT_DEADLINES, **(config.get("deadlines") or {}))
+        self.max_attempts = max(1, config.get("retry_max_attempts", DEFAULT_RETRY_MAX_ATTEMPTS))
+        self.base_delay = config.get("retry_base_delay", DEFAULT_RETRY_BASE_DELAY)
+        self.max_delay = config.get("retry_max_delay", DEFAULT_RETRY_MAX_DELAY)
+        self.retry_budget = RetryBudget(config.get("retry_budget", DEFAULT_RETRY_BUDGET))
+        self.hedge_percentile = config.get("hedge_percentile", DEFAULT_HEDGE_PERCENTILE)
+        self.hedge_min_delay = config.get("hedge_min_delay", DEFAULT_HEDGE_MIN_DELAY)
+        self.breaker = CircuitBreaker(
+            config.get("circuit_failure_threshold", DEFAULT_CIRCUIT_FAILURE_THRESHOLD),
+            config.get("circuit_reset_seconds", DEFAULT_CIRCUIT_RESET_SECONDS)
+        )
+        self.get_latency = LatencyTracker()
+        # Attempts run here so a deadline can abandon them; sized so hedges
+        # and abandoned attempts do not starve new calls
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * config.get("max_pool_connections", 16) + 4,
+            thread_name_prefix="archpal-storage-io"
+        )
+        self._counters = {
+            "calls": 0,
+            "retries": 0,
+            "retry_budget_exhausted": 0,
+            "deadline_exceeded": 0,
+            "hedged_requests": 0,
+            "hedge_wins": 0,
+            "short_circuited": 0,
+            "failures": 0,
+            "stale_served": 0
+        }
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.inner.name
+
+    def __getattr__(self, attribute):
+        # Backend-specific attributes (e.g. S3Backend.client)
+        if attribute == "inner":
+            raise AttributeError(attribute)
+        return getattr(self.inner, attribute)
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    # ---- Operations ----
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> Optional[StoredObject]:
+        return self._call("get", lambda: self.inner.get(key, if_none_match=if_none_match), hedge=True)
+
+    def get_range(self, key: str, start: int, length: int) -> Optional[bytes]:
+        return self._call("get", lambda: self.inner.get_range(key, start, length), hedge=True)
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None) -> str:
+        return self._call(
+            "put",
+            lambda: self.inner.put(key, body, put_args, if_match=if_match, if_none_match=if_none_match),
+            retry_timeouts=not (if_match or if_none_match)
+        )
+
+    def delete(self, keys: List[str]) -> None:
+        return self._call("delete", lambda: self.inner.delete(keys))
+
+    def list_keys(self, prefix: str) -> List[str]:
+        return self._call("list", lambda: self.inner.list_keys(prefix))
+
+    def iter_objects(self, prefix: str) -> Iterator[ObjectInfo]:
+        # Streaming listings (offline exports) get no deadline or retries: a
+        # deadline cannot cover a generator the caller consumes at its own
+        # pace. The outcome still feeds the breaker, so a listing that takes
+        # the half-open probe always settles it.
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            self.count("short_circuited")
+            raise
+        try:
+            yield from self.inner.iter_objects(prefix)
+        except GeneratorExit:
+            # Abandoned by the caller after the store answered
+            self.breaker.record_success()
+            raise
+        except Exception as exc:
+            self._fail("list", exc)
+            raise
+        self.breaker.record_success()
+
+    # ---- Machinery ----
+
+    def _call(self, operation: str, fn: Callable, hedge: bool = False, retry_timeouts: bool = True):
+        """Run fn under the operation's deadline, retrying transient errors"""
+        self.count("calls")
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            self.count("short_circuited")
+            raise
+
+        deadline = time.monotonic() + self.deadlines[operation] if self.deadlines.get(operation) else None
+        for attempt in range(self.max_attempts):
+            try:
+                result = self._attempt(fn, deadline, hedge)
+            except (NotModified, PreconditionFailed):
+                # The store answered; the condition just did not hold
+                self.breaker.record_success()
+                raise
+            except Exception as exc:
+                if isinstance(exc, DeadlineExceeded):
+                    self.count("deadline_exceeded")
+                if not is_retryable(exc) or (isinstance(exc, DeadlineExceeded) and not retry_timeouts):
+                    self._fail(operation, exc)
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+                if attempt == self.max_attempts - 1 or out_of_time:
+                    self._fail(operation, exc)
+                    raise
+                cost = TIMEOUT_RETRY_COST if isinstance(exc, (DeadlineExceeded, TimeoutError)) else RETRY_COST
+                if not self.retry_budget.acquire(cost):
+                    self.count("retry_budget_exhausted")
+                    self._fail(operation, exc)
+                    raise
+                self.count("retries")
+                logger.info("Retrying storage %s after %s (attempt %d)", operation, type(exc).__name__, attempt + 1)
+                time.sleep(delay)
+                continue
+            self.retry_budget.refill()
+            self.breaker.record_success()
+            return result
+
+    def _fail(self, operation: str, exc: BaseException) -> None:
+        self.count("failures")
+        # Only infrastructure trouble counts towards opening the breaker; any
+        # other error still proves the store is answering
+        if is_retryable(exc):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        logger.warning("Storage %s failed: %s", operation, exc)
+
+    def _attempt(self, fn: Callable, deadline: Optional[float], hedge: bool):
+        """One attempt (plus its hedge), bounded by the deadline"""
+        started = time.monotonic()
+        if deadline is None and not hedge:
+            return fn()
+        futures = [self._executor.submit(fn)]
+        hedge_delay = self._hedge_delay() if hedge else None
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=self._remaining(deadline, hedge_delay))
+            if not done and (deadline is None or time.monotonic() < deadline):
+                self.count("hedged_requests")
+                futures.append(self._executor.submit(fn))
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self._remaining(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                raise DeadlineExceeded(f"Storage call exceeded its deadline after {time.monotonic() - started:.2f}s")
+            for future in done:
+                exc = future.exception()
+                if exc is not None and not isinstance(exc, NotModified):
+                    # The other copy may still succeed
+                    error = exc
+                    continue
+                if hedge:
+                    self.get_latency.record(time.monotonic() - started)
+                if len(futures) > 1 and future is futures[1]:
+                    self.count("hedge_wins")
+                return future.result()
+        raise error
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_percentile:
+            return None
+        threshold = self.get_latency.percentile(self.hedge_percentile)
+        return None if threshold is None else max(self.hedge_min_delay, threshold)
+
+    @staticmethod
+    def _remaining(deadline: Optional[float], cap: Optional[float] = None) -> Optional[float]:
+        if deadline is None:
+            return cap
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if cap is None else min(cap, remaining)
+
+    def stats(self) -> Dict:
+        """Retry, deadline, hedging and circuit breaker counters"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update({
+            "retry_budget_tokens": self.retry_budget.tokens,
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "hedge_threshold_seconds": self._hedge_delay(),
+            "hedge_rate": stats["hedged_requests"] / stats["calls"] if stats["calls"] else 0.0
+        })
+        return stats
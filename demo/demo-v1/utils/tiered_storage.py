@@ -0,0 +1,437 @@
+"""
+Hot/Cold Tiered Storage for ArchPal
+
+TieredBackend keeps recently active conversations in a local SQLite file
+(the hot tier) in front of another backend, normally S3 (the cold tier):
+
+- A conversation is one unit: its header (users/{id}/conversations/{cid}.json)
+  plus its segments (users/{id}/conversations/{cid}/segments/). All other
+  keys (info.json, the history index and pages) always go to the cold tier,
+  since they are shared by every session of a user.
+- Writing to a conversation makes it hot: any objects it already has in the
+  cold tier are copied into the hot tier first, then the write is applied
+  locally. Reads and listings of a hot conversation are served locally.
+- Every hot write or delete is recorded in a sync queue in the same SQLite
+  transaction, and a background thread replays the queue to the cold tier
+  in order, so the cold tier trails by about sync_interval seconds. The
+  queue is durable: writes not yet synced when the process stops are synced
+  after the next start.
+- A conversation not accessed for idle_seconds is demoted: once it has
+  nothing left in the queue it is dropped from the hot tier and served from
+  the cold tier again. promote() brings it back (s3_storage does that when
+  a conversation is resumed from the sidebar).
+
+The hot tier belongs to one app process. Other processes (or the offline
+exports) reading the cold tier see a hot conversation's latest turns once
+they are synced.
+
+Stats (hot conversations, queue depth, syncs, promotions, demotions, hot
+and cold reads) are reported by stats().
+"""
+
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from utils.storage_backends import (
+    ObjectInfo,
+    SQLiteBackend,
+    StorageBackend,
+    StoredObject,
+    _content_etag
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOT_TIER_PATH = "data/hot_tier.sqlite3"
+DEFAULT_IDLE_SECONDS = 3600
+DEFAULT_SYNC_INTERVAL = 1.0
+# Queue entries replayed per pass, and how often idle conversations are looked for
+SYNC_BATCH_SIZE = 100
+DEMOTION_CHECK_SECONDS = 60
+# last_access is persisted at most this often per conversation
+ACCESS_PERSIST_SECONDS = 30
+
+_OBJECT_KEY = re.compile(r"^(users/[^/]+/conversations/[^/]+?)(?:\.json|/segments/.+)$")
+_UNIT_PREFIX = re.compile(r"^(users/[^/]+/conversations/[^/]+)/")
+
+
+def conversation_unit(key: str) -> Optional[str]:
+    """users/{id}/conversations/{cid} for a conversation header or segment key, else None"""
+    match = _OBJECT_KEY.match(key)
+    return match.group(1) if match else None
+
+
+class HotTier(SQLiteBackend):
+    """
+    SQLite object store that also records the sync queue and the set of hot
+    conversations, so an object write and its queue entry commit together
+    """
+
+    name = "hot"
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sync_queue ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " key TEXT NOT NULL,"
+            " op TEXT NOT NULL,"
+            " put_args TEXT,"
+            " enqueued_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sync_queue_key ON sync_queue (key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hot_units ("
+            " unit TEXT PRIMARY KEY,"
+            " last_access REAL NOT NULL)"
+        )
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None, enqueue=True):
+        etag = _content_etag(body)
+        metadata = json.dumps((put_args or {}).get("Metadata") or {})
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if if_match is not None or if_none_match is not None:
+                    row = self._conn.execute("SELECT etag FROM objects WHERE key = ?", (key,)).fetchone()
+                    self._check_preconditions(row[0] if row else None, if_match, if_none_match)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO objects (key, body, etag, metadata, last_modified) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(body), etag, metadata, time.time())
+                )
+                if enqueue:
+                    self._conn.execute(
+                        "INSERT INTO sync_queue (key, op, put_args, enqueued_at) VALUES (?, 'put', ?, ?)",
+                        (key, json.dumps(put_args or {}), time.time())
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return etag
+
+    def delete(self, keys, enqueue=True):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("DELETE FROM objects WHERE key = ?", [(key,) for key in keys])
+                if enqueue:
+                    now = time.time()
+                    self._conn.executemany(
+                        "INSERT INTO sync_queue (key, op, enqueued_at) VALUES (?, 'delete', ?)",
+                        [(key, now) for key in keys]
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    # ---- Sync queue ----
+
+    def pending(self, limit: int) -> List[tuple]:
+        """Oldest queue entries as (seq, key, op, put_args)"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, key, op, put_args FROM sync_queue ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def superseded(self, seq: int, key: str) -> bool:
+        """Whether a later queue entry for the same key makes this one moot"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM sync_queue WHERE key = ? AND seq > ? LIMIT 1", (key, seq)
+            ).fetchone() is not None
+
+    def dequeue(self, seq: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sync_queue WHERE seq = ?", (seq,))
+
+    def queue_stats(self) -> tuple:
+        """(depth, enqueued_at of the oldest entry or None)"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM sync_queue").fetchone()
+
+    def has_pending(self, unit: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM sync_queue WHERE key = ? OR (key >= ? AND key < ?) LIMIT 1",
+                (unit + ".json", unit + "/", unit + "/\U0010ffff")
+            ).fetchone() is not None
+
+    # ---- Hot conversations ----
+
+    def load_units(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT unit, last_access FROM hot_units").fetchall())
+
+    def save_unit(self, unit: str, last_access: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hot_units (unit, last_access) VALUES (?, ?)", (unit, last_access)
+            )
+
+    def drop_unit(self, unit: str) -> None:
+        """Remove a conversation and its objects from the hot tier (nothing is queued)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM objects WHERE key = ? OR (key >= ? AND key < ?)",
+                    (unit + ".json", unit + "/", unit + "/\U0010ffff")
+                )
+                self._conn.execute("DELETE FROM hot_units WHERE unit = ?", (unit,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class TieredBackend(StorageBackend):
+    """
+    Local SQLite hot tier for active conversations in front of a cold backend
+
+    Args:
+        cold: Backend every object ends up in (normally S3)
+        hot_path: SQLite file for the hot tier
+        idle_seconds: Demote conversations not accessed for this long
+        sync_interval: Seconds between sync passes while the queue is idle
+    """
+
+    def __init__(
+        self,
+        cold: StorageBackend,
+        hot_path: str = DEFAULT_HOT_TIER_PATH,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS,
+        sync_interval: float = DEFAULT_SYNC_INTERVAL
+    ):
+        self.cold = cold
+        self.hot = HotTier(hot_path)
+        self.name = f"{cold.name}+hot"
+        self.idle_seconds = idle_seconds
+        self.sync_interval = sync_interval
+        # unit -> [last_access, last persisted last_access]
+        self._units = {unit: [at, at] for unit, at in self.hot.load_units().items()}
+        self._unit_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._counters = {
+            "hot_reads": 0,
+            "cold_reads": 0,
+            "promotions": 0,
+            "demotions": 0,
+            "synced": 0,
+            "sync_failures": 0
+        }
+        self._last_demotion_check = time.monotonic()
+        threading.Thread(target=self._sync_loop, name="archpal-hot-tier-sync", daemon=True).start()
+
+    # ---- Bookkeeping ----
+
+    def _count(self, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += amount
+
+    def _unit_lock(self, unit: str) -> threading.Lock:
+        with self._lock:
+            return self._unit_locks.setdefault(unit, threading.Lock())
+
+    def is_hot(self, unit: str) -> bool:
+        with self._lock:
+            return unit in self._units
+
+    def _touch(self, unit: str) -> bool:
+        """Record an access; returns whether the conversation is hot"""
+        now = time.time()
+        with self._lock:
+            times = self._units.get(unit)
+            if times is None:
+                return False
+            times[0] = now
+            persist = now - times[1] >= ACCESS_PERSIST_SECONDS
+            if persist:
+                times[1] = now
+        if persist:
+            self.hot.save_unit(unit, now)
+        return True
+
+    # ---- Tier movement ----
+
+    def promote(self, unit: str) -> bool:
+        """
+        Copy a conversation from the cold tier into the hot tier
+
+        Returns:
+            True if it was promoted now, False if it already was hot
+        """
+        with self._unit_lock(unit):
+            return self._promote_locked(unit)
+
+    def _promote_locked(self, unit: str) -> bool:
+        if self.is_hot(unit):
+            self._touch(unit)
+            return False
+        keys = [unit + ".json"] + [info.key for info in self.cold.iter_objects(unit + "/")]
+        for key in keys:
+            stored = self.cold.get(key)
+            if stored is not None:
+                self.hot.put(key, stored.body, {"Metadata": stored.metadata}, enqueue=False)
+        now = time.time()
+        self.hot.save_unit(unit, now)
+        with self._lock:
+            self._units[unit] = [now, now]
+        self._count("promotions")
+        logger.info("Promoted %s to the hot tier (%d objects)", unit, len(keys))
+        return True
+
+    def _demote_idle(self) -> None:
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            idle = [unit for unit, (last_access, _) in self._units.items() if last_access < cutoff]
+        for unit in idle:
+            with self._unit_lock(unit):
+                with self._lock:
+                    times = self._units.get(unit)
+                if times is None or times[0] >= cutoff:
+                    continue
+                if self.hot.has_pending(unit):
+                    # Demote once the cold tier has all of it
+                    continue
+                self.hot.drop_unit(unit)
+                with self._lock:
+                    self._units.pop(unit, None)
+                    self._unit_locks.pop(unit, None)
+                self._count("demotions")
+                logger.info("Demoted idle %s to the cold tier", unit)
+
+    # ---- Sync ----
+
+    def _sync_loop(self) -> None:
+        while True:
+            try:
+                synced = self._sync_pass()
+                if time.monotonic() - self._last_demotion_check >= DEMOTION_CHECK_SECONDS:
+                    self._last_demotion_check = time.monotonic()
+                    self._demote_idle()
+            except Exception:
+                logger.exception("Hot tier sync pass failed")
+                synced = 0
+            if not synced:
+                with self._wakeup:
+                    self._wakeup.wait(self.sync_interval)
+
+    def _sync_pass(self) -> int:
+        """Replay queued writes to the cold tier; returns how many were replayed"""
+        done = 0
+        for seq, key, op, put_args in self.hot.pending(SYNC_BATCH_SIZE):
+            if self.hot.superseded(seq, key):
+                self.hot.dequeue(seq)
+                continue
+            try:
+                if op == "put":
+                    stored = self.hot.get(key)
+                    if stored is not None:
+                        self.cold.put(key, stored.body, json.loads(put_args or "{}"))
+                else:
+                    self.cold.delete([key])
+            except Exception as e:
+                # Keep the order: retry this entry on the next pass
+                self._count("sync_failures")
+                logger.warning("Could not sync %s to the cold tier: %s", key, e)
+                return done
+            self.hot.dequeue(seq)
+            self._count("synced")
+            done += 1
+        return done
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued write reached the cold tier; True if it did"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.hot.queue_stats()[0]:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            with self._wakeup:
+                self._wakeup.notify_all()
+            time.sleep(0.01)
+        return True
+
+    # ---- StorageBackend ----
+
+    def get(self, key: str, if_none_match: Optional[str] = None) -> Optional[StoredObject]:
+        unit = conversation_unit(key)
+        if unit is not None and self._touch(unit):
+            stored = self.hot.get(key, if_none_match=if_none_match)
+            # Unless it was demoted meanwhile, the hot tier has the whole conversation
+            if stored is not None or self.is_hot(unit):
+                self._count("hot_reads")
+                return stored
+        self._count("cold_reads")
+        return self.cold.get(key, if_none_match=if_none_match)
+
+    def get_range(self, key: str, start: int, length: int) -> Optional[bytes]:
+        if conversation_unit(key) is not None:
+            return super().get_range(key, start, length)
+        self._count("cold_reads")
+        return self.cold.get_range(key, start, length)
+
+    def put(self, key, body, put_args=None, if_match=None, if_none_match=None) -> str:
+        unit = conversation_unit(key)
+        if unit is None:
+            return self.cold.put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+        with self._unit_lock(unit):
+            self._promote_locked(unit)
+            etag = self.hot.put(key, body, put_args, if_match=if_match, if_none_match=if_none_match)
+        with self._wakeup:
+            self._wakeup.notify_all()
+        return etag
+
+    def delete(self, keys: List[str]) -> None:
+        cold_keys = []
+        for key in keys:
+            unit = conversation_unit(key)
+            if unit is not None and self.is_hot(unit):
+                with self._unit_lock(unit):
+                    if self.is_hot(unit):
+                        self.hot.delete([key])
+                        continue
+            cold_keys.append(key)
+        if cold_keys:
+            self.cold.delete(cold_keys)
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def iter_objects(self, prefix: str) -> Iterator[ObjectInfo]:
+        match = _UNIT_PREFIX.match(prefix)
+        if match:
+            # Within one conversation: whichever tier holds it
+            unit = match.group(1)
+            if self._touch(unit):
+                objects = list(self.hot.iter_objects(prefix))
+                if objects or self.is_hot(unit):
+                    return iter(objects)
+            return self.cold.iter_objects(prefix)
+        return self._iter_merged(prefix)
+
+    def _iter_merged(self, prefix: str) -> Iterator[ObjectInfo]:
+        """Listing across conversations: hot conversations come from the hot tier"""
+        hot_objects = list(self.hot.iter_objects(prefix))
+        items = [info for info in self.cold.iter_objects(prefix) if not self._hot_key(info.key)]
+        items.extend(info for info in hot_objects if self._hot_key(info.key))
+        yield from sorted(items, key=lambda info: info.key)
+
+    def _hot_key(self, key: str) -> bool:
+        unit = conversation_unit(key)
+        return unit is not None and self.is_hot(unit)
+
+    def stats(self) -> Dict:
+        depth, oldest = self.hot.queue_stats()
+        with self._lock:
+            stats = dict(self._counters)
+            stats["hot_conversations"] = len(self._units)
+        stats["sync_queue_depth"] = depth
+        stats["sync_lag_seconds"] = time.time() - oldest if oldest else 0.0
+        return stats